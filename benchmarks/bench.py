@@ -0,0 +1,275 @@
+"""
+Benchmarks des chemins critiques du site, sur une extraction INPN synthétique reproductible
+(preprocess/generateurINPN.py) passée par le vrai prétraitement :
+- recherche : get_results_from_db par combinaison de filtres et profondeur de page (caches vidés) ;
+- pagination : page servie depuis un instantané, page suivante par curseur ;
+- graphiques : comptes de base puis chaque clé de /get_chart_data ;
+- fuzzy : construction des vocabulaires et correction de saisies mal orthographiées ;
+- pretraitement : chaque étape de preTraitementData.py (débit en observations par seconde).
+
+Chaque mesure donne p50/p95/p99 (ms) et le pic d'allocation mémoire ; les résultats sont enregistrés
+en JSON et peuvent être comparés à une série précédente (code de sortie 1 en cas de régression).
+
+Utilisation (depuis la racine du dépôt) :
+    python benchmarks/bench.py                                   # moteur local, 50 000 observations
+    python benchmarks/bench.py --backends local mongomock --lignes 5000     # mongomock : lent, petits volumes
+    python benchmarks/bench.py --backends mongo --mongo-uri mongodb://localhost:27017
+    python benchmarks/bench.py --comparer benchmarks/resultats/reference.json
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+RACINE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RACINE / "guide_naturel"))
+sys.path.insert(0, str(RACINE / "preprocess"))
+
+import preTraitementData as pre
+from API_request.chargement import load_collection, read_final_data
+from API_request.fuzzy import build_fuzzy_matchers
+from API_request.moteur_local import LocalSearchEngine
+from API_request.mongo_request import chart_base_counts
+from API_request.recherche import (
+    SEARCH_RESULT_CACHE,
+    TOTAL_COUNT_CACHE,
+    get_results_by_cursor,
+    get_results_from_db,
+    get_results_page_from_snapshot,
+    is_local_engine,
+    search_with_snapshot,
+)
+from API_request.snapshots import SNAPSHOT_MAX_IDS_PER_SEARCH
+from API_request.stats_cache import CHART_BUILDERS
+
+from donnees import fautes_de_frappe, requetes
+from generateurINPN import DEPARTEMENTS, ecrire_extraction, ecrire_statuts
+from mesures import comparer, mesurer, rss_max_mo
+
+BACKENDS = ["local", "mongomock", "mongo"]
+SUITES = ["pretraitement", "recherche", "pagination", "graphiques", "fuzzy"]
+# Profondeurs de page mesurées (ramenées à la dernière page si la recherche en a moins)
+PAGES = [1, 10, 50]
+# Recherches utilisées pour la pagination (les plus volumineuses)
+REQUETES_PAGINATION = ["regne", "prefixe_commune"]
+DOSSIER_RESULTATS = Path(__file__).resolve().parent / "resultats"
+MONGO_BENCH_DB = "LeGuideNaturel_bench"
+
+
+def _silencieux(fonction):
+    # Les étapes et le chargement affichent leur progression : sortie masquée pendant les mesures
+    def appel():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fonction()
+    return appel
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RACINE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "inconnu"
+
+
+# *** DONNÉES ***
+# Le prétraitement lit et écrit ses fichiers relativement au dossier courant (..\data\...) :
+# les benchmarks s'exécutent dans un dossier de travail temporaire
+def preparer_extraction(args) -> dict:
+    vocabulaire = ecrire_extraction(Path(pre.INPN_DIR), args.lignes, fichiers=args.fichiers, graine=args.graine)
+    ecrire_statuts(Path(pre.BDC_STATUTS_CSV), vocabulaire["especes"], graine=args.graine)
+    return vocabulaire
+
+
+def etapes_pretraitement(format: str) -> dict:
+    return {
+        "agg_all_csvs": lambda: pre.agg_all_csvs(pre._chemin_data("all_data", format)),
+        "merge_espece": lambda: pre.merge_espece(pre._chemin_data("merge_espece", format), format=format),
+        "merge_espece_streaming": lambda: pre.merge_espece_streaming(pre._chemin_data("merge_espece", format)),
+        "add_code_statut": lambda: pre.add_code_statut(pre._chemin_data("Final_data", format), format=format),
+        "species_summary": lambda: pre.species_summary(Path("species_summary.json"), format=format),
+    }
+
+
+def ouvrir_backend(nom: str, args, final_path: Path):
+    if nom == "local":
+        return LocalSearchEngine.from_path(final_path)
+    if nom == "mongomock":
+        import mongomock
+
+        db = mongomock.MongoClient()[MONGO_BENCH_DB]
+    else:
+        from pymongo import MongoClient
+
+        db = MongoClient(args.mongo_uri)[args.mongo_db]
+    load_collection(db, "Nature", read_final_data(final_path))
+    return db["Nature"]
+
+
+def _vider_caches(col):
+    def vider():
+        SEARCH_RESULT_CACHE.clear()
+        TOTAL_COUNT_CACHE.clear()
+        if is_local_engine(col):
+            col.clear_caches()
+    return vider
+
+
+# *** SUITES ***
+def suite_pretraitement(args, resultats: dict):
+    for etape, calcul in etapes_pretraitement(args.format).items():
+        mesure = mesurer(_silencieux(calcul), repetitions=args.repetitions_pretraitement, echauffement=0)
+        mesure["observations_par_s"] = round(args.lignes / (mesure["p50_ms"] / 1000))
+        resultats[f"pretraitement/{args.format}/{etape}"] = mesure
+        print(f"pretraitement/{etape} : p50 {mesure['p50_ms']:.1f} ms")
+
+
+def suite_recherche(args, backend: str, col, vocabulaire: dict, resultats: dict):
+    vider = _vider_caches(col)
+    for nom, filtres in requetes(vocabulaire).items():
+        for page in PAGES:
+            recherche = lambda filtres=filtres, page=page: get_results_from_db(filtres, col, page=page,
+                                                                               normalized=not args.regex)
+            resultats[f"recherche/{backend}/{nom}/page_{page}"] = mesurer(recherche, args.repetitions, avant=vider)
+
+    # Même recherche servie par le cache global des résultats
+    filtres = requetes(vocabulaire)["regne"]
+    resultats[f"recherche/{backend}/regne/en_cache"] = mesurer(
+        lambda: get_results_from_db(filtres, col, page=1, normalized=not args.regex), args.repetitions)
+
+
+def suite_pagination(args, backend: str, col, vocabulaire: dict, resultats: dict):
+    vider = _vider_caches(col)
+    for nom in REQUETES_PAGINATION:
+        filtres = requetes(vocabulaire)[nom]
+        premiere, ids = search_with_snapshot(filtres, col, page=1, normalized=not args.regex,
+                                             snapshot_limit=SNAPSHOT_MAX_IDS_PER_SEARCH)
+        total_pages = premiere.get("total_pages", 0)
+        if total_pages < 2:
+            continue
+        page = min(10, total_pages)
+
+        if ids is not None:
+            instantane = {"ids": ids, "total_items": len(ids)}
+            resultats[f"pagination/{backend}/{nom}/instantane_page_{page}"] = mesurer(
+                lambda: get_results_page_from_snapshot(filtres, col, instantane, page=page,
+                                                       normalized=not args.regex),
+                args.repetitions, avant=vider)
+
+        # Curseur vers la page `page`, obtenu en suivant les pages précédentes
+        curseur = premiere["next_cursor"]
+        for _ in range(page - 2):
+            curseur = get_results_by_cursor(filtres, col, cursor=curseur, normalized=not args.regex)["next_cursor"]
+        resultats[f"pagination/{backend}/{nom}/curseur_page_{page}"] = mesurer(
+            lambda: get_results_by_cursor(filtres, col, cursor=curseur, normalized=not args.regex),
+            args.repetitions, avant=vider)
+
+
+def suite_graphiques(args, backend: str, col, resultats: dict):
+    resultats[f"graphiques/{backend}/comptes_de_base"] = mesurer(lambda: chart_base_counts(col), args.repetitions)
+    base_counts = chart_base_counts(col)
+    for cle, construction in CHART_BUILDERS.items():
+        resultats[f"graphiques/{backend}/{cle}"] = mesurer(lambda construction=construction: construction(
+            col, DEPARTEMENTS, base_counts), args.repetitions)
+
+
+def suite_fuzzy(args, backend: str, col, resultats: dict):
+    resultats[f"fuzzy/{backend}/construction"] = mesurer(_silencieux(lambda: build_fuzzy_matchers(col)),
+                                                         max(args.repetitions // 5, 3), echauffement=0)
+    matchers = build_fuzzy_matchers(col)
+    for champ, matcher in matchers.items():
+        # Une saisie différente à chaque appel : les corrections mémorisées ne faussent pas la mesure
+        saisies = itertools.cycle(fautes_de_frappe(matcher.choices, args.repetitions * 4, graine=args.graine))
+        resultats[f"fuzzy/{backend}/{champ}"] = mesurer(lambda matcher=matcher: matcher.extract_one(next(saisies)),
+                                                        args.repetitions * 2, memoire=False)
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(prog="python benchmarks/bench.py", description="Benchmarks du Guide Naturel")
+    parser.add_argument("--lignes", type=int, default=50_000, help="observations synthétiques générées")
+    parser.add_argument("--fichiers", type=int, default=4, help="nombre de csv de l'extraction")
+    parser.add_argument("--graine", type=int, default=42, help="graine du générateur")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["local"])
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES)
+    parser.add_argument("--repetitions", type=int, default=20, help="exécutions mesurées par cas")
+    parser.add_argument("--repetitions-pretraitement", type=int, default=3)
+    parser.add_argument("--format", choices=pre.FORMATS, default="csv", help="format des fichiers intermédiaires")
+    parser.add_argument("--regex", action="store_true", help="filtres $regex au lieu des champs normalisés")
+    parser.add_argument("--mongo-uri", default=os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--mongo-db", default=MONGO_BENCH_DB, help="base remplacée par le jeu synthétique")
+    parser.add_argument("--sortie", type=Path, help="fichier JSON des résultats (par défaut dans benchmarks/resultats)")
+    parser.add_argument("--comparer", type=Path, help="résultats précédents à comparer")
+    parser.add_argument("--seuil", type=float, default=0.2, help="hausse du p95 signalée comme régression")
+    args = parser.parse_args(argv[1:])
+
+    commit = _commit()
+    sortie = (args.sortie or DOSSIER_RESULTATS /
+              f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{commit}.json").resolve()
+    comparaison = args.comparer.resolve() if args.comparer else None
+    resultats = {}
+
+    dossier_initial = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench_guide_naturel_") as travail:
+        run = Path(travail) / "run"
+        run.mkdir()
+        os.chdir(run)
+        try:
+            print(f"Génération de {args.lignes} observations synthétiques...")
+            vocabulaire = preparer_extraction(args)
+
+            if "pretraitement" in args.suites:
+                suite_pretraitement(args, resultats)
+            else:
+                for calcul in etapes_pretraitement(args.format).values():
+                    _silencieux(calcul)()
+
+            final_path = Path(pre._chemin_data("Final_data", args.format)).resolve()
+            for backend in args.backends:
+                print(f"Chargement du backend '{backend}'...")
+                col = _silencieux(lambda: ouvrir_backend(backend, args, final_path))()
+                if "recherche" in args.suites:
+                    suite_recherche(args, backend, col, vocabulaire, resultats)
+                if "pagination" in args.suites:
+                    suite_pagination(args, backend, col, vocabulaire, resultats)
+                if "graphiques" in args.suites:
+                    suite_graphiques(args, backend, col, resultats)
+                if "fuzzy" in args.suites:
+                    suite_fuzzy(args, backend, col, resultats)
+                print(f"Backend '{backend}' mesuré")
+        finally:
+            os.chdir(dossier_initial)
+
+    for nom, mesure in resultats.items():
+        print(f"{nom:<60} p50 {mesure['p50_ms']:>9.2f}  p95 {mesure['p95_ms']:>9.2f}  p99 {mesure['p99_ms']:>9.2f} ms")
+
+    meta = {"date": datetime.now(timezone.utc).isoformat(), "commit": commit, "lignes": args.lignes,
+            "graine": args.graine, "backends": args.backends, "format": args.format, "normalise": not args.regex,
+            "python": platform.python_version(), "plateforme": platform.platform(), "rss_max_mo": rss_max_mo()}
+    sortie.parent.mkdir(parents=True, exist_ok=True)
+    with open(sortie, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "resultats": resultats}, f, ensure_ascii=False, indent=2)
+    print(f"Résultats enregistrés dans {sortie}")
+
+    if comparaison is not None:
+        with open(comparaison, encoding="utf-8") as f:
+            precedents = json.load(f)
+        for parametre in ["lignes", "graine", "format", "normalise"]:
+            if precedents["meta"].get(parametre) != meta[parametre]:
+                print(f"Attention : '{parametre}' diffère de la série précédente, comparaison peu fiable")
+        regressions = comparer(precedents["resultats"], resultats, seuil=args.seuil)
+        if regressions:
+            print(f"{len(regressions)} régression(s) au-delà de +{args.seuil:.0%} sur le p95")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,47 @@
+"""
+Jeu de données des benchmarks : extraction INPN synthétique de preprocess/generateurINPN.py (distributions
+de Zipf des espèces et des communes, fichier bdc_statuts associé), et requêtes construites sur son vocabulaire.
+Reproductible : même graine, mêmes fichiers.
+"""
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+def requetes(vocabulaire: Dict[str, pd.DataFrame]) -> Dict[str, Dict[str, str]]:
+    """
+    Combinaisons de filtres du chatbot mesurées par les benchmarks, construites sur le vocabulaire généré.
+    """
+    especes = vocabulaire["especes"]
+    communes = vocabulaire["communes"].sort_values("poids", ascending=False)["commune"]
+    # Espèce commune avec un nom vernaculaire : beaucoup d'observations
+    nom_vernaculaire = especes.sort_values("frequence", ascending=False)["nomVernaculaire"].dropna().iloc[0]
+    return {
+        "regne": {"regne": "Animalia"},
+        "regne_departement": {"regne": "Plantae", "codeInseeDepartement": "21"},
+        "groupe_statut": {"groupeTaxoSimple": "Oiseaux", "codeStatut": "LC"},
+        # La plus grande commune, puis une commune moyenne
+        "commune": {"commune": communes.iloc[0]},
+        "commune_moyenne": {"commune": communes.iloc[len(communes) // 2]},
+        "prefixe_commune": {"commune": "Saint"},
+        "nom_vernaculaire": {"nomVernaculaire": nom_vernaculaire.split()[0][:4]},
+        "tous_les_filtres": {"regne": "Animalia", "groupeTaxoSimple": "Oiseaux", "codeInseeDepartement": "25",
+                             "codeStatut": "LC"},
+    }
+
+
+def fautes_de_frappe(valeurs: List[str], nombre: int, graine: int = 42) -> List[str]:
+    """
+    Saisies mal orthographiées (une lettre supprimée ou deux lettres inversées) pour mesurer la correction.
+    """
+    rng = np.random.default_rng(graine + 2)
+    saisies = []
+    for valeur in rng.choice(valeurs, size=nombre):
+        valeur = str(valeur)
+        i = int(rng.integers(0, max(len(valeur) - 1, 1)))
+        if rng.random() < 0.5 or len(valeur) < 3:
+            saisies.append(valeur[:i] + valeur[i + 1:])
+        else:
+            saisies.append(valeur[:i] + valeur[i + 1] + valeur[i] + valeur[i + 2:])
+    return saisies
@@ -0,0 +1,107 @@
+"""
+Mesure des durées (percentiles), de la mémoire, et comparaison de deux séries de résultats.
+"""
+import gc
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # module absent sous Windows : pas de mémoire maximale du processus
+    resource = None
+
+
+def percentile(valeurs: List[float], q: float) -> float:
+    """
+    Percentile q (0-100) par interpolation linéaire entre les deux valeurs les plus proches.
+    """
+    valeurs = sorted(valeurs)
+    if not valeurs:
+        return 0.0
+    position = (len(valeurs) - 1) * q / 100
+    bas = int(position)
+    haut = min(bas + 1, len(valeurs) - 1)
+    return valeurs[bas] + (valeurs[haut] - valeurs[bas]) * (position - bas)
+
+
+def mesurer(fonction: Callable, repetitions: int = 20, echauffement: int = 1, avant: Optional[Callable] = None,
+            memoire: bool = True) -> Dict[str, float]:
+    """
+    Exécute `fonction` `repetitions` fois (après `echauffement` appels non mesurés) et retourne les percentiles
+    des durées en millisecondes. `avant` est appelé avant chaque exécution, hors mesure (caches vidés...).
+    memoire=True : une exécution supplémentaire sous tracemalloc donne le pic d'allocation.
+    """
+    for _ in range(echauffement):
+        if avant is not None:
+            avant()
+        fonction()
+
+    durees = []
+    for _ in range(repetitions):
+        if avant is not None:
+            avant()
+        gc.collect()
+        debut = time.perf_counter()
+        fonction()
+        durees.append((time.perf_counter() - debut) * 1000)
+
+    resultat = {
+        "n": repetitions,
+        "p50_ms": round(percentile(durees, 50), 3),
+        "p95_ms": round(percentile(durees, 95), 3),
+        "p99_ms": round(percentile(durees, 99), 3),
+        "moyenne_ms": round(sum(durees) / len(durees), 3),
+        "min_ms": round(min(durees), 3),
+        "max_ms": round(max(durees), 3),
+    }
+
+    if memoire:
+        if avant is not None:
+            avant()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fonction()
+            _, pic = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        resultat["memoire_pic_mo"] = round(pic / 1024 / 1024, 3)
+    return resultat
+
+
+def rss_max_mo() -> Optional[float]:
+    """
+    Mémoire résidente maximale du processus depuis son démarrage (None si indisponible).
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en kilo-octets sous Linux, en octets sous macOS
+    return round(rss / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+def comparer(anciens: Dict[str, Dict], nouveaux: Dict[str, Dict], seuil: float = 0.2,
+             metrique: str = "p95_ms") -> List[str]:
+    """
+    Compare deux séries de résultats (même nom de mesure) et retourne les mesures dont `metrique`
+    a augmenté de plus de `seuil` (0.2 = +20 %). Affiche le tableau de comparaison.
+    """
+    regressions = []
+    print(f"\n{'mesure':<60} {'avant':>10} {'après':>10} {'écart':>8}")
+    for nom in sorted(set(anciens) & set(nouveaux)):
+        avant = anciens[nom].get(metrique)
+        apres = nouveaux[nom].get(metrique)
+        if not avant or apres is None:
+            continue
+        ecart = apres / avant - 1
+        marque = " <- régression" if ecart > seuil else ""
+        print(f"{nom:<60} {avant:>10.2f} {apres:>10.2f} {ecart:>+7.0%}{marque}")
+        if ecart > seuil:
+            regressions.append(nom)
+
+    absentes = set(anciens) - set(nouveaux)
+    if absentes:
+        print(f"{len(absentes)} mesure(s) de la série précédente absente(s) de la nouvelle")
+    return regressions
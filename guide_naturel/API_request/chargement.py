@@ -0,0 +1,227 @@
+"""
+Chargement des données prétraitées dans MongoDB.
+
+Les documents sont insérés par lots dans une collection de chargement, les index y sont créés,
+puis elle remplace la collection cible par un renommage atomique : le site ne voit jamais
+de données partiellement chargées. La version du jeu de données est ensuite mise à jour
+dans "dataset_meta", ce qui invalide les caches de l'application.
+
+Utilisation en ligne de commande (depuis le dossier guide_naturel) :
+    python -m API_request.chargement                      # ../data/Final_data.csv et species_summary.json
+    python -m API_request.chargement --format parquet     # ../data/Final_data.parquet
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List
+
+import pandas as pd
+from pymongo.database import Database
+
+from API_request.colonnes import convert_integer_columns
+from API_request.index_manager import ensure_indexes
+from API_request.mongo_request import DATASET_META_COLLECTION
+
+# Nombre de documents par insert_many
+LOAD_BATCH_SIZE = 5000
+# Suffixe de la collection de chargement
+STAGING_SUFFIX = "__chargement"
+
+DATA_DIR = Path("..") / "data"
+
+
+def _valeur(value):
+    """
+    Convertit une valeur pandas en valeur BSON (types numpy -> types Python).
+    """
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def _documents_from_frame(df: pd.DataFrame) -> Iterator[Dict]:
+    df = convert_integer_columns(df)
+    # Les cellules vides ne sont pas stockées (comme mongoimport --ignoreBlanks)
+    for record in df.to_dict("records"):
+        yield {field: _valeur(value) for field, value in record.items() if not pd.isna(value)}
+
+
+def read_final_data(path: Path, batch_size: int = LOAD_BATCH_SIZE) -> Iterator[Dict]:
+    """
+    Lit Final_data (csv ou parquet) par blocs et retourne ses lignes sous forme de documents.
+    """
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield from _documents_from_frame(batch.to_pandas())
+        return
+
+    for chunk in pd.read_csv(path, dtype=str, chunksize=batch_size):
+        yield from _documents_from_frame(chunk)
+
+
+def read_json_lines(path: Path) -> Iterator[Dict]:
+    """
+    Lit un fichier JSON lines (species_summary.json), un document par ligne.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _batches(documents: Iterable[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    iterator = iter(documents)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def stage_collection(db: Database, name: str, documents: Iterable[Dict], batch_size: int = LOAD_BATCH_SIZE) -> int:
+    """
+    Charge les documents dans la collection de chargement de `name` et crée ses index, sans toucher
+    à la collection `name`. Retourne le nombre de documents. En cas d'échec, la collection de chargement est supprimée.
+    """
+    staging = db[f"{name}{STAGING_SUFFIX}"]
+    # Reste éventuel d'un chargement interrompu
+    staging.drop()
+
+    total = 0
+    try:
+        for batch in _batches(documents, batch_size):
+            staging.insert_many(batch, ordered=False)
+            total += len(batch)
+            print(f"'{name}' : {total} documents chargés")
+
+        if total == 0:
+            raise ValueError(f"Aucun document à charger dans '{name}' : la collection existante est conservée")
+
+        ensure_indexes(staging, name)
+    except Exception:
+        staging.drop()
+        raise
+    return total
+
+
+def promote_collection(db: Database, name: str, total: int):
+    """
+    Remplace atomiquement la collection `name` par sa collection de chargement.
+    """
+    db[f"{name}{STAGING_SUFFIX}"].rename(name, dropTarget=True)
+    print(f"Collection '{name}' remplacée ({total} documents)")
+
+
+def load_collection(db: Database, name: str, documents: Iterable[Dict], batch_size: int = LOAD_BATCH_SIZE) -> int:
+    """
+    Charge les documents dans une collection de chargement, crée ses index, puis la renomme
+    en `name` (la collection existante est remplacée atomiquement). Retourne le nombre de documents.
+    """
+    total = stage_collection(db, name, documents, batch_size)
+    promote_collection(db, name, total)
+    return total
+
+
+def read_dataset_version(data_dir: Path = DATA_DIR) -> str:
+    """
+    Version écrite par le prétraitement (dataset_version.json), ou date du chargement à défaut.
+    """
+    path = data_dir / "dataset_version.json"
+    if path.is_file():
+        with open(path, encoding="utf-8") as f:
+            version = json.load(f).get("version")
+        if version:
+            return str(version)
+    return "load-" + datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+
+
+def bump_dataset_version(db: Database, name: str, version: str, documents: int):
+    """
+    Met à jour la version du jeu de données lue par get_dataset_version (caches des graphiques et des recherches).
+    """
+    db[DATASET_META_COLLECTION].replace_one(
+        {"_id": name},
+        {"_id": name, "version": version, "documents": documents, "loaded_at": datetime.now(timezone.utc)},
+        upsert=True,
+    )
+    print(f"Version du jeu de données '{name}' : {version}")
+
+
+def load_dataset(db: Database, data_dir: Path = DATA_DIR, format: str = "csv", batch_size: int = LOAD_BATCH_SIZE,
+                 with_summary: bool = True) -> str:
+    """
+    Charge "Nature" et "species_summary" (si le fichier existe) dans leurs collections de chargement ;
+    seulement si les deux chargements réussissent, les deux collections sont remplacées puis la version
+    est mise à jour : un échec laisse en place l'ancien jeu de données complet (et sa version).
+    Le résumé reçoit la même version que "Nature" ; s'il n'est pas rechargé, l'ancien est supprimé
+    (l'application ne sert "species_summary" que si sa version est celle de "Nature").
+    """
+    staged = {}
+    try:
+        staged["Nature"] = stage_collection(db, "Nature", read_final_data(data_dir / f"Final_data.{format}",
+                                                                          batch_size), batch_size)
+        summary_path = data_dir / "species_summary.json"
+        if with_summary and summary_path.is_file():
+            staged["species_summary"] = stage_collection(db, "species_summary", read_json_lines(summary_path),
+                                                         batch_size)
+    except Exception:
+        for name in staged:
+            db[f"{name}{STAGING_SUFFIX}"].drop()
+        raise
+
+    # "species_summary" d'abord : "Nature" (et la version) ne changent qu'une fois le résumé en place
+    for name in ["species_summary", "Nature"]:
+        if name in staged:
+            promote_collection(db, name, staged[name])
+
+    version = read_dataset_version(data_dir)
+    if "species_summary" in staged:
+        bump_dataset_version(db, "species_summary", version, staged["species_summary"])
+    else:
+        # Un résumé d'un autre jeu de données donnerait des résultats différents de "Nature"
+        db[DATASET_META_COLLECTION].delete_one({"_id": "species_summary"})
+        db["species_summary"].drop()
+        print("Ancienne collection 'species_summary' supprimée (résumé non rechargé)")
+    bump_dataset_version(db, "Nature", version, staged["Nature"])
+    return version
+
+
+def main(argv: List[str]) -> int:
+    from dotenv import load_dotenv
+    from API_request.mongo_request import get_mongo_collection
+
+    parser = argparse.ArgumentParser(prog="python -m API_request.chargement",
+                                     description="Chargement des données prétraitées dans MongoDB")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR, help="dossier des fichiers prétraités")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="format de Final_data")
+    parser.add_argument("--batch-size", type=int, default=LOAD_BATCH_SIZE, help="documents par insert_many")
+    parser.add_argument("--sans-resume", action="store_true", help="ne pas charger species_summary.json")
+    args = parser.parse_args(argv[1:])
+
+    load_dotenv()
+    user = os.getenv("MONGO_ADMIN_USER", os.getenv("MONGO_APP_USER"))
+    password = os.getenv("MONGO_ADMIN_PASSWORD", os.getenv("MONGO_APP_PASSWORD"))
+    cluster = os.getenv("MONGO_CLUSTER_URL")
+    if not all([user, password, cluster]):
+        print("ERREUR: Des variables d'environnement MongoDB sont manquantes")
+        return 1
+
+    uri = f"mongodb+srv://{user}:{password}@{cluster}/?retryWrites=true&w=majority&appName=Big-Data"
+    db = get_mongo_collection(uri, os.getenv("DB_NAME", "LeGuideNaturel"), "Nature").database
+
+    try:
+        load_dataset(db, args.data_dir, args.format, args.batch_size, with_summary=not args.sans_resume)
+    except (OSError, ValueError) as e:
+        print(f"ERREUR: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,18 @@
+"""
+Types des colonnes de Final_data, partagés par le chargement dans MongoDB (chargement.py)
+et le moteur de recherche en mémoire (moteur_local.py).
+"""
+import pandas as pd
+
+# Colones entières de Final_data (le reste est du texte)
+INTEGER_COLUMNS = ["codeInseeDepartement", "nombreObservations"]
+
+
+def convert_integer_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convertit les colonnes entières de Final_data (lues comme texte dans le csv) en entiers nullables.
+    """
+    for column in INTEGER_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column].astype("object")).astype("Int64")
+    return df
@@ -0,0 +1,139 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from pymongo.collection import Collection
+
+# Durée de vie d'une conversation inactive (secondes)
+CONVERSATION_TTL = 60 * 60
+# Nombre maximal de conversations gardées en mémoire par processus
+CONVERSATION_MAX_ENTRIES = 10000
+# Collection MongoDB du stockage partagé
+CONVERSATIONS_COLLECTION = "conversations"
+
+
+class ConversationStore(ABC):
+    """
+    Interface commune des stockages d'état du chatbot.
+    L'état d'une conversation est un dictionnaire JSON-sérialisable ; après l'avoir modifié,
+    il faut l'enregistrer avec save() pour qu'il soit visible des autres workers.
+    """
+
+    @abstractmethod
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def save(self, conversation_id: str, data: Dict):
+        ...
+
+    @abstractmethod
+    def delete(self, conversation_id: str):
+        ...
+
+    @abstractmethod
+    def __len__(self):
+        ...
+
+
+class MemoryConversationStore(ConversationStore):
+    """
+    Stockage en mémoire du processus, borné (éviction LRU) et à expiration glissante :
+    une conversation expire `ttl` secondes après sa dernière lecture ou écriture.
+    """
+
+    def __init__(self, ttl: float = CONVERSATION_TTL, max_entries: int = CONVERSATION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        # Les conversations les moins récemment utilisées sont en tête
+        while self._conversations:
+            oldest_id = next(iter(self._conversations))
+            _, last_access = self._conversations[oldest_id]
+            if len(self._conversations) <= self.max_entries and now - last_access <= self.ttl:
+                break
+            del self._conversations[oldest_id]
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._conversations.get(conversation_id)
+            if entry is None:
+                return None
+            data, last_access = entry
+            if now - last_access > self.ttl:
+                del self._conversations[conversation_id]
+                return None
+            self._conversations[conversation_id] = (data, now)
+            self._conversations.move_to_end(conversation_id)
+            return data
+
+    def save(self, conversation_id: str, data: Dict):
+        now = time.monotonic()
+        with self._lock:
+            self._conversations[conversation_id] = (data, now)
+            self._conversations.move_to_end(conversation_id)
+            self._evict(now)
+
+    def delete(self, conversation_id: str):
+        with self._lock:
+            self._conversations.pop(conversation_id, None)
+
+    def __len__(self):
+        return len(self._conversations)
+
+
+class MongoConversationStore(ConversationStore):
+    """
+    Stockage partagé entre processus dans une collection MongoDB.
+    Un index TTL sur "updated_at" supprime les conversations inactives ; comme MongoDB ne purge
+    qu'environ une fois par minute, l'expiration est aussi vérifiée à la lecture.
+    Comme pour le stockage en mémoire, l'expiration est glissante : une lecture repousse "updated_at".
+    """
+
+    def __init__(self, col: Collection, ttl: float = CONVERSATION_TTL):
+        self.col = col
+        self.ttl = ttl
+        self.col.create_index("updated_at", name="conversation_ttl", expireAfterSeconds=int(ttl))
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        # Lecture et prolongation en une seule opération, seulement si la conversation n'a pas encore expiré
+        now = datetime.now(timezone.utc)
+        doc = self.col.find_one_and_update({"_id": conversation_id,
+                                            "updated_at": {"$gte": now - timedelta(seconds=self.ttl)}},
+                                           {"$set": {"updated_at": now}},
+                                           projection={"data": True})
+        if doc is None:
+            return None
+        return doc["data"]
+
+    def save(self, conversation_id: str, data: Dict):
+        self.col.replace_one({"_id": conversation_id},
+                             {"_id": conversation_id, "data": data,
+                              "updated_at": datetime.now(timezone.utc)},
+                             upsert=True)
+
+    def delete(self, conversation_id: str):
+        self.col.delete_one({"_id": conversation_id})
+
+    def __len__(self):
+        return self.col.estimated_document_count()
+
+
+def create_conversation_store(backend: str = "memory", db=None, ttl: float = CONVERSATION_TTL) -> ConversationStore:
+    """
+    Crée le stockage des conversations : "memory" (par processus) ou "mongo" (partagé entre workers).
+    """
+    if backend == "mongo":
+        if db is None:
+            raise ValueError("Le stockage 'mongo' des conversations nécessite une base MongoDB")
+        return MongoConversationStore(db[CONVERSATIONS_COLLECTION], ttl=ttl)
+    if backend != "memory":
+        raise ValueError(f"Stockage de conversations inconnu : '{backend}'")
+    return MemoryConversationStore(ttl=ttl)
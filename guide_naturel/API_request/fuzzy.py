@@ -0,0 +1,127 @@
+import bisect
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from thefuzz import fuzz
+
+from API_request.recherche import KNOWN_VALUES_FOR_FUZZY_MATCHING, normalize_text
+
+# Nombre maximal de candidats (présélectionnés par n-grammes) évalués avec WRatio
+MAX_CANDIDATES = 40
+# Nombre de saisies mémorisées par vocabulaire
+MATCH_CACHE_SIZE = 4096
+
+# Type de correspondance appliqué par build_mongo_match_stage pour chaque champ :
+# une saisie qui correspond déjà (préfixe ou sous-chaîne) n'a pas besoin d'être corrigée
+FIELD_MATCH_MODES = {
+    "regne": "exact",
+    "groupeTaxoSimple": "prefix",
+    "codeStatut": "exact",
+    "commune": "prefix",
+    "nomVernaculaire": "contains",
+}
+
+
+def _ngrams(text: str, n: int) -> List[str]:
+    padded = f"  {text} "
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)]
+
+
+class FuzzyMatcher:
+    """
+    Correspondance approximative sur un vocabulaire fixe.
+    Le vocabulaire est normalisé une seule fois et indexé par trigrammes : pour une saisie, seuls les
+    candidats partageant le plus de trigrammes sont évalués avec fuzz.WRatio (même score que
+    process.extractOne). Les résultats des saisies fréquentes sont mémorisés.
+    """
+
+    def __init__(self, choices: Iterable[str], match_mode: str = "exact", ngram: int = 3,
+                 max_candidates: int = MAX_CANDIDATES, cache_size: int = MATCH_CACHE_SIZE):
+        self.choices = list(dict.fromkeys(c for c in choices if c))
+        self.match_mode = match_mode
+        self.ngram = ngram
+        self.max_candidates = max_candidates
+
+        self._normalized = [normalize_text(c) for c in self.choices]
+        self._sorted_normalized = sorted(self._normalized)
+        # Formes en minuscules avec accents : ce que trouvent les $regex insensibles à la casse sans champs normalisés
+        self._lowered = [c.lower() for c in self.choices]
+        self._sorted_lowered = sorted(self._lowered)
+        self._index = defaultdict(list)
+        for position, text in enumerate(self._normalized):
+            for gram in set(_ngrams(text, ngram)):
+                self._index[gram].append(position)
+
+        self._top_k_cached = lru_cache(maxsize=cache_size)(self._top_k)
+        self._already_matches_cached = lru_cache(maxsize=cache_size)(self._already_matches)
+
+    def __len__(self):
+        return len(self.choices)
+
+    def _candidates(self, query: str) -> List[int]:
+        if len(self.choices) <= self.max_candidates:
+            return list(range(len(self.choices)))
+        hits = Counter()
+        for gram in set(_ngrams(query, self.ngram)):
+            hits.update(self._index.get(gram, ()))
+        return [position for position, _ in hits.most_common(self.max_candidates)]
+
+    def _top_k(self, query: str, k: int) -> Tuple[Tuple[str, int], ...]:
+        scored = [(self.choices[p], fuzz.WRatio(query, self._normalized[p])) for p in self._candidates(query)]
+        # Tri stable : à score égal, l'ordre du vocabulaire est conservé (comme extractOne)
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return tuple(scored[:k])
+
+    def top_k(self, query: str, k: int = 5) -> List[Tuple[str, int]]:
+        """
+        Retourne les k meilleures correspondances (valeur d'origine, score 0-100).
+        """
+        normalized = normalize_text(query)
+        if not normalized:
+            return []
+        return list(self._top_k_cached(normalized, k))
+
+    def extract_one(self, query: str) -> Optional[Tuple[str, int]]:
+        """
+        Meilleure correspondance (valeur d'origine, score), ou None si le vocabulaire est vide.
+        """
+        best = self.top_k(query, 1)
+        return best[0] if best else None
+
+    def _already_matches(self, text: str, fold_accents: bool) -> bool:
+        values, sorted_values = ((self._normalized, self._sorted_normalized) if fold_accents
+                                 else (self._lowered, self._sorted_lowered))
+        if self.match_mode == "prefix":
+            position = bisect.bisect_left(sorted_values, text)
+            return position < len(sorted_values) and sorted_values[position].startswith(text)
+        if self.match_mode == "contains":
+            return any(text in value for value in values)
+        return False
+
+    def already_matches(self, query: str, fold_accents: bool = True) -> bool:
+        """
+        Vrai si la saisie trouve déjà des résultats telle quelle (préfixe ou sous-chaîne d'une valeur connue,
+        selon le mode) : la corriger réduirait inutilement la recherche.
+        fold_accents=True seulement si la recherche utilise les champs normalisés (sans accents) ; sinon la
+        comparaison est insensible à la casse mais pas aux accents, comme les $regex de build_mongo_match_stage.
+        """
+        text = normalize_text(query) if fold_accents else str(query).lower()
+        return bool(text) and self._already_matches_cached(text, fold_accents)
+
+
+def build_fuzzy_matchers(col=None) -> Dict[str, FuzzyMatcher]:
+    """
+    Construit les vocabulaires de correction du chatbot : les valeurs connues de recherche.py, complétées
+    par les communes et noms vernaculaires distincts de la collection "Nature" si elle est fournie.
+    """
+    vocabularies = dict(KNOWN_VALUES_FOR_FUZZY_MATCHING)
+    if col is not None:
+        for field in ["commune", "nomVernaculaire"]:
+            try:
+                vocabularies[field] = sorted(v for v in col.distinct(field) if isinstance(v, str))
+            except Exception as e:
+                print(f"Impossible de charger les valeurs distinctes de '{field}' pour la correction: {e}")
+
+    return {field: FuzzyMatcher(values, match_mode=FIELD_MATCH_MODES.get(field, "exact"))
+            for field, values in vocabularies.items()}
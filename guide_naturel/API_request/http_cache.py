@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+
+from flask import Response, jsonify, request
+
+from API_request.result_cache import LRUCache, make_query_key
+
+try:
+    import brotli
+except ImportError:  # Brotli est optionnel : gzip seul si le module n'est pas installé
+    brotli = None
+
+# Taille minimale (octets) d'une réponse à compresser
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/html", "text/css", "application/javascript"}
+
+# Corps compressés des réponses identifiées par un ETag (données des graphiques notamment)
+COMPRESSED_BODIES = LRUCache(max_entries=256, max_bytes=32 * 1024 * 1024)
+
+# Politiques Cache-Control
+CACHE_CONTROL_FRAGMENTS = "public, max-age=3600"
+CACHE_CONTROL_CHARTS = "public, max-age=60"
+# Résultats propres à une conversation : revalidés à chaque fois (réponse 304 si inchangés)
+CACHE_CONTROL_RESULTS = "private, no-cache"
+
+
+def etag_for(*parts) -> str:
+    """
+    ETag fort dérivé d'objets JSON-sérialisables (version du jeu de données, clé du graphique...).
+    """
+    return hashlib.sha256(make_query_key(*parts).encode("utf-8")).hexdigest()[:32]
+
+
+def content_etag(body: bytes) -> str:
+    """
+    ETag fort dérivé du contenu de la réponse.
+    """
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _will_compress(response: Response, encoding) -> bool:
+    return (encoding is not None and not response.direct_passthrough
+            and "Content-Encoding" not in response.headers and response.mimetype in COMPRESSIBLE_MIMETYPES
+            and (response.content_length or 0) >= COMPRESSION_MIN_SIZE)
+
+
+def _representation_etags(etag: str, response: Response = None):
+    # ETag que porterait la réponse 200 pour ce client : "<etag>-gzip" ou "<etag>-br" si compress_response
+    # la compresse. Sans la réponse (304 décidé avant de construire le corps), un même ETag désigne le même
+    # corps, donc le même choix de compression que la réponse 200 gardée par le client : les deux sont possibles.
+    encoding = _choose_encoding()
+    if response is not None:
+        return [f"{etag}-{encoding}" if _will_compress(response, encoding) else etag]
+    return [f"{etag}-{encoding}", etag] if encoding is not None else [etag]
+
+
+def _matching_etag(etag: str, response: Response = None):
+    candidates = _representation_etags(etag, response)
+    if request.if_none_match.star_tag:
+        return candidates[0]
+    held = request.if_none_match.as_set(include_weak=True)
+    return next((candidate for candidate in candidates if candidate in held), None)
+
+
+def _make_not_modified(etag: str, cache_control: str) -> Response:
+    # Un 304 reprend le validateur (ETag de la variante compressée) et le Vary de la réponse 200
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def not_modified(etag: str, cache_control: str, response: Response = None):
+    """
+    Réponse 304 si le client possède déjà la représentation identifiée par `etag` (dans l'encodage
+    qu'il recevrait maintenant), sinon None.
+    """
+    matched = _matching_etag(etag, response)
+    if matched is None:
+        return None
+    return _make_not_modified(matched, cache_control)
+
+
+def conditional_response(response: Response, cache_control: str, etag: str = None, last_modified=None) -> Response:
+    """
+    Ajoute ETag (hash du contenu par défaut), Last-Modified et Cache-Control à une réponse,
+    et la remplace par un 304 si le client possède déjà cette version.
+    """
+    if response.status_code != 200:
+        return response
+    etag = etag or content_etag(response.get_data())
+    cached = not_modified(etag, cache_control, response)
+    if cached is not None:
+        return cached
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Calculé avant make_conditional, qui vide le corps d'un 304
+    representation_etag = _representation_etags(etag, response)[0]
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        # 304 par If-Modified-Since : même ETag que la réponse 200 (compressée ou non)
+        response.set_etag(representation_etag)
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def conditional_json(data, cache_control: str, etag: str = None, last_modified=None) -> Response:
+    return conditional_response(jsonify(data), cache_control, etag=etag, last_modified=last_modified)
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response: Response) -> Response:
+    """
+    Compression gzip (ou brotli si disponible et accepté) des réponses texte au-delà de COMPRESSION_MIN_SIZE.
+    L'ETag de la variante compressée reçoit le suffixe de l'encodage ; pour une réponse avec ETag,
+    le corps compressé est mémorisé pour ne pas recompresser les mêmes données.
+    """
+    if (response.status_code != 200 or response.direct_passthrough
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = _choose_encoding()
+    if not _will_compress(response, encoding):
+        return response
+
+    etag, _ = response.get_etag()
+    cache_key = (etag, encoding) if etag else None
+    compressed = COMPRESSED_BODIES.get(cache_key) if cache_key else None
+    if compressed is None:
+        compressed = _compress(response.get_data(), encoding)
+        if cache_key:
+            COMPRESSED_BODIES.set(cache_key, compressed)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    if etag:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+def init_http_cache(app):
+    """
+    Active la compression des réponses de l'application Flask.
+    """
+    app.after_request(compress_response)
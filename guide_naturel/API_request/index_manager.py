@@ -0,0 +1,205 @@
+"""
+Gestion des index des collections "Nature" et "species_summary".
+
+Utilisation en ligne de commande (depuis le dossier guide_naturel) :
+    python -m API_request.index_manager create    # crée les index manquants
+    python -m API_request.index_manager verify    # liste les index manquants
+    python -m API_request.index_manager explain   # index utilisés par chaque forme de requête
+"""
+import os
+import sys
+from typing import Dict, List
+
+from pymongo.collection import Collection
+
+from API_request.recherche import (build_mongo_match_stage, build_nature_group_pipeline,
+                                   build_species_summary_pipeline, summary_can_serve)
+
+# *** DÉCLARATION DES INDEX ***
+# Chaque index : nom, clés, et éventuellement des options supplémentaires
+NATURE_INDEXES = [
+    # Filtres du chatbot : règne puis groupe taxonomique, éventuellement restreints à un département
+    {"name": "regne_groupe_departement",
+     "keys": [("regne", 1), ("groupeTaxoSimple", 1), ("codeInseeDepartement", 1)]},
+    {"name": "departement_regne_groupe",
+     "keys": [("codeInseeDepartement", 1), ("regne", 1), ("groupeTaxoSimple", 1)]},
+    # Recherche par commune (préfixe) dans un département
+    {"name": "commune_departement",
+     "keys": [("commune", 1), ("codeInseeDepartement", 1)]},
+    {"name": "codeStatut_regne",
+     "keys": [("codeStatut", 1), ("regne", 1)]},
+    # Regroupements par espèce des graphiques et des recherches
+    {"name": "espece_departement",
+     "keys": [("nomScientifiqueRef", 1), ("codeInseeDepartement", 1)]},
+    # Champs "ombre" normalisés (build_normalized_match_stage) : égalités et préfixes ancrés
+    {"name": "regne_groupe_departement_norm",
+     "keys": [("regne_norm", 1), ("groupeTaxoSimple_norm", 1), ("codeInseeDepartement", 1)]},
+    {"name": "departement_commune_norm",
+     "keys": [("codeInseeDepartement", 1), ("commune_norm", 1)]},
+    {"name": "commune_norm",
+     "keys": [("commune_norm", 1)]},
+    {"name": "nomVernaculaire_norm",
+     "keys": [("nomVernaculaire_norm", 1)]},
+]
+
+SPECIES_SUMMARY_INDEXES = [
+    {"name": "nomScientifiqueRef_unique",
+     "keys": [("nomScientifiqueRef", 1)], "options": {"unique": True}},
+    {"name": "regne_groupe",
+     "keys": [("regne", 1), ("groupeTaxoSimple", 1)]},
+    # Champs tableaux : index multiclés
+    {"name": "departements",
+     "keys": [("codeInseeDepartement", 1)]},
+    {"name": "regne_groupe_norm",
+     "keys": [("regne_norm", 1), ("groupeTaxoSimple_norm", 1)]},
+    {"name": "nomVernaculaire_norm",
+     "keys": [("nomVernaculaire_norm", 1)]},
+    # Ordre d'affichage des résultats
+    {"name": "tri_resultats",
+     "keys": [("sort_priority_nomVernaculaire", 1), ("nomVernaculaire", 1), ("nomScientifiqueRef", 1)]},
+]
+
+# Formes de requêtes représentatives du chatbot, utilisées par explain_query_shapes()
+QUERY_SHAPES = {
+    "regne": {"regne": "Animalia"},
+    "regne+groupe": {"regne": "Animalia", "groupeTaxoSimple": "Oiseaux"},
+    "departement": {"codeInseeDepartement": "21"},
+    "departement+commune": {"codeInseeDepartement": "25", "commune": "Besançon"},
+    "nomVernaculaire": {"nomVernaculaire": "mésange"},
+    "codeStatut": {"codeStatut": "EN"},
+}
+
+
+def indexes_for(col: Collection, name: str = None) -> List[Dict]:
+    """
+    Retourne la liste des index déclarés pour une collection (selon son nom, ou `name`
+    pour une collection de chargement destinée à remplacer la collection `name`).
+    """
+    if (name or col.name) == "species_summary":
+        return SPECIES_SUMMARY_INDEXES
+    return NATURE_INDEXES
+
+
+def missing_indexes(col: Collection, name: str = None) -> List[Dict]:
+    """
+    Compare les index existants aux index déclarés et retourne ceux qui manquent
+    (ou dont les clés ne correspondent plus à la déclaration).
+    """
+    existing = col.index_information()
+    missing = []
+    for spec in indexes_for(col, name):
+        info = existing.get(spec["name"])
+        if info is None or [tuple(k) for k in info["key"]] != spec["keys"]:
+            missing.append(spec)
+    return missing
+
+
+def ensure_indexes(col: Collection, name: str = None) -> List[str]:
+    """
+    Crée les index déclarés qui n'existent pas encore. Retourne les noms des index créés.
+    """
+    created = []
+    for spec in missing_indexes(col, name):
+        col.create_index(spec["keys"], name=spec["name"], **spec.get("options", {}))
+        created.append(spec["name"])
+        print(f"Index '{spec['name']}' créé sur '{col.name}'")
+    return created
+
+
+def verify_indexes(col: Collection) -> bool:
+    """
+    Vérifie la présence des index déclarés et affiche ceux qui manquent.
+    """
+    missing = missing_indexes(col)
+    for spec in missing:
+        print(f"Avertissement: index '{spec['name']}' manquant sur '{col.name}' "
+              f"(python -m API_request.index_manager create)")
+    return not missing
+
+
+def _plan_indexes(plan) -> List[str]:
+    """
+    Parcourt un plan d'exécution (winningPlan) et retourne les noms des index utilisés.
+    """
+    names = []
+    if isinstance(plan, dict):
+        if "indexName" in plan:
+            names.append(plan["indexName"])
+        for value in plan.values():
+            names.extend(_plan_indexes(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            names.extend(_plan_indexes(value))
+    return names
+
+
+def explain_pipeline(col: Collection, pipeline: List[Dict]) -> Dict:
+    """
+    Exécute explain sur une pipeline d'agrégation et résume le plan choisi :
+    index utilisés (liste vide = parcours complet de la collection).
+    """
+    explanation = col.database.command("explain", {"aggregate": col.name, "pipeline": pipeline, "cursor": {}},
+                                       verbosity="queryPlanner")
+    indexes = sorted(set(_plan_indexes(explanation)))
+    return {"indexes": indexes, "collscan": not indexes}
+
+
+def explain_query_shapes(col: Collection, summary_col: Collection = None, normalized: bool = False) -> Dict[str, Dict]:
+    """
+    Pour chaque forme de requête du chatbot, indique les index réellement utilisés par la pipeline de recherche.
+    """
+    report = {}
+    for shape, filters in QUERY_SHAPES.items():
+        match_stage_query = build_mongo_match_stage(filters, normalized=normalized)
+        if summary_col is not None and summary_can_serve(match_stage_query):
+            pipeline, _ = build_species_summary_pipeline(match_stage_query)
+            report[shape] = {"collection": summary_col.name, **explain_pipeline(summary_col, pipeline)}
+        else:
+            pipeline, _ = build_nature_group_pipeline(match_stage_query)
+            report[shape] = {"collection": col.name, **explain_pipeline(col, pipeline)}
+    return report
+
+
+# *** LIGNE DE COMMANDE ***
+def main(argv: List[str]) -> int:
+    from dotenv import load_dotenv
+    from API_request.mongo_request import get_mongo_collection
+
+    load_dotenv()
+    command = argv[1] if len(argv) > 1 else "verify"
+
+    user = os.getenv("MONGO_ADMIN_USER", os.getenv("MONGO_APP_USER"))
+    password = os.getenv("MONGO_ADMIN_PASSWORD", os.getenv("MONGO_APP_PASSWORD"))
+    cluster = os.getenv("MONGO_CLUSTER_URL")
+    if not all([user, password, cluster]):
+        print("ERREUR: Des variables d'environnement MongoDB sont manquantes")
+        return 1
+
+    uri = f"mongodb+srv://{user}:{password}@{cluster}/?retryWrites=true&w=majority&appName=Big-Data"
+    col = get_mongo_collection(uri, os.getenv("DB_NAME", "LeGuideNaturel"), "Nature")
+    summary_col = col.database["species_summary"]
+    has_summary = "species_summary" in col.database.list_collection_names()
+
+    collections = [col, summary_col] if has_summary else [col]
+
+    if command == "create":
+        for c in collections:
+            ensure_indexes(c)
+    elif command == "verify":
+        ok = all([verify_indexes(c) for c in collections])
+        print("Tous les index sont présents" if ok else "Des index sont manquants")
+        return 0 if ok else 2
+    elif command == "explain":
+        normalized = col.find_one({"regne_norm": {"$exists": True}}, {"_id": 1}) is not None
+        report = explain_query_shapes(col, summary_col if has_summary else None, normalized=normalized)
+        for shape, result in report.items():
+            used = ", ".join(result["indexes"]) if result["indexes"] else "COLLSCAN"
+            print(f"{shape:<22} {result['collection']:<16} {used}")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,130 @@
+import atexit
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
+
+# Taille maximale d'un lot inséré avec insert_many
+LOG_BATCH_SIZE = 200
+# Délai maximal (secondes) avant l'écriture d'un lot incomplet
+LOG_FLUSH_INTERVAL = 2.0
+# Nombre maximal d'événements en attente ; au-delà ils sont déversés dans le fichier de secours ou perdus
+LOG_MAX_QUEUE = 10000
+
+
+class BatchLogWriter:
+    """
+    Écriture asynchrone des logs BI (completed_searches, question_interactions).
+    Les requêtes HTTP ne font que déposer l'événement dans une file ; un thread d'arrière-plan
+    les insère par lots (insert_many) quand le lot est plein ou que le délai est écoulé.
+    Si la file est pleine ou que MongoDB refuse un lot, les événements sont écrits dans
+    `spill_path` (JSON lines) s'il est défini, sinon abandonnés et comptés dans `dropped`.
+    """
+
+    def __init__(self, db: Database, batch_size: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL,
+                 max_queue: int = LOG_MAX_QUEUE, spill_path: Optional[str] = None):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+
+        self.dropped = 0
+        self.spilled = 0
+        self.written = 0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bi-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, collection_name: str, document: Dict) -> bool:
+        """
+        Dépose un événement dans la file sans attendre. Retourne False s'il n'a pas pu être mis en file.
+        """
+        try:
+            self._queue.put_nowait((collection_name, document))
+            return True
+        except queue.Full:
+            self._spill([(collection_name, document)])
+            return False
+
+    def pending(self) -> int:
+        """
+        Nombre approximatif d'événements en attente d'écriture.
+        """
+        return self._queue.qsize()
+
+    def _count(self, outcome: str, amount: int):
+        # Les compteurs sont modifiés par le thread d'écriture et par les requêtes HTTP (file pleine)
+        with self._spill_lock:
+            setattr(self, outcome, getattr(self, outcome) + amount)
+
+    def _spill(self, events):
+        if not events:
+            return
+        if not self.spill_path:
+            self._count("dropped", len(events))
+            return
+        with self._spill_lock:
+            try:
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for collection_name, document in events:
+                        f.write(json.dumps({"collection": collection_name, "document": document},
+                                           ensure_ascii=False, default=str) + "\n")
+                self.spilled += len(events)
+            except OSError as e:
+                print(f"Erreur lors de l'écriture du fichier de secours des logs: {e}")
+                self.dropped += len(events)
+
+    def _write(self, events):
+        by_collection = defaultdict(list)
+        for collection_name, document in events:
+            by_collection[collection_name].append(document)
+
+        for collection_name, documents in by_collection.items():
+            try:
+                self.db[collection_name].insert_many(documents, ordered=False)
+                self._count("written", len(documents))
+            except BulkWriteError as e:
+                # ordered=False : les documents sans erreur sont déjà insérés, seuls les autres sont déversés
+                failed = sorted({error["index"] for error in e.details.get("writeErrors", [])})
+                print(f"Erreur lors de l'écriture de {len(failed)} logs '{collection_name}': {e}")
+                self._count("written", len(documents) - len(failed))
+                self._spill([(collection_name, documents[index]) for index in failed])
+            except Exception as e:
+                print(f"Erreur lors de l'écriture des logs '{collection_name}': {e}")
+                self._spill([(collection_name, document) for document in documents])
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0.01)))
+            except queue.Empty:
+                pass
+
+            if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+        if batch:
+            self._write(batch)
+
+    def close(self, timeout: float = 10.0):
+        """
+        Arrête le thread après avoir écrit tous les événements en attente.
+        """
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
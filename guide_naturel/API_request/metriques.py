@@ -0,0 +1,308 @@
+"""
+Métriques de l'application au format texte de Prometheus, exposées par la route /metrics.
+
+- Histogrammes des durées : requêtes HTTP par route, étapes des routes (fuzzy, recherche, logs, sérialisation...),
+  fonctions de requête et appels d'agrégation MongoDB ;
+- compteurs et jauges lus au moment de la collecte : caches (LRUCache.stats(), graphiques), regroupement des requêtes
+  (QUERY_FLIGHTS), taille du stockage des conversations et des instantanés, écriture des logs BI.
+
+Les métriques sont propres au processus : avec plusieurs workers, Prometheus collecte chacun d'eux.
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Bornes (secondes) des histogrammes de durée
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """
+    Métrique à étiquettes. `callback` (optionnel) est appelé à chaque collecte et retourne une valeur
+    ou une liste de (étiquettes, valeur) : pour les compteurs tenus ailleurs (caches, logs...).
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Étiquettes attendues pour {self.name} : {self.labelnames}, reçues : {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _callback_samples(self) -> List[Tuple[Dict[str, str], float]]:
+        try:
+            result = self.callback()
+        except Exception as e:
+            print(f"Impossible de collecter la métrique {self.name}: {e}")
+            return []
+        if isinstance(result, (int, float)):
+            return [({}, result)]
+        return list(result)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        if self.callback is not None:
+            return [(self.name, labels, value) for labels, value in self._callback_samples()]
+        with self._lock:
+            return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    Histogramme cumulatif (bornes `buckets`, en secondes pour les durées) avec somme et nombre d'observations.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Mesure la durée du bloc `with` (enregistrée même si le bloc lève une exception).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        samples = []
+        for key, counts, total in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", dict(labels, le=_format_value(float(bound))), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Ensemble des métriques exposées. Enregistrer deux fois le même nom retourne la métrique existante.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                callback: Optional[Callable] = None) -> Counter:
+        return self._register(Counter(name, documentation, labelnames, callback))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+              callback: Optional[Callable] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Registre partagé par l'application
+REGISTRY = MetricsRegistry()
+
+
+# *** DURÉES ***
+HTTP_REQUEST_DURATION = REGISTRY.histogram("guide_naturel_http_request_duration_seconds",
+                                           "Durée des requêtes HTTP par route", ["endpoint", "method"])
+HTTP_REQUESTS = REGISTRY.counter("guide_naturel_http_requests_total", "Requêtes HTTP par route et code de réponse",
+                                 ["endpoint", "method", "status"])
+STAGE_DURATION = REGISTRY.histogram("guide_naturel_stage_duration_seconds",
+                                    "Durée de chaque étape des routes (fuzzy, recherche, logs, sérialisation...)",
+                                    ["route", "stage"])
+QUERY_DURATION = REGISTRY.histogram("guide_naturel_query_duration_seconds",
+                                    "Durée des fonctions de requête (recherche, pagination, graphiques)", ["function"])
+AGGREGATION_DURATION = REGISTRY.histogram("guide_naturel_aggregation_duration_seconds",
+                                          "Durée des appels d'agrégation par type (total et page, page seule...)",
+                                          ["kind"])
+
+
+def track_stage(route: str, stage: str):
+    """
+    Contexte qui mesure une étape d'une route : `with track_stage("handle_message", "fuzzy"): ...`
+    """
+    return STAGE_DURATION.time(route=route, stage=stage)
+
+
+def timed_query(func):
+    """
+    Décorateur : durée de chaque appel de la fonction dans guide_naturel_query_duration_seconds.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with QUERY_DURATION.time(function=func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def timed_aggregate(col, pipeline: List[Dict], kind: str) -> List[Dict]:
+    """
+    col.aggregate(pipeline) lu entièrement, avec sa durée dans guide_naturel_aggregation_duration_seconds.
+    """
+    with AGGREGATION_DURATION.time(kind=kind):
+        return list(col.aggregate(pipeline))
+
+
+# *** ÉTAT DES COMPOSANTS (lu à chaque collecte) ***
+_CACHES = {}
+_SOURCES = {}
+
+
+def _cache_samples(field: str):
+    return [({"cache": name}, cache.stats()[field]) for name, cache in list(_CACHES.items())]
+
+
+def _source_samples(name: str, read: Callable):
+    source = _SOURCES.get(name)
+    return [] if source is None else read(source)
+
+
+REGISTRY.counter("guide_naturel_cache_hits_total", "Lectures servies par le cache", ["cache"],
+                 callback=lambda: _cache_samples("hits"))
+REGISTRY.counter("guide_naturel_cache_misses_total", "Lectures absentes du cache", ["cache"],
+                 callback=lambda: _cache_samples("misses"))
+REGISTRY.counter("guide_naturel_cache_evictions_total", "Entrées évincées du cache", ["cache"],
+                 callback=lambda: _cache_samples("evictions"))
+REGISTRY.gauge("guide_naturel_cache_entries", "Entrées du cache", ["cache"],
+               callback=lambda: _cache_samples("entries"))
+REGISTRY.gauge("guide_naturel_cache_bytes", "Taille estimée du cache (octets)", ["cache"],
+               callback=lambda: _cache_samples("bytes"))
+
+REGISTRY.counter("guide_naturel_query_flights_total", "Appels de requête exécutés ou regroupés avec un appel en cours",
+                 ["outcome"], callback=lambda: _source_samples("flights", lambda flights: [
+                     ({"outcome": "executed"}, flights.executed), ({"outcome": "coalesced"}, flights.coalesced)]))
+REGISTRY.gauge("guide_naturel_conversations", "Conversations dans le stockage",
+               callback=lambda: _source_samples("conversations", lambda store: [({}, len(store))]))
+REGISTRY.gauge("guide_naturel_result_snapshots", "Instantanés de résultats en mémoire",
+               callback=lambda: _source_samples("snapshots", lambda store: [({}, len(store))]))
+REGISTRY.counter("guide_naturel_log_events_total", "Événements des logs BI par issue", ["outcome"],
+                 callback=lambda: _source_samples("log_writer", lambda writer: [
+                     ({"outcome": "written"}, writer.written), ({"outcome": "spilled"}, writer.spilled),
+                     ({"outcome": "dropped"}, writer.dropped)]))
+REGISTRY.gauge("guide_naturel_log_events_pending", "Événements des logs BI en attente d'écriture",
+               callback=lambda: _source_samples("log_writer", lambda writer: [({}, writer.pending())]))
+
+
+def register_cache(name: str, cache):
+    """
+    Expose les statistiques d'un cache muni de stats() (LRUCache, ChartStatsCache) avec l'étiquette cache=<name>.
+    """
+    _CACHES[name] = cache
+
+
+def register_sources(flights=None, conversations=None, snapshots=None, log_writer=None):
+    """
+    Expose l'état des composants de l'application : regroupement des requêtes (SingleFlight),
+    stockage des conversations, instantanés de résultats et écriture des logs BI.
+    """
+    for name, source in [("flights", flights), ("conversations", conversations), ("snapshots", snapshots),
+                         ("log_writer", log_writer)]:
+        if source is not None:
+            _SOURCES[name] = source
+
+
+# *** INTÉGRATION FLASK ***
+def init_metrics(app):
+    """
+    Mesure la durée de chaque requête HTTP et ajoute la route /metrics à l'application Flask.
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            endpoint = request.endpoint or "none"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+            HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), mimetype="text/plain", content_type=CONTENT_TYPE)
@@ -1,3 +1,5 @@
+import threading
+import time
 from collections import defaultdict
 from pymongo.mongo_client import MongoClient
 from pymongo.database import Database
@@ -6,6 +8,10 @@ from pymongo.server_api import ServerApi
 from typing import Collection, Dict, List
 import pprint
 
+from API_request.metriques import timed_aggregate, timed_query
+from API_request.moteur_local import LocalSearchEngine
+from API_request.single_flight import coalesce
+
 # Ordre et couleurs des état de conservation
 STATUS_INFO = {
     "Autre": {"order": 0, "color": "#B9DDBA", "full_name": "Autres (DD/Non spécifié)"},
@@ -27,6 +33,10 @@ REGNE_COLORS = {
 }
 
 
+# Collection contenant la version du jeu de données (mise à jour à chaque import)
+DATASET_META_COLLECTION = "dataset_meta"
+
+
 # --- Fonctions utilitaires ---
 def get_mongo_collection(uri: str, db_name: str, collection_name: str) -> Collection:
     """
@@ -37,6 +47,54 @@ def get_mongo_collection(uri: str, db_name: str, collection_name: str) -> Collec
     return db[collection_name]
 
 
+def get_dataset_version(col: Collection) -> str:
+    """
+    Retourne la version du jeu de données chargé dans la collection.
+    La version est lue dans la collection "dataset_meta" (document {_id: <nom de la collection>, version: ...}).
+    À défaut, le nombre estimé de documents sert de version de repli.
+    """
+    if isinstance(col, LocalSearchEngine):
+        return col.dataset_version
+    meta = col.database[DATASET_META_COLLECTION].find_one({"_id": col.name})
+    if meta and meta.get("version"):
+        return str(meta["version"])
+    return f"count-{col.estimated_document_count()}"
+
+
+class DatasetVersionTracker:
+    """
+    Lecture périodique de la version du jeu de données : au plus une lecture de "dataset_meta"
+    par intervalle de vérification, la dernière version connue est servie entre deux lectures.
+    Partagée par les caches (graphiques, résultats de recherche) pour qu'ils soient invalidés ensemble.
+    """
+
+    def __init__(self, col: Collection, check_interval: float = 60):
+        self.col = col
+        self.check_interval = check_interval
+        self._version = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> str:
+        with self._lock:
+            now = time.monotonic()
+            if self._version is None or now - self._last_check >= self.check_interval:
+                try:
+                    self._version = get_dataset_version(self.col)
+                except Exception as e:
+                    print(f"Impossible de lire la version du jeu de données: {e}")
+                self._last_check = now
+            return self._version
+
+    def refresh(self) -> str:
+        """
+        Force la relecture de la version à la prochaine demande (après un import par exemple).
+        """
+        with self._lock:
+            self._last_check = 0.0
+        return self.current()
+
+
 def _format_key(key, default_label: str = "Non spécifié"):
     """
     Formate une clé (règne, statut) pour l'affichage,
@@ -47,42 +105,127 @@ def _format_key(key, default_label: str = "Non spécifié"):
     return str(key)
 
 
-# --- Fonctions d'Agrégation ---
-def species_by_code_statut(col: Collection) -> dict:
+# --- Moteur d'agrégation commun ---
+def _mongo_sort_key(value):
     """
-    Compte le nombre d'espèces uniques par codeStatut sur l'ensemble de la base de données.
-    Retourne les données formatées pour Chart.js.
+    Clé de tri reproduisant l'ordre de MongoDB : null < nombres < chaînes.
+    """
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, str(value))
+
+
+@timed_query
+@coalesce
+def chart_base_counts(col: Collection) -> Dict[str, List[Dict]]:
     """
+    Calcule en un seul parcours de la collection les comptes de base de tous les graphiques :
+    - "national" : nombre d'espèces uniques par (règne, codeStatut) sur toute la base ;
+    - "departements" : nombre d'espèces uniques par (département, règne, codeStatut).
+    Les deux branches du $facet partagent la même lecture de la collection.
+    """
+    # Moteur en mémoire (QUERY_BACKEND=local) : mêmes comptes, calculés sur les colonnes encodées
+    if isinstance(col, LocalSearchEngine):
+        return col.chart_base_counts()
+
     pipeline = [
         {
-            # Étape 1: Grouper par nom scientifique pour obtenir une entrée unique par espèce.
-            "$group": {
-                "_id": "$nomScientifiqueRef",
-                "codeStatutSpecies": {"$first": "$codeStatut"}
+            "$facet": {
+                "national": [
+                    {
+                        # Étape 1: Une entrée unique par espèce, avec son règne et son statut
+                        "$group": {
+                            "_id": "$nomScientifiqueRef",
+                            "regneSpecies": {"$first": "$regne"},
+                            "codeStatutSpecies": {"$first": "$codeStatut"}
+                        }
+                    },
+                    {
+                        # Étape 2: Compter les espèces par règne et statut
+                        "$group": {
+                            "_id": {"regne": "$regneSpecies", "statut": "$codeStatutSpecies"},
+                            "nombreEspeces": {"$sum": 1}
+                        }
+                    },
+                    {
+                        "$project": {
+                            "_id": 0,
+                            "regne": "$_id.regne",
+                            "statut": "$_id.statut",
+                            "nombreEspeces": "$nombreEspeces"
+                        }
+                    }
+                ],
+                "departements": [
+                    {
+                        # Étape 1: Une entrée unique par espèce au sein de chaque département
+                        "$group": {
+                            "_id": {
+                                "nomScientifiqueRef": "$nomScientifiqueRef",
+                                "codeInseeDepartement": "$codeInseeDepartement"
+                            },
+                            "regneSpecies": {"$first": "$regne"},
+                            "codeStatutSpecies": {"$first": "$codeStatut"}
+                        }
+                    },
+                    {
+                        # Étape 2: Compter les espèces par département, règne et statut
+                        "$group": {
+                            "_id": {
+                                "departement": "$_id.codeInseeDepartement",
+                                "regne": "$regneSpecies",
+                                "statut": "$codeStatutSpecies"
+                            },
+                            "nombreEspeces": {"$sum": 1}
+                        }
+                    },
+                    {
+                        "$project": {
+                            "_id": 0,
+                            "departement": "$_id.departement",
+                            "regne": "$_id.regne",
+                            "statut": "$_id.statut",
+                            "nombreEspeces": "$nombreEspeces"
+                        }
+                    }
+                ]
             }
-        },
-        {
-            # Étape 2: Grouper ces espèces uniques par leur codeStatut pour les compter.
-            "$group": {
-                "_id": "$codeStatutSpecies",
-                "nombreEspeces": {"$sum": 1}
-            }
-        },
-        {
-            # Étape 3: Reformater le document de sortie
-            "$project": {
-                "_id": 0,
-                "statut": "$_id",
-                "nombreEspeces": "$nombreEspeces"
-            }
-        },
-        {
-            # Étape 4: Trier par statut pour la cohérence
-            "$sort": {"statut": 1}
         }
     ]
 
-    resultats_aggregation = list(col.aggregate(pipeline))
+    resultats = timed_aggregate(col, pipeline, "chart_base_counts")
+    if not resultats:
+        return {"national": [], "departements": []}
+    return {"national": resultats[0]["national"], "departements": resultats[0]["departements"]}
+
+
+def _rollup(rows: List[Dict], keys: List[str]) -> List[Dict]:
+    """
+    Additionne "nombreEspeces" selon les clés données et trie le résultat comme le ferait
+    l'étape $sort des anciennes pipelines.
+    """
+    totals = defaultdict(int)
+    for row in rows:
+        totals[tuple(row.get(k) for k in keys)] += row["nombreEspeces"]
+
+    rolled = [dict(zip(keys, key_values), nombreEspeces=nombre) for key_values, nombre in totals.items()]
+    return sorted(rolled, key=lambda r: tuple(_mongo_sort_key(r[k]) for k in keys))
+
+
+# --- Fonctions d'Agrégation ---
+@timed_query
+def species_by_code_statut(col: Collection, base_counts: Dict = None) -> dict:
+    """
+    Compte le nombre d'espèces uniques par codeStatut sur l'ensemble de la base de données.
+    Retourne les données formatées pour Chart.js.
+    Les comptes de base peuvent être fournis pour éviter un nouveau parcours de la collection.
+    """
+    if base_counts is None:
+        base_counts = chart_base_counts(col)
+
+    resultats_aggregation = _rollup(base_counts["national"], ["statut"])
 
     # --- Post-traitement Python pour formater les données Chart.js ---
     chart_data_raw = []
@@ -130,41 +273,17 @@ def species_by_code_statut(col: Collection) -> dict:
     }
 
 
-def species_by_regne(col: Collection) -> dict:
+@timed_query
+def species_by_regne(col: Collection, base_counts: Dict = None) -> dict:
     """
     Compte le nombre d'espèces uniques par règne sur l'ensemble de la base de données.
     Retourne les données formatées pour Chart.js.
+    Les comptes de base peuvent être fournis pour éviter un nouveau parcours de la collection.
     """
-    pipeline = [
-        {
-            # Étape 1: Grouper par nom scientifique pour obtenir une entrée unique par espèce.
-            "$group": {
-                "_id": "$nomScientifiqueRef",
-                "regneSpecies": {"$first": "$regne"}
-            }
-        },
-        {
-            # Étape 2: Grouper ces espèces uniques par leur règne et compter le nombre d'espèces.
-            "$group": {
-                "_id": "$regneSpecies",
-                "nombreEspeces": {"$sum": 1}
-            }
-        },
-        {
-            # Étape 3: Reformater le document de sortie pour faciliter le traitement Python
-            "$project": {
-                "_id": 0,
-                "regne": "$_id",
-                "nombreEspeces": "$nombreEspeces"
-            }
-        },
-        {
-            # Étape 4: Trier les résultats par règne pour une sortie cohérente
-            "$sort": {"regne": 1}
-        }
-    ]
+    if base_counts is None:
+        base_counts = chart_base_counts(col)
 
-    resultats_aggregation = list(col.aggregate(pipeline))
+    resultats_aggregation = _rollup(base_counts["national"], ["regne"])
 
     # --- Post-traitement Python pour formater les données pour Chart.js ---
     chart_data_raw = []
@@ -206,53 +325,19 @@ def species_by_regne(col: Collection) -> dict:
     }
 
 
-def species_by_code_statut_dep(col: Collection, departements: list) -> dict:
+@timed_query
+def species_by_code_statut_dep(col: Collection, departements: list, base_counts: Dict = None) -> dict:
     """
     Compte le nombre d'espèces uniques par codeStatut pour chaque département donné.
     Retourne un dictionnaire où chaque clé est un code de département et la valeur
     est un dictionnaire formaté pour Chart.js pour ce département.
+    Les comptes de base peuvent être fournis pour éviter un nouveau parcours de la collection.
     """
-    pipeline = [
-        {
-            "$match": {"codeInseeDepartement": {"$in": departements}}
-        },
-        {
-            # Étape 1: Grouper par nom scientifique et département pour obtenir une entrée unique par espèce au sein de
-            # chaque département.
-            "$group": {
-                "_id": {
-                    "nomScientifiqueRef": "$nomScientifiqueRef",
-                    "codeInseeDepartement": "$codeInseeDepartement"
-                },
-                "codeStatutSpecies": {"$first": "$codeStatut"}
-            }
-        },
-        {
-            # Étape 2: Grouper les espèces uniques pour les compter.
-            "$group": {
-                "_id": {
-                    "departement": "$_id.codeInseeDepartement",
-                    "statut": "$codeStatutSpecies"
-                },
-                "nombreEspeces": {"$sum": 1}
-            }
-        },
-        {
-            # Étape 3: Reformater le document de sortie de l'agrégation
-            "$project": {
-                "_id": 0,
-                "departement": "$_id.departement",
-                "statut": "$_id.statut",
-                "nombreEspeces": "$nombreEspeces"
-            }
-        },
-        {
-            # Étape 4: Trier pour un traitement Python
-            "$sort": {"departement": 1, "statut": 1}
-        }
-    ]
+    if base_counts is None:
+        base_counts = chart_base_counts(col)
 
-    resultats_aggregation = list(col.aggregate(pipeline))
+    resultats_aggregation = _rollup([row for row in base_counts["departements"] if row["departement"] in departements],
+                                    ["departement", "statut"])
 
     # --- Post-traitement Python pour formater les données Chart.js par département ---
 
@@ -317,51 +402,17 @@ def species_by_code_statut_dep(col: Collection, departements: list) -> dict:
     return final_output_by_department
 
 
-def species_by_regne_dep(col: Collection, departements: list) -> dict:
+@timed_query
+def species_by_regne_dep(col: Collection, departements: list, base_counts: Dict = None) -> dict:
     """
     Compte le nombre d'espèces uniques par règne pour chaque département donné.
+    Les comptes de base peuvent être fournis pour éviter un nouveau parcours de la collection.
     """
-    pipeline = [
-        {
-            "$match": {"codeInseeDepartement": {"$in": departements}}
-        },
-        {
-            # Étape 1: Grouper par nom scientifique et département pour obtenir une entrée unique par espèce au sein de
-            # chaque département.
-            "$group": {
-                "_id": {
-                    "nomScientifiqueRef": "$nomScientifiqueRef",
-                    "codeInseeDepartement": "$codeInseeDepartement"
-                },
-                "regneSpecies": {"$first": "$regne"}
-            }
-        },
-        {
-            # Étape 2: Grouper les espèces uniques pour les compter.
-            "$group": {
-                "_id": {
-                    "departement": "$_id.codeInseeDepartement",
-                    "regne": "$regneSpecies"
-                },
-                "nombreEspeces": {"$sum": 1}
-            }
-        },
-        {
-            # Étape 3: Reformater le document de sortie de l'agrégation
-            "$project": {
-                "_id": 0,
-                "departement": "$_id.departement",
-                "regne": "$_id.regne",
-                "nombreEspeces": "$nombreEspeces"
-            }
-        },
-        {
-            # Étape 4 : Trier pour un traitement Python
-            "$sort": {"departement": 1, "regne": 1}
-        }
-    ]
+    if base_counts is None:
+        base_counts = chart_base_counts(col)
 
-    resultats_aggregation = list(col.aggregate(pipeline))
+    resultats_aggregation = _rollup([row for row in base_counts["departements"] if row["departement"] in departements],
+                                    ["departement", "regne"])
 
     # --- Post-traitement Python pour formater les données Chart.js par département ---
 
@@ -420,46 +471,17 @@ def species_by_regne_dep(col: Collection, departements: list) -> dict:
     return final_output_by_department
 
 
-def species_by_regne_and_statut(col: Collection) -> List[Dict]:
+@timed_query
+def species_by_regne_and_statut(col: Collection, base_counts: Dict = None) -> List[Dict]:
     """
     Compte le nombre d'espèces uniques par règne et codeStatut sur l'ensemble de la base de données,
     et formate les résultats en une liste de dictionnaires Chart.js (un par règne).
+    Les comptes de base peuvent être fournis pour éviter un nouveau parcours de la collection.
     """
-    pipeline = [
-        {
-            # Étape 1: Grouper par nom scientifique unique pour s'assurer de ne compter chaque espèce qu'une seule fois
-            "$group": {
-                "_id": "$nomScientifiqueRef",
-                "regneSpecies": {"$first": "$regne"},
-                "codeStatutSpecies": {"$first": "$codeStatut"}
-            }
-        },
-        {
-            # Étape 2: Grouper les espèces uniques par leur règne et leur statut de conservation
-            "$group": {
-                "_id": {
-                    "regne": "$regneSpecies",
-                    "statut": "$codeStatutSpecies"
-                },
-                "nombreEspeces": {"$sum": 1}
-            }
-        },
-        {
-            # Étape 3: Reformater le document de sortie pour faciliter le traitement Python.
-            "$project": {
-                "_id": 0,
-                "regne": "$_id.regne",
-                "statut": "$_id.statut",
-                "nombreEspeces": "$nombreEspeces"
-            }
-        },
-        {
-            # Étape 4: Trier les résultats
-            "$sort": {"regne": 1, "statut": 1}
-        }
-    ]
+    if base_counts is None:
+        base_counts = chart_base_counts(col)
 
-    resultats_aggregation = list(col.aggregate(pipeline))
+    resultats_aggregation = _rollup(base_counts["national"], ["regne", "statut"])
 
     # Re-structuration des résultats pour faciliter le traitement par règne
     regne_status_counts = defaultdict(lambda: {'statuts': defaultdict(int), 'total_regne': 0})
@@ -531,51 +553,17 @@ def species_by_regne_and_statut(col: Collection) -> List[Dict]:
     return charts_output
 
 
-def species_by_regne_and_statut_dep(col: Collection, dep: List[int]) -> Dict[int, List[Dict]]:
+@timed_query
+def species_by_regne_and_statut_dep(col: Collection, dep: List[int], base_counts: Dict = None) -> Dict[int, List[Dict]]:
     """
     Compte le nombre d'espèces uniques par département, règne et codeStatut.
+    Les comptes de base peuvent être fournis pour éviter un nouveau parcours de la collection.
     """
-    pipeline = [
-        {
-            # Étape 1: Grouper par nom scientifique département pour obtenir une entrée unique par espèce au sein de
-            # chaque département.
-            "$group": {
-                "_id": {
-                    "nomScientifiqueRef": "$nomScientifiqueRef",
-                    "codeInseeDepartement": "$codeInseeDepartement"
-                },
-                "regneSpecies": {"$first": "$regne"},
-                "codeStatutSpecies": {"$first": "$codeStatut"}
-            }
-        },
-        {
-            # Étape 2: Grouper les espèces uniques par leur département, règne et statut de conservation
-            "$group": {
-                "_id": {
-                    "departement": "$_id.codeInseeDepartement",
-                    "regne": "$regneSpecies",
-                    "statut": "$codeStatutSpecies"
-                },
-                "nombreEspeces": {"$sum": 1}
-            }
-        },
-        {
-            # Étape 3: Reformater le document de sortie pour faciliter le traitement Python.
-            "$project": {
-                "_id": 0,
-                "departement": "$_id.departement",
-                "regne": "$_id.regne",
-                "statut": "$_id.statut",
-                "nombreEspeces": "$nombreEspeces"
-            }
-        },
-        {
-            # Étape 4: Trier les résultats
-            "$sort": {"departement": 1, "regne": 1, "statut": 1}
-        }
-    ]
+    if base_counts is None:
+        base_counts = chart_base_counts(col)
 
-    resultats_aggregation = list(col.aggregate(pipeline))
+    # Comme la version d'origine, tous les départements présents sont retournés (dep n'est pas un filtre)
+    resultats_aggregation = _rollup(base_counts["departements"], ["departement", "regne", "statut"])
 
     # Re-structuration des résultats
     full_data_structure = defaultdict(lambda: defaultdict(lambda: {'statuts': defaultdict(int), 'total_regne': 0}))
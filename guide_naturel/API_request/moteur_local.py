@@ -0,0 +1,380 @@
+"""
+Moteur de recherche en mémoire, alternative à MongoDB pour la collection "Nature".
+
+Final_data (csv ou parquet) est chargé en colonnes : chaque champ filtrable est encodé en codes entiers
+(une valeur distincte = un code) et dispose d'un index inversé (lignes de chaque valeur). Un filtre $match
+est évalué une fois par valeur distincte plutôt que par ligne, puis les lignes candidates sont lues dans
+l'index inversé de la condition la plus sélective. Le regroupement par espèce reproduit la pipeline
+de build_nature_group_pipeline et les comptes de chart_base_counts : les réponses ont la même forme.
+
+Utilisé par recherche.py et mongo_request.py quand la collection passée est un LocalSearchEngine
+(QUERY_BACKEND=local dans flask_app.py).
+"""
+import bisect
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from API_request.colonnes import convert_integer_columns
+from API_request.result_cache import LRUCache, make_query_key
+
+DATA_DIR = Path("..") / "data"
+# Champs encodés et indexés (les champs normalisés "*_norm" seulement s'ils sont présents)
+INDEXED_FIELDS = ["nomScientifiqueRef", "nomVernaculaire", "regne", "groupeTaxoSimple", "codeStatut", "commune",
+                  "codeInseeDepartement", "regne_norm", "groupeTaxoSimple_norm", "commune_norm",
+                  "nomVernaculaire_norm"]
+
+# Options $regex de MongoDB et leurs équivalents Python
+REGEX_OPTIONS = {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}
+
+# Au-delà de cette proportion de lignes, le filtre est appliqué à toute la colonne plutôt que via l'index inversé
+FULL_SCAN_RATIO = 0.25
+# Recherches déjà regroupées par espèce (listes triées complètes), par filtre $match
+LOCAL_SEARCH_CACHE_MAX_ENTRIES = 256
+
+
+def read_final_frame(path: Path) -> pd.DataFrame:
+    """
+    Lit Final_data (csv ou parquet) en entier, avec les mêmes types que le chargement dans MongoDB.
+    """
+    if path.suffix == ".parquet":
+        return convert_integer_columns(pd.read_parquet(path))
+    return convert_integer_columns(pd.read_csv(path, dtype=str))
+
+
+def default_data_path(data_dir: Path = DATA_DIR) -> Path:
+    """
+    Final_data.parquet s'il existe, Final_data.csv sinon.
+    """
+    parquet = data_dir / "Final_data.parquet"
+    return parquet if parquet.is_file() else data_dir / "Final_data.csv"
+
+
+def _file_version(path: Path) -> str:
+    # Version écrite par le prétraitement si elle est à côté du fichier, sinon taille et date du fichier
+    version_path = path.parent / "dataset_version.json"
+    if version_path.is_file():
+        with open(version_path, encoding="utf-8") as f:
+            version = json.load(f).get("version")
+        if version:
+            return str(version)
+    stat = path.stat()
+    return f"fichier-{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def _valeur(value):
+    # Valeur pandas/numpy -> valeur Python (None pour les cellules vides)
+    if value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def _sort_value(value):
+    # Ordre de MongoDB : null < nombres < chaînes
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, str(value))
+
+
+def _sort_key(item_or_key) -> tuple:
+    # Clé de tri des résultats : (sort_priority_nomVernaculaire, nomVernaculaire, nomScientifiqueRef)
+    if isinstance(item_or_key, dict):
+        item_or_key = [item_or_key.get("sort_priority_nomVernaculaire"), item_or_key.get("nomVernaculaire"),
+                       item_or_key.get("nomScientifiqueRef")]
+    return tuple(_sort_value(value) for value in item_or_key)
+
+
+class _EncodedColumn:
+    """
+    Colonne encodée : un code entier par ligne (-1 pour une cellule vide), la liste des valeurs distinctes
+    et l'index inversé (les lignes de la valeur c sont rows[bounds[c]:bounds[c + 1]], dans l'ordre du fichier).
+    """
+
+    def __init__(self, series: pd.Series):
+        codes, uniques = pd.factorize(series, sort=False)
+        self.codes = codes.astype(np.int32)
+        self.values = [_valeur(value) for value in uniques]
+        self.rows = np.argsort(self.codes, kind="stable").astype(np.int32)
+        self.bounds = np.searchsorted(self.codes[self.rows], np.arange(len(self.values) + 1))
+        self.counts = np.diff(self.bounds)
+
+    def value(self, code: int):
+        return self.values[code] if code >= 0 else None
+
+    def postings(self, mask: np.ndarray) -> np.ndarray:
+        """
+        Lignes (triées) dont la valeur est retenue par `mask` (un booléen par valeur distincte).
+        """
+        codes = np.flatnonzero(mask[:-1])
+        if len(codes) == 0:
+            return np.empty(0, dtype=np.int32)
+        rows = np.concatenate([self.rows[self.bounds[code]:self.bounds[code + 1]] for code in codes])
+        rows.sort()
+        return rows
+
+
+class LocalSearchEngine:
+    """
+    Collection "Nature" chargée en mémoire. Expose ce que l'application utilise d'une collection
+    (name, full_name, distinct, estimated_document_count) et, à la place des pipelines d'agrégation,
+    search_species, species_page, keyset_page et chart_base_counts.
+    Les données ne sont jamais modifiées après le chargement : l'objet est partagé entre les threads.
+    """
+
+    def __init__(self, df: pd.DataFrame, name: str = "Nature", dataset_version: Optional[str] = None):
+        self.name = name
+        self.full_name = f"local.{name}"
+        self.size = len(df)
+        self.dataset_version = dataset_version or f"count-{self.size}"
+
+        self._columns = {field: _EncodedColumn(df[field]) for field in INDEXED_FIELDS if field in df.columns}
+        if "nombreObservations" in df.columns:
+            observations = pd.to_numeric(df["nombreObservations"], errors="coerce").fillna(0)
+            self._observations = observations.to_numpy(dtype=np.int64)
+        else:
+            self._observations = np.zeros(self.size, dtype=np.int64)
+
+        self._masks = LRUCache(max_entries=1024)
+        self._searches = LRUCache(max_entries=LOCAL_SEARCH_CACHE_MAX_ENTRIES)
+
+    @classmethod
+    def from_path(cls, path: Path, name: str = "Nature") -> "LocalSearchEngine":
+        path = Path(path)
+        engine = cls(read_final_frame(path), name=name, dataset_version=_file_version(path))
+        print(f"Moteur local : {engine.size} lignes chargées depuis {path}")
+        return engine
+
+    # *** INTERFACE DE COLLECTION ***
+    def has_field(self, field: str) -> bool:
+        return field in self._columns
+
+    def distinct(self, field: str) -> List:
+        column = self._columns.get(field)
+        return [value for value in column.values if value is not None] if column is not None else []
+
+    def estimated_document_count(self) -> int:
+        return self.size
+
+    def clear_caches(self):
+        """
+        Vide les filtres et les recherches mémorisés (mesures à froid des benchmarks).
+        """
+        self._masks.clear()
+        self._searches.clear()
+
+    # *** FILTRES ***
+    def _value_mask(self, field: str, condition) -> np.ndarray:
+        """
+        Un booléen par valeur distincte du champ (plus un False final pour les cellules vides, code -1).
+        """
+        cache_key = make_query_key(field, condition)
+        mask = self._masks.get(cache_key)
+        if mask is not None:
+            return mask
+
+        column = self._columns[field]
+        if isinstance(condition, dict) and "$regex" in condition:
+            flags = 0
+            for option in condition.get("$options", ""):
+                flags |= REGEX_OPTIONS.get(option, 0)
+            pattern = re.compile(condition["$regex"], flags)
+            keep = [isinstance(value, str) and pattern.search(value) is not None for value in column.values]
+        elif isinstance(condition, dict) and set(condition) == {"$in"}:
+            accepted = condition["$in"]
+            keep = [value is not None and value in accepted for value in column.values]
+        elif isinstance(condition, dict):
+            raise ValueError(f"Filtre non pris en charge par le moteur local : {field} {condition}")
+        else:
+            keep = [value is not None and value == condition for value in column.values]
+
+        mask = np.array(keep + [False], dtype=bool)
+        self._masks.set(cache_key, mask)
+        return mask
+
+    def _select_rows(self, match_stage_query: Dict) -> np.ndarray:
+        """
+        Lignes (dans l'ordre du fichier) qui satisfont toutes les conditions du $match.
+        """
+        conditions = []
+        for field, condition in match_stage_query.items():
+            if field.startswith("$"):
+                raise ValueError(f"Opérateur non pris en charge par le moteur local : {field}")
+            if field not in self._columns:
+                # Champ absent de tous les documents : aucune ligne ne correspond
+                return np.empty(0, dtype=np.int32)
+            column = self._columns[field]
+            mask = self._value_mask(field, condition)
+            conditions.append((int(column.counts[mask[:-1]].sum()), column, mask))
+
+        if not conditions:
+            return np.arange(self.size, dtype=np.int32)
+
+        # Lignes candidates : la condition la plus sélective, puis filtrage par les autres
+        conditions.sort(key=lambda item: item[0])
+        selected, column, mask = conditions[0]
+        if selected > FULL_SCAN_RATIO * self.size:
+            rows = np.flatnonzero(mask[column.codes]).astype(np.int32)
+        else:
+            rows = column.postings(mask)
+        for _, column, mask in conditions[1:]:
+            if len(rows) == 0:
+                break
+            rows = rows[mask[column.codes[rows]]]
+        return rows
+
+    # *** REGROUPEMENT PAR ESPÈCE ***
+    def _distinct_per_group(self, groups: np.ndarray, rows: np.ndarray, fields: List[str]) -> Dict[int, List]:
+        """
+        Combinaisons distinctes (non vides) des champs donnés pour chaque groupe, dans l'ordre d'apparition.
+        Équivalent de $addToSet.
+        """
+        key = groups.astype(np.int64)
+        columns = [self._columns.get(field) for field in fields]
+        for column in columns:
+            codes = column.codes[rows] if column is not None else np.full(len(rows), -1, dtype=np.int32)
+            width = len(column.values) + 1 if column is not None else 1
+            key = key * width + (codes + 1)
+        _, first = np.unique(key, return_index=True)
+        first.sort()
+
+        per_group = {}
+        for position in first:
+            values = [column.value(int(column.codes[rows[position]])) if column is not None else None
+                      for column in columns]
+            if all(value is None for value in values):
+                continue
+            per_group.setdefault(int(groups[position]), []).append(values)
+        return per_group
+
+    def _group_species(self, rows: np.ndarray, departement_specifie: bool) -> List[Dict]:
+        species = self._columns["nomScientifiqueRef"]
+        uniques, first, groups = np.unique(species.codes[rows], return_index=True, return_inverse=True)
+        groups = groups.reshape(-1)
+        totals = np.bincount(groups, weights=self._observations[rows], minlength=len(uniques))
+
+        statuts = self._distinct_per_group(groups, rows, ["codeStatut"])
+        departements = self._distinct_per_group(groups, rows, ["codeInseeDepartement"])
+        communes = self._distinct_per_group(groups, rows, ["commune", "codeInseeDepartement"]) \
+            if departement_specifie else {}
+        aggregation_type = "departement_specifique" if departement_specifie else "nationale_sans_communes"
+
+        first_value = {}
+        for field in ["nomVernaculaire", "regne", "groupeTaxoSimple"]:
+            column = self._columns.get(field)
+            first_value[field] = [column.value(int(code)) for code in column.codes[rows[first]]] \
+                if column is not None else [None] * len(uniques)
+
+        items = []
+        for group, code in enumerate(uniques):
+            nom_vernaculaire = first_value["nomVernaculaire"][group]
+            communes_details = []
+            for commune, departement in communes.get(group, []):
+                detail = {}
+                if commune is not None:
+                    detail["commune"] = commune
+                if departement is not None:
+                    detail["departement"] = departement
+                communes_details.append(detail)
+            items.append({
+                "nomScientifiqueRef": species.value(int(code)),
+                "nomVernaculaire": nom_vernaculaire if nom_vernaculaire is not None else "N/A",
+                "regne": first_value["regne"][group],
+                "groupeTaxoSimple": first_value["groupeTaxoSimple"][group],
+                "statuts": [values[0] for values in statuts.get(group, [])],
+                "totalObservationsEspece": int(totals[group]),
+                "departements": [values[0] for values in departements.get(group, [])],
+                "communesDetails": communes_details,
+                "aggregation_type": aggregation_type,
+                "sort_priority_nomVernaculaire": 1 if nom_vernaculaire in (None, "N/A") else 0
+            })
+        items.sort(key=_sort_key)
+        return items
+
+    def _search(self, match_stage_query: Dict) -> Dict:
+        cache_key = make_query_key(match_stage_query)
+        search = self._searches.get(cache_key)
+        if search is None:
+            departement_specifie = "codeInseeDepartement" in match_stage_query
+            items = self._group_species(self._select_rows(match_stage_query), departement_specifie)
+            search = {
+                "items": items,
+                "keys": [_sort_key(item) for item in items],
+                "positions": {item["nomScientifiqueRef"]: index for index, item in enumerate(items)},
+                "aggregation_type": "departement_specifique" if departement_specifie else "nationale_sans_communes"
+            }
+            self._searches.set(cache_key, search)
+        return search
+
+    # *** RECHERCHES (voir recherche.py) ***
+    def search_species(self, match_stage_query: Dict):
+        """
+        Toutes les espèces correspondant au filtre, triées comme build_sort_stage, et le type d'agrégation.
+        La liste retournée est partagée : elle ne doit pas être modifiée.
+        """
+        search = self._search(match_stage_query)
+        return search["items"], search["aggregation_type"]
+
+    def species_page(self, match_stage_query: Dict, names: List[str]) -> List[Dict]:
+        """
+        Espèces d'une page d'instantané, dans l'ordre de `names`.
+        """
+        search = self._search(match_stage_query)
+        return [search["items"][search["positions"][name]] for name in names if name in search["positions"]]
+
+    def keyset_page(self, match_stage_query: Dict, direction: str, key: List, limit: int) -> List[Dict]:
+        """
+        Les `limit` espèces strictement après (direction "next") ou avant ("prev") la clé de tri,
+        dans l'ordre d'affichage.
+        """
+        search = self._search(match_stage_query)
+        if direction == "next":
+            start = bisect.bisect_right(search["keys"], _sort_key(key))
+            return search["items"][start:start + limit]
+        end = bisect.bisect_left(search["keys"], _sort_key(key))
+        return search["items"][max(end - limit, 0):end]
+
+    # *** GRAPHIQUES (voir mongo_request.chart_base_counts) ***
+    def _count_first_rows(self, first_rows: np.ndarray, fields: Dict[str, str]) -> List[Dict]:
+        # Nombre de lignes par combinaison des champs donnés (nom de sortie -> champ)
+        columns = [self._columns.get(field) for field in fields.values()]
+        key = np.zeros(len(first_rows), dtype=np.int64)
+        for column in columns:
+            codes = column.codes[first_rows] if column is not None else np.full(len(first_rows), -1)
+            key = key * ((len(column.values) if column is not None else 0) + 1) + (codes + 1)
+        _, first, counts = np.unique(key, return_index=True, return_counts=True)
+
+        result = []
+        for position, count in zip(first, counts):
+            row = int(first_rows[position])
+            entry = {name: column.value(int(column.codes[row])) if column is not None else None
+                     for name, column in zip(fields, columns)}
+            entry["nombreEspeces"] = int(count)
+            result.append(entry)
+        return result
+
+    def chart_base_counts(self) -> Dict[str, List[Dict]]:
+        """
+        Mêmes comptes que mongo_request.chart_base_counts : règne et statut de la première ligne de chaque espèce
+        (sur toute la base, puis au sein de chaque département).
+        """
+        species = self._columns["nomScientifiqueRef"].codes.astype(np.int64)
+        _, national_rows = np.unique(species, return_index=True)
+
+        departement = self._columns.get("codeInseeDepartement")
+        if departement is not None:
+            species = species * (len(departement.values) + 1) + (departement.codes + 1)
+        _, departement_rows = np.unique(species, return_index=True)
+
+        return {
+            "national": self._count_first_rows(national_rows, {"regne": "regne", "statut": "codeStatut"}),
+            "departements": self._count_first_rows(departement_rows, {"departement": "codeInseeDepartement",
+                                                                      "regne": "regne", "statut": "codeStatut"})
+        }
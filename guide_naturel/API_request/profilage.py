@@ -0,0 +1,321 @@
+"""
+Profilage des agrégations MongoDB lentes (mode optionnel, QUERY_PROFILING=1).
+
+Les collections de recherche sont enveloppées par ProfiledCollection : chaque appel à aggregate() est chronométré,
+et ceux qui dépassent QUERY_PROFILING_THRESHOLD_MS sont écrits (une ligne JSON par requête) dans un journal local
+à rotation, avec la forme normalisée du filtre, les documents examinés et retournés et le résumé du plan
+d'exécution (explain en mode executionStats, exécuté en arrière-plan et au plus une fois par forme et par intervalle).
+
+Rapport par forme de filtre (depuis le dossier guide_naturel) :
+    python -m API_request.profilage                          # slow_queries.log et ses fichiers de rotation
+    python -m API_request.profilage --journal autre.log --top 10
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+
+PROFILING_LOG_PATH = "slow_queries.log"
+PROFILING_THRESHOLD_MS = 100.0
+PROFILING_LOG_MAX_BYTES = 5 * 1024 * 1024
+PROFILING_LOG_BACKUPS = 3
+# Une même forme de requête n'est pas ré-expliquée avant cet intervalle (secondes)
+EXPLAIN_INTERVAL = 300.0
+
+_logger_lock = threading.Lock()
+
+
+def profiling_enabled() -> bool:
+    return os.getenv("QUERY_PROFILING") == "1"
+
+
+def get_slow_query_logger(path: str = None) -> logging.Logger:
+    """
+    Journal des requêtes lentes : une ligne JSON par requête, fichier à rotation (QUERY_PROFILING_LOG).
+    """
+    logger = logging.getLogger("guide_naturel.requetes_lentes")
+    with _logger_lock:
+        if not logger.handlers:
+            handler = RotatingFileHandler(path or os.getenv("QUERY_PROFILING_LOG", PROFILING_LOG_PATH),
+                                          maxBytes=PROFILING_LOG_MAX_BYTES, backupCount=PROFILING_LOG_BACKUPS,
+                                          encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+    return logger
+
+
+# *** FORME DES FILTRES ***
+def _shape(value, operator: str = None):
+    if isinstance(value, dict):
+        return {key: _shape(item, key) for key, item in value.items()}
+    if isinstance(value, list):
+        if all(not isinstance(item, (dict, list)) for item in value):
+            return ["?"]
+        return [_shape(item) for item in value]
+    # Les options d'une $regex ("i") font partie de la forme, pas les valeurs recherchées
+    return value if operator == "$options" else "?"
+
+
+def filter_shape(pipeline: List[Dict]) -> str:
+    """
+    Forme normalisée des $match de premier niveau d'une pipeline : champs et opérateurs conservés,
+    valeurs remplacées par "?". {"regne": {"$regex": "^Anim", "$options": "i"}} et
+    {"regne": {"$regex": "^Plan", "$options": "i"}} ont la même forme.
+    """
+    match = {}
+    for stage in pipeline:
+        if "$match" in stage:
+            match.update(stage["$match"])
+    return json.dumps(_shape(match), sort_keys=True, ensure_ascii=False)
+
+
+def _first_match(pipeline: List[Dict]) -> Dict:
+    return next((stage["$match"] for stage in pipeline if "$match" in stage), {})
+
+
+def documents_returned(pipeline: List[Dict], results: List[Dict]) -> int:
+    """
+    Nombre de documents réellement retournés. Une pipeline terminée par $facet ne produit qu'un document :
+    on compte alors la branche "items" (la page de résultats), ou toutes les branches s'il n'y en a pas.
+    """
+    if not pipeline or "$facet" not in pipeline[-1] or not results:
+        return len(results)
+    branches = results[0]
+    if "items" in branches:
+        return len(branches["items"])
+    return sum(len(branch) for branch in branches.values() if isinstance(branch, list))
+
+
+# *** RÉSUMÉ DU PLAN D'EXÉCUTION ***
+def _walk_plan(plan, stages: List[str], indexes: List[str]):
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str) and plan["stage"] not in stages:
+            stages.append(plan["stage"])
+        if "indexName" in plan and plan["indexName"] not in indexes:
+            indexes.append(plan["indexName"])
+        for key, value in plan.items():
+            # Seul le plan retenu nous intéresse
+            if key != "rejectedPlans":
+                _walk_plan(value, stages, indexes)
+    elif isinstance(plan, list):
+        for value in plan:
+            _walk_plan(value, stages, indexes)
+
+
+def _find_execution_stats(explanation) -> Optional[Dict]:
+    if isinstance(explanation, dict):
+        if "totalDocsExamined" in explanation:
+            return explanation
+        for value in explanation.values():
+            found = _find_execution_stats(value)
+            if found is not None:
+                return found
+    elif isinstance(explanation, list):
+        for value in explanation:
+            found = _find_execution_stats(value)
+            if found is not None:
+                return found
+    return None
+
+
+def summarize_explain(explanation: Dict) -> Dict:
+    """
+    Résumé d'un explain("executionStats") : documents et clés d'index examinés, étapes et index du plan retenu
+    (collscan=True si aucun index n'est utilisé).
+    """
+    stages, indexes = [], []
+    _walk_plan(explanation, stages, indexes)
+    stats = _find_execution_stats(explanation) or {}
+    return {
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "plan_stages": stages,
+        "indexes": indexes,
+        "collscan": "COLLSCAN" in stages or not indexes,
+    }
+
+
+# *** COLLECTION PROFILÉE ***
+class ProfiledCollection:
+    """
+    Enveloppe d'une Collection pymongo : aggregate() est chronométré et les appels plus lents que `threshold_ms`
+    sont journalisés avec leur plan d'exécution. Les autres attributs sont ceux de la collection enveloppée.
+    """
+
+    def __init__(self, collection, threshold_ms: float = None, logger: logging.Logger = None,
+                 explain_interval: float = EXPLAIN_INTERVAL):
+        self.collection = collection
+        self.threshold_ms = threshold_ms if threshold_ms is not None else \
+            float(os.getenv("QUERY_PROFILING_THRESHOLD_MS", PROFILING_THRESHOLD_MS))
+        self.logger = logger or get_slow_query_logger()
+        self.explain_interval = explain_interval
+        self._explained_at = {}
+        self._lock = threading.Lock()
+        # explain réexécute la requête : il est fait hors du traitement de la requête HTTP, un à la fois
+        self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-explain")
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def aggregate(self, pipeline: List[Dict], *args, **kwargs) -> List[Dict]:
+        start = time.perf_counter()
+        results = list(self.collection.aggregate(pipeline, *args, **kwargs))
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        if duration_ms >= self.threshold_ms:
+            self._record(pipeline, duration_ms, documents_returned(pipeline, results))
+        return results
+
+    def _should_explain(self, shape: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained_at.get(shape)
+            if last is not None and now - last < self.explain_interval:
+                return False
+            self._explained_at[shape] = now
+            return True
+
+    def _record(self, pipeline: List[Dict], duration_ms: float, returned: int):
+        shape = filter_shape(pipeline)
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "collection": self.collection.name,
+            "shape": shape,
+            "filter": json.loads(json.dumps(_first_match(pipeline), ensure_ascii=False, default=str)),
+            "pipeline_stages": [next(iter(stage)) for stage in pipeline],
+            "duration_ms": round(duration_ms, 3),
+            "docs_returned": returned,
+        }
+        if self._should_explain(shape):
+            self._explainer.submit(self._explain_and_write, pipeline, record)
+        else:
+            self._write(record)
+
+    def explain(self, pipeline: List[Dict]) -> Dict:
+        return self.collection.database.command(
+            "explain", {"aggregate": self.collection.name, "pipeline": pipeline, "cursor": {}},
+            verbosity="executionStats")
+
+    def _explain_and_write(self, pipeline: List[Dict], record: Dict):
+        try:
+            record.update(summarize_explain(self.explain(pipeline)))
+        except Exception as e:
+            record["explain_error"] = str(e)
+        self._write(record)
+
+    def _write(self, record: Dict):
+        self.logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+# *** RAPPORT ***
+def read_slow_queries(path: str) -> List[Dict]:
+    """
+    Relit le journal et ses fichiers de rotation (path.1, path.2...), en ignorant les lignes illisibles.
+    """
+    records = []
+    for file_path in [path] + sorted(glob.glob(f"{glob.escape(path)}.*")):
+        try:
+            with open(file_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        except OSError:
+            continue
+    return records
+
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    index = min(int(round((len(values) - 1) * q / 100)), len(values) - 1)
+    return values[index]
+
+
+def _mean(values: List[float]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+
+def group_by_shape(records: List[Dict]) -> List[Dict]:
+    """
+    Regroupe les requêtes lentes par (collection, forme du filtre), triées par temps total décroissant.
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault((record.get("collection"), record.get("shape")), []).append(record)
+
+    report = []
+    for (collection, shape), items in groups.items():
+        durations = [item["duration_ms"] for item in items]
+        explained = [item for item in items if "plan_stages" in item]
+        docs_examined = _mean([item.get("docs_examined") for item in explained])
+        docs_returned = _mean([item.get("docs_returned") for item in items])
+        indexes = sorted({name for item in explained for name in item.get("indexes", [])})
+        report.append({
+            "collection": collection,
+            "shape": shape,
+            "count": len(items),
+            "total_ms": round(sum(durations), 1),
+            "p50_ms": round(_percentile(durations, 50), 1),
+            "p95_ms": round(_percentile(durations, 95), 1),
+            "max_ms": round(max(durations), 1),
+            "docs_examined": docs_examined,
+            "docs_returned": docs_returned,
+            "indexes": indexes,
+            "collscan": any(item.get("collscan") for item in explained) if explained else None,
+            "example": max(items, key=lambda item: item["duration_ms"]).get("filter"),
+        })
+    return sorted(report, key=lambda group: group["total_ms"], reverse=True)
+
+
+def print_report(report: List[Dict], top: int = 20):
+    if not report:
+        print("Aucune requête lente dans le journal")
+        return
+    print(f"{'collection':<16} {'n':>5} {'total ms':>10} {'p50':>8} {'p95':>8} {'max':>8} "
+          f"{'examinés':>10} {'retournés':>10}  plan")
+    for group in report[:top]:
+        examined = f"{group['docs_examined']:.0f}" if group["docs_examined"] is not None else "-"
+        returned = f"{group['docs_returned']:.0f}" if group["docs_returned"] is not None else "-"
+        if group["collscan"] is None:
+            plan = "non expliqué"
+        else:
+            plan = "COLLSCAN" if group["collscan"] else ", ".join(group["indexes"])
+        print(f"{str(group['collection']):<16} {group['count']:>5} {group['total_ms']:>10.1f} "
+              f"{group['p50_ms']:>8.1f} {group['p95_ms']:>8.1f} {group['max_ms']:>8.1f} "
+              f"{examined:>10} {returned:>10}  {plan}")
+        print(f"    forme : {group['shape']}")
+        print(f"    exemple (la plus lente) : {json.dumps(group['example'], ensure_ascii=False)}")
+
+
+# *** LIGNE DE COMMANDE ***
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m API_request.profilage",
+                                     description="Rapport des agrégations lentes, par forme de filtre")
+    parser.add_argument("--journal", default=os.getenv("QUERY_PROFILING_LOG", PROFILING_LOG_PATH),
+                        help="journal des requêtes lentes (les fichiers de rotation sont lus aussi)")
+    parser.add_argument("--top", type=int, default=20, help="nombre de formes affichées")
+    parser.add_argument("--json", action="store_true", help="rapport au format JSON")
+    args = parser.parse_args(argv[1:])
+
+    report = group_by_shape(read_slow_queries(args.journal))
+    if args.json:
+        print(json.dumps(report[:args.top], ensure_ascii=False, indent=2))
+    else:
+        print_report(report, top=args.top)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
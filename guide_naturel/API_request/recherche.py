@@ -1,11 +1,29 @@
+import base64
+import json
 import math
+import re
+import unicodedata
+
+from API_request.metriques import timed_aggregate, timed_query
+from API_request.moteur_local import LocalSearchEngine
+from API_request.result_cache import LRUCache, make_query_key
+from API_request.single_flight import coalesce
+from API_request.snapshots import SNAPSHOT_MAX_IDS_PER_SEARCH
 
 RESULTS_PER_PAGE = 50
 FUZZY_MATCH_THRESHOLD = 20  # Seuil d'acceptation de correction
+# Seuils plus stricts pour les grands vocabulaires (milliers de communes et de noms vernaculaires)
+FUZZY_MATCH_THRESHOLDS = {"commune": 85, "nomVernaculaire": 88}
 
+# Nombre total de résultats par jeu de filtres : les pages suivantes n'ont pas besoin de recompter
+TOTAL_COUNT_CACHE = LRUCache(max_entries=2048)
 
-
-conversations = {}
+# Pages de résultats partagées entre toutes les conversations, indexées par le filtre $match canonique
+# et la page ; bornées en nombre d'entrées et en taille (octets JSON estimés).
+# Les résultats retournés sont partagés : ils ne doivent pas être modifiés par l'appelant
+SEARCH_RESULT_CACHE_MAX_ENTRIES = 2048
+SEARCH_RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+SEARCH_RESULT_CACHE = LRUCache(max_entries=SEARCH_RESULT_CACHE_MAX_ENTRIES, max_bytes=SEARCH_RESULT_CACHE_MAX_BYTES)
 
 # Liste des questions du chatbot
 QUESTIONS_FLOW = {
@@ -48,17 +66,59 @@ KNOWN_VALUES_FOR_FUZZY_MATCHING = {
 }
 
 
-def build_mongo_match_stage(filters):
+# Champs "ombre" normalisés (minuscules, sans accents) ajoutés à l'import, indexables pour les recherches exactes
+# et par préfixe
+NORMALIZED_FIELDS = {
+    "regne": "regne_norm",
+    "groupeTaxoSimple": "groupeTaxoSimple_norm",
+    "commune": "commune_norm",
+    "nomVernaculaire": "nomVernaculaire_norm",
+}
+
+
+def normalize_text(value):
+    """
+    Normalise un texte pour les champs "ombre" : minuscules, sans accents, espaces réduits.
+    Doit rester identique à normalize_text dans preprocess/preTraitementData.py.
+    """
+    if value is None:
+        return None
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split())
+
+
+# Vrai si la requête filtre sur la commune (champ brut ou normalisé)
+def has_commune_filter(match_stage_query):
+    return "commune" in match_stage_query or NORMALIZED_FIELDS["commune"] in match_stage_query
+
+
+# Vrai si "species_summary" donne le même résultat que le regroupement de "Nature".
+# Ce n'est pas le cas avec un filtre sur la commune (absente du résumé), ni sur le statut : une espèce peut
+# avoir plusieurs statuts (plusieurs cdNom), et seules ses lignes du statut demandé sont regroupées dans
+# "Nature", alors que le résumé ne garde qu'un tableau de statuts et des totaux tous statuts confondus
+def summary_can_serve(match_stage_query):
+    return not has_commune_filter(match_stage_query) and "codeStatut" not in match_stage_query
+
+
+def build_mongo_match_stage(filters, normalized=False):
     # Conditions de filtrage fournies par l'utilisateur (initialisation) pour la base MongoDB
+    # normalized=True : correspondances exactes ou par préfixe ancré sur les champs "ombre" normalisés,
+    # qui peuvent utiliser les index (contrairement aux $regex insensibles à la casse)
+    if normalized:
+        return build_normalized_match_stage(filters)
+
     match_query = {}
 
+    # Les saisies de l'utilisateur sont échappées (ex : "Saint-Jean (" n'est pas une expression régulière valide)
+
     # Si le filtre "regne" existe (si l'utilisateur l'a fourni) et s'il a une valeur
     if "regne" in filters and filters["regne"]:
-        match_query["regne"] = {"$regex": f"^{filters['regne']}$", "$options": "i"} # On veut trouver les documents où le champ "regne" correspond à la valeur fournie par l'utilisateur
+        match_query["regne"] = {"$regex": f"^{re.escape(filters['regne'])}$", "$options": "i"} # On veut trouver les documents où le champ "regne" correspond à la valeur fournie par l'utilisateur
     # i : insensible à la casse
 
     if "groupeTaxoSimple" in filters and filters["groupeTaxoSimple"]:
-        match_query["groupeTaxoSimple"] = {"$regex": f"^{filters['groupeTaxoSimple']}", "$options": "i"}
+        match_query["groupeTaxoSimple"] = {"$regex": f"^{re.escape(filters['groupeTaxoSimple'])}", "$options": "i"}
 
     if "codeInseeDepartement" in filters and filters["codeInseeDepartement"]:
         code_dept_str = filters["codeInseeDepartement"]
@@ -72,36 +132,119 @@ def build_mongo_match_stage(filters):
             pass
 
     if "commune" in filters and filters["commune"]:
-        match_query["commune"] = {"$regex": f"^{filters['commune']}", "$options": "i"}
+        match_query["commune"] = {"$regex": f"^{re.escape(filters['commune'])}", "$options": "i"}
 
     if "nomVernaculaire" in filters and filters["nomVernaculaire"]:
-        match_query["nomVernaculaire"] = {"$regex": filters['nomVernaculaire'], "$options": "i"}
+        match_query["nomVernaculaire"] = {"$regex": re.escape(filters['nomVernaculaire']), "$options": "i"}
 
     if "codeStatut" in filters and filters["codeStatut"]:
-        match_query["codeStatut"] = {"$regex": f"^{filters['codeStatut']}$", "$options": "i"}
+        match_query["codeStatut"] = {"$regex": f"^{re.escape(filters['codeStatut'])}$", "$options": "i"}
 
     return match_query
 
-# LA fonction qui va interroger MongoDB
-def get_results_from_db(filters, col, page=1):
 
-    # Objet de filtre MongoDB
-    match_stage_query = build_mongo_match_stage(filters)
+def build_normalized_match_stage(filters):
+    # Même sémantique que build_mongo_match_stage, sur les champs normalisés :
+    # égalité pour le règne et le statut, préfixe ancré (sensible à la casse, donc indexable) pour le groupe
+    # et la commune, sous-chaîne pour le nom vernaculaire
+    match_query = {}
 
-    # Verifie si un filtre sur le départment a été mis (va influenecr la manière dont les données seront agrégées après)
-    departement_specifie = "codeInseeDepartement" in match_stage_query
+    if "regne" in filters and filters["regne"]:
+        match_query[NORMALIZED_FIELDS["regne"]] = normalize_text(filters["regne"])
 
-    # Si rien n'a été spécifié
-    if not match_stage_query and not ("nomVernaculaire" in filters and filters["nomVernaculaire"]):
-        return {"items": [],
-                "message": "Veuillez spécifier au moins un critère de recherche",
-                "page": page,
-                "per_page": RESULTS_PER_PAGE,
-                "total_items": 0,
-                "total_pages": 0,
-                "query_used": match_stage_query,
-                "aggregation_type": "none"
+    if "groupeTaxoSimple" in filters and filters["groupeTaxoSimple"]:
+        prefix = re.escape(normalize_text(filters["groupeTaxoSimple"]))
+        match_query[NORMALIZED_FIELDS["groupeTaxoSimple"]] = {"$regex": f"^{prefix}"}
+
+    if "codeInseeDepartement" in filters and filters["codeInseeDepartement"]:
+        code_dept_str = filters["codeInseeDepartement"]
+
+        try:
+            match_query["codeInseeDepartement"] = int(code_dept_str)
+        except ValueError:
+            print(f"Avertissement: Code département invalide '{code_dept_str}', ignoré.")
+
+    if "commune" in filters and filters["commune"]:
+        prefix = re.escape(normalize_text(filters["commune"]))
+        match_query[NORMALIZED_FIELDS["commune"]] = {"$regex": f"^{prefix}"}
+
+    if "nomVernaculaire" in filters and filters["nomVernaculaire"]:
+        fragment = re.escape(normalize_text(filters["nomVernaculaire"]))
+        match_query[NORMALIZED_FIELDS["nomVernaculaire"]] = {"$regex": fragment}
+
+    if "codeStatut" in filters and filters["codeStatut"]:
+        # Les codes statuts sont stockés en majuscules (LC, NT, VU...)
+        match_query["codeStatut"] = str(filters["codeStatut"]).strip().upper()
+
+    return match_query
+
+
+# Pipeline sur la collection matérialisée "species_summary" (un document par espèce, construit à l'import).
+# Les champs filtrables y portent les mêmes noms que dans "Nature" : "codeInseeDepartement" y est un tableau,
+# ce qui permet de réutiliser tel quel le $match de build_mongo_match_stage (voir summary_can_serve).
+def build_species_summary_pipeline(match_stage_query):
+    pipeline = []
+
+    if match_stage_query:
+        pipeline.append({"$match": match_stage_query})
+
+    if "codeInseeDepartement" in match_stage_query:
+        code_dept = match_stage_query["codeInseeDepartement"]
+
+        # On ne garde que le détail du département demandé (observations et communes)
+        pipeline.append({
+            "$addFields": {
+                "detailDepartement": {
+                    "$arrayElemAt": [{
+                        "$filter": {
+                            "input": "$departementsDetails",
+                            "as": "detail",
+                            "cond": {"$eq": ["$$detail.departement", code_dept]}
+                        }
+                    }, 0]
                 }
+            }
+        })
+        total_observations = "$detailDepartement.nombreObservations"
+        departements = {"$literal": [code_dept]}
+        communes_details = {
+            "$map": {
+                "input": "$detailDepartement.communes",
+                "as": "commune",
+                "in": {"commune": "$$commune", "departement": code_dept}
+            }
+        }
+        aggregation_type_for_stage = "departement_specifique"
+    else:
+        total_observations = "$totalObservationsEspece"
+        departements = "$codeInseeDepartement"
+        communes_details = {"$literal": []}
+        aggregation_type_for_stage = "nationale_sans_communes"
+
+    # Même format de sortie que la pipeline sur "Nature"
+    pipeline.append({
+        "$project": {
+            "_id": 0,
+            "nomScientifiqueRef": 1,
+            "nomVernaculaire": {"$ifNull": ["$nomVernaculaire", "N/A"]},
+            "regne": 1,
+            "groupeTaxoSimple": 1,
+            "statuts": "$codeStatut",
+            "totalObservationsEspece": total_observations,
+            "departements": departements,
+            "communesDetails": communes_details,
+            "aggregation_type": {"$literal": aggregation_type_for_stage},
+            "sort_priority_nomVernaculaire": 1
+        }
+    })
+
+    return pipeline, aggregation_type_for_stage
+
+
+# Pipeline de regroupement des lignes commune/espèce de "Nature" par espèce
+def build_nature_group_pipeline(match_stage_query):
+    # Verifie si un filtre sur le départment a été mis (va influenecr la manière dont les données seront agrégées après)
+    departement_specifie = "codeInseeDepartement" in match_stage_query
 
     # Étapes de la pipeline d'agrégation MongoDB
     pipeline = []
@@ -175,49 +318,328 @@ def get_results_from_db(filters, col, page=1):
 
     pipeline.append(project_stage) # Ajout de l'étape ci-dessus
 
-    # Copie de la pipeline pour compter le nombre total d'items avant la pagination
-    count_pipeline_after_group = [stage for stage in pipeline if
-                                  "$skip" not in stage and "$limit" not in stage and "$sort" not in stage]
-    # $count pour compter
-    count_pipeline_after_group.append({"$count": "total_items"})
-    count_result = list(col.aggregate(count_pipeline_after_group))
-    total_items = count_result[0]["total_items"] if count_result else 0
+    return pipeline, aggregation_type_for_stage
+
+
+# Ordre d'affichage des résultats ; le nom scientifique départage les ex-aequo pour un ordre stable
+def build_sort_stage():
+    return {
+        "$sort": {
+            "sort_priority_nomVernaculaire": 1,  # Les N/A (valeur 1) en dernier
+            "nomVernaculaire": 1,  # Puis tri alphabétique sur le nom vernaculaire
+            "nomScientifiqueRef": 1
+        }
+    }
+
+
+# Étapes de tri et de pagination, ajoutées après le $project
+def build_page_stages(page):
+    return [
+        build_sort_stage(),
+        {"$skip": (page - 1) * RESULTS_PER_PAGE},
+        {"$limit": RESULTS_PER_PAGE}
+    ]
+
+
+# Choix de la collection et de la pipeline (avant tri et pagination) pour un filtre donné
+# Sans filtre sur la commune ni le statut, une espèce = un document de "species_summary" : pas besoin de $group
+def build_search_pipeline(match_stage_query, col, summary_col=None):
+    if summary_col is not None and not is_local_engine(col) and summary_can_serve(match_stage_query):
+        pipeline, aggregation_type_for_stage = build_species_summary_pipeline(match_stage_query)
+        return summary_col, pipeline, aggregation_type_for_stage
+    pipeline, aggregation_type_for_stage = build_nature_group_pipeline(match_stage_query)
+    return col, pipeline, aggregation_type_for_stage
+
+
+def _empty_results(message, page, match_stage_query, aggregation_type):
+    return {"items": [], "message": message, "page": page, "per_page": RESULTS_PER_PAGE, "total_items": 0,
+            "total_pages": 0, "query_used": match_stage_query, "aggregation_type": aggregation_type}
+
+
+def _results_payload(items, page, total_items, total_pages, match_stage_query, aggregation_type):
+    message_text = f"Page {page} sur {total_pages} ({total_items} espèces trouvées)\n"
+
+    # Curseurs opaques vers la page suivante et la page précédente (voir get_results_by_cursor)
+    next_cursor = encode_cursor("next", items[-1], page + 1) if items and page < total_pages else None
+    prev_cursor = encode_cursor("prev", items[0], page - 1) if items and page > 1 else None
+
+    return {
+        "items": items,
+        "message": message_text,
+        "page": page,
+        "per_page": RESULTS_PER_PAGE,
+        "total_items": total_items,
+        "total_pages": total_pages,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+        "query_used": match_stage_query,
+        "aggregation_type": aggregation_type
+    }
+
+
+# *** PAGINATION PAR CURSEUR (KEYSET) ***
+# Clé de tri des résultats, dans l'ordre de build_sort_stage
+CURSOR_SORT_FIELDS = ["sort_priority_nomVernaculaire", "nomVernaculaire", "nomScientifiqueRef"]
+
+
+def encode_cursor(direction, item, page):
+    # Le curseur contient la clé de tri de l'élément de bordure, le sens et le numéro de la page visée
+    cursor = {"d": direction, "k": [item.get(field) for field in CURSOR_SORT_FIELDS], "p": page}
+    return base64.urlsafe_b64encode(json.dumps(cursor, ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        if decoded["d"] not in ("next", "prev") or len(decoded["k"]) != len(CURSOR_SORT_FIELDS):
+            return None
+        return decoded["d"], decoded["k"], int(decoded["p"])
+    except (ValueError, KeyError, TypeError, UnicodeError):
+        return None
+
+
+def build_keyset_stages(direction, key):
+    # Éléments strictement après (ou avant) la clé, dans l'ordre du tri : comparaison lexicographique
+    # sur (sort_priority_nomVernaculaire, nomVernaculaire, nomScientifiqueRef).
+    # Étapes ajoutées après le $project de la pipeline de recherche (voir get_results_by_cursor)
+    operator = "$gt" if direction == "next" else "$lt"
+    conditions = []
+    for index, field in enumerate(CURSOR_SORT_FIELDS):
+        condition = {previous: key[i] for i, previous in enumerate(CURSOR_SORT_FIELDS[:index])}
+        condition[field] = {operator: key[index]}
+        conditions.append(condition)
+
+    sort_order = 1 if direction == "next" else -1
+    return [
+        {"$match": {"$or": conditions}},
+        {"$sort": {field: sort_order for field in CURSOR_SORT_FIELDS}},
+        {"$limit": RESULTS_PER_PAGE}
+    ]
+
+
+# *** MOTEUR LOCAL ***
+# Avec un LocalSearchEngine (voir moteur_local.py) à la place de la collection "Nature", la liste triée
+# des espèces est calculée en mémoire : les pages en sont de simples tranches, sans pipeline d'agrégation
+def is_local_engine(col):
+    return isinstance(col, LocalSearchEngine)
+
+
+def _local_search_page(col, match_stage_query, page, snapshot_limit):
+    items, aggregation_type_for_stage = col.search_species(match_stage_query)
+    total_items = len(items)
+    snapshot_ids = None
+    if snapshot_limit and total_items <= snapshot_limit:
+        snapshot_ids = [item["nomScientifiqueRef"] for item in items]
 
     if total_items == 0:
-        return {"items": [], "message": "Désolée, je n'ai rien trouvé avec ces critères...", "page": page,
-                "per_page": RESULTS_PER_PAGE, "total_items": 0, "total_pages": 0, "query_used": match_stage_query,
-                "aggregation_type": aggregation_type_for_stage}
+        return _empty_results("Désolée, je n'ai rien trouvé avec ces critères...", page, match_stage_query,
+                              aggregation_type_for_stage), snapshot_ids
 
     total_pages = math.ceil(total_items / RESULTS_PER_PAGE)
+    page = min(page, total_pages)
+    page_items = items[(page - 1) * RESULTS_PER_PAGE:page * RESULTS_PER_PAGE]
+    return _results_payload(page_items, page, total_items, total_pages, match_stage_query,
+                            aggregation_type_for_stage), snapshot_ids
+
+
+# LA fonction qui va interroger MongoDB
+# Si summary_col est fourni, les recherches sans filtre sur la commune sont servies par la collection "species_summary"
+# normalized=True : filtres sur les champs normalisés (voir build_normalized_match_stage)
+# dataset_version : version du jeu de données ; les caches de résultats sont vidés quand elle change
+def get_results_from_db(filters, col, page=1, summary_col=None, normalized=False, dataset_version=None):
+    results_payload, _ = search_with_snapshot(filters, col, page=page, summary_col=summary_col,
+                                              normalized=normalized, snapshot_limit=None,
+                                              dataset_version=dataset_version)
+    return results_payload
+
+
+def _page_cache_key(col, match_stage_query, page):
+    return make_query_key("page", col.full_name, match_stage_query, page)
+
+
+# Comme get_results_from_db, mais retourne aussi la liste ordonnée de tous les nomScientifiqueRef trouvés
+# (None si la recherche dépasse snapshot_limit résultats), calculée dans le même aller-retour que la page.
+# Les recherches identiques simultanées ne sont exécutées qu'une fois (voir single_flight.py)
+@timed_query
+@coalesce
+def search_with_snapshot(filters, col, page=1, summary_col=None, normalized=False,
+                         snapshot_limit=SNAPSHOT_MAX_IDS_PER_SEARCH, dataset_version=None):
+
+    # Objet de filtre MongoDB
+    match_stage_query = build_mongo_match_stage(filters, normalized=normalized)
+
+    # Si rien n'a été spécifié
+    if not match_stage_query and not ("nomVernaculaire" in filters and filters["nomVernaculaire"]):
+        return _empty_results("Veuillez spécifier au moins un critère de recherche", page, match_stage_query,
+                              "none"), None
+
+    col, pipeline, aggregation_type_for_stage = build_search_pipeline(match_stage_query, col, summary_col)
 
     if page < 1:
         page = 1
 
+    # Page (et instantané) déjà calculés pour une autre conversation avec les mêmes filtres
+    page_cache_key = _page_cache_key(col, match_stage_query, page)
+    ids_cache_key = make_query_key("ids", col.full_name, match_stage_query, snapshot_limit)
+    cached_payload = SEARCH_RESULT_CACHE.get(page_cache_key, version=dataset_version)
+    cached_ids = SEARCH_RESULT_CACHE.get(ids_cache_key, version=dataset_version) if snapshot_limit else None
+    if cached_payload is not None and (not snapshot_limit or cached_ids is not None):
+        return cached_payload, cached_ids["ids"] if cached_ids else None
+
+    if is_local_engine(col):
+        results_payload, snapshot_ids = _local_search_page(col, match_stage_query, page, snapshot_limit)
+        if snapshot_limit:
+            SEARCH_RESULT_CACHE.set(ids_cache_key, {"ids": snapshot_ids}, version=dataset_version)
+        SEARCH_RESULT_CACHE.set(page_cache_key, results_payload, version=dataset_version)
+        return results_payload, snapshot_ids
+
+    count_cache_key = make_query_key(col.full_name, match_stage_query)
+    total_items = TOTAL_COUNT_CACHE.get(count_cache_key, version=dataset_version)
+    snapshot_ids = None
+
+    if total_items is None or snapshot_limit:
+        # Un seul aller-retour : le total et la page demandée sont calculés par le même $facet
+        facets = {
+            "total": [{"$count": "total_items"}],
+            "items": build_page_stages(page)
+        }
+        if snapshot_limit:
+            facets["ids"] = [build_sort_stage(), {"$limit": snapshot_limit + 1},
+                             {"$project": {"_id": 0, "nomScientifiqueRef": 1}}]
+
+        facet_result = timed_aggregate(col, pipeline + [{"$facet": facets}], "facet_total_page")
+        facet_result = facet_result[0] if facet_result else {"total": [], "items": []}
+        total_items = facet_result["total"][0]["total_items"] if facet_result["total"] else 0
+        TOTAL_COUNT_CACHE.set(count_cache_key, total_items, version=dataset_version)
+        aggregated_results = facet_result["items"]
+
+        if snapshot_limit and len(facet_result.get("ids", [])) <= snapshot_limit:
+            snapshot_ids = [doc["nomScientifiqueRef"] for doc in facet_result["ids"]]
+        if snapshot_limit:
+            SEARCH_RESULT_CACHE.set(ids_cache_key, {"ids": snapshot_ids}, version=dataset_version)
+    else:
+        aggregated_results = None
+
+    if total_items == 0:
+        results_payload = _empty_results("Désolée, je n'ai rien trouvé avec ces critères...", page,
+                                         match_stage_query, aggregation_type_for_stage)
+        SEARCH_RESULT_CACHE.set(page_cache_key, results_payload, version=dataset_version)
+        return results_payload, snapshot_ids
+
+    total_pages = math.ceil(total_items / RESULTS_PER_PAGE)
+    requested_page = page
+
     if page > total_pages > 0:
         page = total_pages
 
-    # Étape de tri $sort (ajouté dans la pipeline)
-    pipeline.append({
-        "$sort": {
-            "sort_priority_nomVernaculaire": 1,  # Les N/A (valeur 1) en dernier
-            "nomVernaculaire": 1  # Puis tri alphabétique sur le nom vernaculaire
-        }
-    })
+    # Total déjà connu, ou page demandée hors limites : seule la page est calculée
+    if aggregated_results is None or page != requested_page:
+        aggregated_results = timed_aggregate(col, pipeline + build_page_stages(page), "page")
 
-    skip_value = (page - 1) * RESULTS_PER_PAGE
-    pipeline.append({"$skip": skip_value})
-    pipeline.append({"$limit": RESULTS_PER_PAGE})
+    results_payload = _results_payload(aggregated_results, page, total_items, total_pages, match_stage_query,
+                                       aggregation_type_for_stage)
+    SEARCH_RESULT_CACHE.set(page_cache_key, results_payload, version=dataset_version)
+    return results_payload, snapshot_ids
 
-    aggregated_results = list(col.aggregate(pipeline))
-    message_text = f"Page {page} sur {total_pages} ({total_items} espèces trouvées)\n"
 
-    return {
-        "items": aggregated_results,
-            "message": message_text,
-            "page": page,
-            "per_page": RESULTS_PER_PAGE,
-            "total_items": total_items,
-            "total_pages": total_pages,
-            "query_used": match_stage_query,
-            "aggregation_type": aggregation_type_for_stage
-        }
+# Page de résultats servie depuis l'instantané d'une conversation (voir snapshots.py) : seules les espèces
+# de la page sont relues, sans recompter ni trier l'ensemble des résultats
+@timed_query
+def get_results_page_from_snapshot(filters, col, snapshot, page=1, summary_col=None, normalized=False,
+                                   dataset_version=None):
+    match_stage_query = build_mongo_match_stage(filters, normalized=normalized)
+    total_items = snapshot["total_items"]
+
+    if total_items == 0:
+        return _empty_results("Désolée, je n'ai rien trouvé avec ces critères...", page, match_stage_query,
+                              "none")
+
+    total_pages = math.ceil(total_items / RESULTS_PER_PAGE)
+    page = min(max(page, 1), total_pages)
+
+    page_ids = snapshot["ids"][(page - 1) * RESULTS_PER_PAGE:page * RESULTS_PER_PAGE]
+    page_match = dict(match_stage_query, nomScientifiqueRef={"$in": page_ids})
+    col, pipeline, aggregation_type_for_stage = build_search_pipeline(page_match, col, summary_col)
+
+    # Même page que celle d'une recherche classique : le cache global est partagé
+    page_cache_key = _page_cache_key(col, match_stage_query, page)
+    cached_payload = SEARCH_RESULT_CACHE.get(page_cache_key, version=dataset_version)
+    if cached_payload is not None:
+        return cached_payload
+
+    if is_local_engine(col):
+        aggregated_results = col.species_page(match_stage_query, page_ids)
+    else:
+        # Remise dans l'ordre de l'instantané
+        position = {nom: index for index, nom in enumerate(page_ids)}
+        aggregated_results = sorted(timed_aggregate(col, pipeline, "snapshot_page"),
+                                    key=lambda item: position.get(item["nomScientifiqueRef"], len(position)))
+
+    results_payload = _results_payload(aggregated_results, page, total_items, total_pages, match_stage_query,
+                                       aggregation_type_for_stage)
+    SEARCH_RESULT_CACHE.set(page_cache_key, results_payload, version=dataset_version)
+    return results_payload
+
+
+# Pagination par curseur : la page est lue à partir de la clé de tri de l'élément de bordure, sans $skip.
+# Sur "species_summary", les clés de tri sont des champs stockés (index tri_resultats) : le coût ne dépend pas
+# de la profondeur. Sur "Nature", elles ne sont connues qu'après le $group (nomVernaculaire est le $first de
+# l'espèce) : le $match du curseur suit le regroupement de toutes les espèces filtrées, et seul le $skip
+# des pages précédentes est évité. Sans curseur, retourne la première page.
+@timed_query
+@coalesce
+def get_results_by_cursor(filters, col, cursor=None, summary_col=None, normalized=False, dataset_version=None):
+    if not cursor:
+        return get_results_from_db(filters, col, page=1, summary_col=summary_col, normalized=normalized,
+                                   dataset_version=dataset_version)
+
+    decoded = decode_cursor(cursor)
+    if decoded is None:
+        return {"error": "Curseur de pagination invalide."}
+    direction, key, page = decoded
+
+    match_stage_query = build_mongo_match_stage(filters, normalized=normalized)
+    col, pipeline, aggregation_type_for_stage = build_search_pipeline(match_stage_query, col, summary_col)
+    keyset_stages = build_keyset_stages(direction, key)
+
+    cursor_cache_key = make_query_key("cursor", col.full_name, match_stage_query, cursor)
+    cached_payload = SEARCH_RESULT_CACHE.get(cursor_cache_key, version=dataset_version)
+    if cached_payload is not None:
+        return cached_payload
+
+    count_cache_key = make_query_key(col.full_name, match_stage_query)
+    total_items = TOTAL_COUNT_CACHE.get(count_cache_key, version=dataset_version)
+
+    if is_local_engine(col):
+        items, _ = col.search_species(match_stage_query)
+        total_items = len(items)
+        aggregated_results = col.keyset_page(match_stage_query, direction, key, RESULTS_PER_PAGE)
+    elif total_items is None:
+        facet_result = timed_aggregate(col, pipeline + [{
+            "$facet": {
+                "total": [{"$count": "total_items"}],
+                "items": keyset_stages
+            }
+        }], "facet_total_cursor")
+        facet_result = facet_result[0] if facet_result else {"total": [], "items": []}
+        total_items = facet_result["total"][0]["total_items"] if facet_result["total"] else 0
+        TOTAL_COUNT_CACHE.set(count_cache_key, total_items, version=dataset_version)
+        aggregated_results = facet_result["items"]
+    else:
+        aggregated_results = timed_aggregate(col, pipeline + keyset_stages, "cursor")
+
+    if total_items == 0:
+        return _empty_results("Désolée, je n'ai rien trouvé avec ces critères...", 1, match_stage_query,
+                              aggregation_type_for_stage)
+
+    # Page précédente : lue en ordre inverse, remise dans l'ordre d'affichage
+    if direction == "prev" and not is_local_engine(col):
+        aggregated_results.reverse()
+
+    total_pages = math.ceil(total_items / RESULTS_PER_PAGE)
+    page = min(max(page, 1), total_pages)
+
+    results_payload = _results_payload(aggregated_results, page, total_items, total_pages, match_stage_query,
+                                       aggregation_type_for_stage)
+    SEARCH_RESULT_CACHE.set(cursor_cache_key, results_payload, version=dataset_version)
+    return results_payload
@@ -0,0 +1,98 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict
+
+
+def make_query_key(*parts) -> str:
+    """
+    Construit une clé de cache canonique (ordre des clés des dictionnaires normalisé)
+    à partir d'objets JSON-sérialisables : nom de collection, filtre $match, page...
+    """
+    return json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def estimate_size(value) -> int:
+    """
+    Estimation de l'empreinte mémoire d'une valeur : taille de sa sérialisation JSON
+    (longueur directe pour les chaînes et les octets).
+    """
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return len(json.dumps(value, ensure_ascii=False, default=str))
+
+
+class LRUCache:
+    """
+    Cache en mémoire borné en nombre d'entrées (et optionnellement en octets estimés),
+    avec éviction des entrées les moins récemment utilisées. Utilisable depuis plusieurs threads.
+
+    Si une version du jeu de données est passée à get()/set(), le cache est vidé dès que
+    cette version change : les entrées calculées sur l'ancien jeu de données ne sont jamais servies.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version is not None and version != self.version:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+            self.version = version
+
+    def _pop_oldest(self):
+        key, _ = self._data.popitem(last=False)
+        self._bytes -= self._sizes.pop(key, 0)
+        self.evictions += 1
+
+    def get(self, key, default=None, version=None):
+        with self._lock:
+            self._check_version(version)
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value, version=None):
+        size = estimate_size(value) if self.max_bytes else 0
+        with self._lock:
+            self._check_version(version)
+            # Une entrée plus grosse que tout le cache n'est pas conservée
+            if self.max_bytes and size > self.max_bytes:
+                return
+            if key in self._data:
+                self._bytes -= self._sizes.pop(key, 0)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.max_bytes:
+                self._sizes[key] = size
+                self._bytes += size
+            while len(self._data) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+                self._pop_oldest()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._data), "bytes": self._bytes, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
+
+    def __len__(self):
+        return len(self._data)
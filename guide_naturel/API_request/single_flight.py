@@ -0,0 +1,89 @@
+import functools
+import inspect
+import threading
+
+from API_request.result_cache import make_query_key
+
+
+class _Call:
+    """
+    Calcul en cours : les appelants concurrents attendent `done` puis partagent le résultat (ou l'erreur).
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Regroupement des appels concurrents identiques : pour une même clé, un seul appel est exécuté
+    à la fois ; les appelants arrivés pendant son exécution attendent et reçoivent le même résultat.
+    Rien n'est conservé une fois l'appel terminé (ce n'est pas un cache).
+    """
+
+    def __init__(self):
+        self.executed = 0
+        self.coalesced = 0
+
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+# Regroupement partagé par les fonctions de requête de mongo_request.py et recherche.py
+QUERY_FLIGHTS = SingleFlight()
+
+
+def _key_part(value):
+    # Une collection est identifiée par son nom complet (base.collection)
+    if value is None or isinstance(value, (str, int, float, bool, list, tuple, dict)):
+        return value
+    full_name = getattr(value, "full_name", None)
+    return full_name if isinstance(full_name, str) else value
+
+
+def coalesce(func):
+    """
+    Décorateur : les appels concurrents de `func` avec les mêmes arguments (collections comprises)
+    n'exécutent qu'une seule fois la requête, via QUERY_FLIGHTS.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = make_query_key(func.__module__, func.__qualname__,
+                             {name: _key_part(value) for name, value in bound.arguments.items()})
+        return QUERY_FLIGHTS.do(key, func, *args, **kwargs)
+
+    return wrapper
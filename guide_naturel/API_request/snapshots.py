@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Durée de vie d'un instantané de résultats (secondes)
+SNAPSHOT_TTL = 15 * 60
+# Nombre maximal d'instantanés et nombre total d'identifiants d'espèces conservés en mémoire
+SNAPSHOT_MAX_ENTRIES = 2000
+SNAPSHOT_MAX_TOTAL_IDS = 2_000_000
+# Au-delà de ce nombre de résultats, la recherche n'est pas mise en instantané
+SNAPSHOT_MAX_IDS_PER_SEARCH = 20000
+
+
+class ResultSnapshotStore:
+    """
+    Instantanés des résultats d'une conversation : la liste ordonnée des nomScientifiqueRef trouvés
+    lors de la première recherche. Les pages suivantes découpent directement cette liste.
+
+    La mémoire est bornée (nombre d'instantanés et nombre total d'identifiants, éviction LRU)
+    et chaque instantané expire après `ttl` secondes.
+    """
+
+    def __init__(self, ttl: float = SNAPSHOT_TTL, max_entries: int = SNAPSHOT_MAX_ENTRIES,
+                 max_total_ids: int = SNAPSHOT_MAX_TOTAL_IDS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_total_ids = max_total_ids
+
+        self._snapshots = OrderedDict()
+        self._total_ids = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        snapshot = self._snapshots.pop(key)
+        self._total_ids -= len(snapshot["ids"])
+
+    def _evict(self, now: float):
+        # Instantanés expirés
+        for key in [k for k, snapshot in self._snapshots.items() if now - snapshot["created"] > self.ttl]:
+            self._remove(key)
+        # Puis les moins récemment utilisés tant que les limites sont dépassées
+        while self._snapshots and (len(self._snapshots) > self.max_entries or self._total_ids > self.max_total_ids):
+            self._remove(next(iter(self._snapshots)))
+
+    def set(self, conversation_id: str, ids: List[str], total_items: int):
+        now = time.monotonic()
+        with self._lock:
+            if conversation_id in self._snapshots:
+                self._remove(conversation_id)
+            self._snapshots[conversation_id] = {"ids": ids, "total_items": total_items, "created": now}
+            self._total_ids += len(ids)
+            self._evict(now)
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            snapshot = self._snapshots.get(conversation_id)
+            if snapshot is None:
+                return None
+            if now - snapshot["created"] > self.ttl:
+                self._remove(conversation_id)
+                return None
+            self._snapshots.move_to_end(conversation_id)
+            return snapshot
+
+    def delete(self, conversation_id: str):
+        with self._lock:
+            if conversation_id in self._snapshots:
+                self._remove(conversation_id)
+
+    def __len__(self):
+        return len(self._snapshots)
@@ -0,0 +1,130 @@
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from API_request.mongo_request import (
+    DatasetVersionTracker,
+    chart_base_counts,
+    species_by_code_statut,
+    species_by_code_statut_dep,
+    species_by_regne,
+    species_by_regne_and_statut,
+    species_by_regne_and_statut_dep,
+    species_by_regne_dep,
+)
+from API_request.result_cache import estimate_size
+
+# Intervalle minimal (en secondes) entre deux vérifications de la version du jeu de données
+VERSION_CHECK_INTERVAL = 60
+
+# Clés des graphiques acceptées par la route /get_chart_data
+CHART_KEYS = [
+    "especesParRegne",
+    "especesParRegne_dep",
+    "especesParStatutConservation",
+    "especesParStatutConservation_dep",
+    "statutsConservationParRegne",
+    "statutsConservationParRegne_dep",
+]
+
+DEFAULT_CHART_KEY = "especesParRegne"
+
+
+# Construction de chaque graphique à partir des comptes de base (voir chart_base_counts)
+# Les graphiques nationaux sont encapsulés dans une liste, comme attendu par le JavaScript.
+CHART_BUILDERS = {
+    "especesParRegne":
+        lambda col, departements, base_counts: [species_by_regne(col=col, base_counts=base_counts)],
+    "especesParRegne_dep":
+        lambda col, departements, base_counts: species_by_regne_dep(col=col, departements=departements,
+                                                                    base_counts=base_counts),
+    "especesParStatutConservation":
+        lambda col, departements, base_counts: [species_by_code_statut(col=col, base_counts=base_counts)],
+    "especesParStatutConservation_dep":
+        lambda col, departements, base_counts: species_by_code_statut_dep(col=col, departements=departements,
+                                                                          base_counts=base_counts),
+    "statutsConservationParRegne":
+        lambda col, departements, base_counts: species_by_regne_and_statut(col=col, base_counts=base_counts),
+    "statutsConservationParRegne_dep":
+        lambda col, departements, base_counts: species_by_regne_and_statut_dep(col=col, dep=departements,
+                                                                               base_counts=base_counts),
+}
+
+
+def compute_all_charts(col, departements: List[int]) -> Dict[str, object]:
+    """
+    Calcule les six jeux de données Chart.js servis par /get_chart_data à partir d'un seul
+    parcours de la collection (voir chart_base_counts).
+    """
+    base_counts = chart_base_counts(col)
+    return {key: builder(col, departements, base_counts) for key, builder in CHART_BUILDERS.items()}
+
+
+class ChartStatsCache:
+    """
+    Cache en mémoire des données des graphiques de la page d'accueil.
+    Les six graphiques sont calculés ensemble, associés à la version du jeu de données,
+    et ne sont recalculés que lorsque cette version change.
+    """
+
+    def __init__(self, col, departements: List[int], check_interval: float = VERSION_CHECK_INTERVAL,
+                 version_tracker: Optional[DatasetVersionTracker] = None):
+        self.col = col
+        self.departements = departements
+        self.version_tracker = version_tracker or DatasetVersionTracker(col, check_interval=check_interval)
+
+        self._lock = threading.Lock()
+        self._charts: Optional[Dict[str, object]] = None
+        self._version: Optional[str] = None
+        self._bytes = 0
+        self.computed_at: Optional[datetime] = None
+
+        # Même signification que pour LRUCache : lectures servies, recalculs, jeux de graphiques remplacés
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._version
+
+    def get(self, info_key: str):
+        """
+        Retourne les données du graphique demandé (graphique par défaut si la clé est inconnue).
+        """
+        if info_key not in CHART_KEYS:
+            info_key = DEFAULT_CHART_KEY
+
+        with self._lock:
+            version = self.version_tracker.current()
+            if self._charts is None or version != self._version:
+                self.misses += 1
+                if self._charts is not None:
+                    self.evictions += 1
+                print(f"Calcul des statistiques des graphiques (version du jeu de données : {version})")
+                self._charts = compute_all_charts(self.col, self.departements)
+                self._bytes = estimate_size(self._charts)
+                self._version = version
+                self.computed_at = datetime.now(timezone.utc).replace(microsecond=0)
+            else:
+                self.hits += 1
+            return self._charts[info_key]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Statistiques au format de LRUCache.stats(), pour les métriques (une entrée par graphique).
+        """
+        return {"entries": len(self._charts) if self._charts is not None else 0, "bytes": self._bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def invalidate(self):
+        """
+        Force le recalcul des graphiques à la prochaine requête.
+        """
+        with self._lock:
+            if self._charts is not None:
+                self.evictions += 1
+            self._charts = None
+            self._version = None
+            self._bytes = 0
+            self.computed_at = None
@@ -1,9 +1,29 @@
-from flask import Flask, render_template, redirect, url_for, request, jsonify
+from flask import Flask, render_template, redirect, url_for, request, jsonify, make_response
 from flask_cors import CORS
 import uuid
-from thefuzz import process, fuzz
 from API_request.mongo_request import *
 from API_request.recherche import *
+from API_request.stats_cache import CHART_KEYS, DEFAULT_CHART_KEY, ChartStatsCache
+from API_request.index_manager import ensure_indexes, verify_indexes
+from API_request.snapshots import ResultSnapshotStore
+from API_request.conversation_store import create_conversation_store
+from API_request.log_writer import BatchLogWriter
+from API_request.fuzzy import build_fuzzy_matchers
+from API_request.moteur_local import LocalSearchEngine, default_data_path
+from API_request.profilage import ProfiledCollection, profiling_enabled
+from API_request.http_cache import (
+    CACHE_CONTROL_CHARTS,
+    CACHE_CONTROL_FRAGMENTS,
+    CACHE_CONTROL_RESULTS,
+    COMPRESSED_BODIES,
+    conditional_json,
+    conditional_response,
+    etag_for,
+    init_http_cache,
+    not_modified,
+)
+from API_request.metriques import init_metrics, register_cache, register_sources, track_stage
+from API_request.single_flight import QUERY_FLIGHTS
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 import os
@@ -11,6 +31,10 @@ import os
 load_dotenv()
 app = Flask(__name__)
 CORS(app)
+# Compression gzip/brotli des réponses JSON et HTML volumineuses
+init_http_cache(app)
+# Durées des requêtes et route /metrics (format Prometheus)
+init_metrics(app)
 
 # *** CONFIGURATION ***
 MONGO_APP_USER = os.getenv("MONGO_APP_USER")
@@ -19,6 +43,7 @@ MONGO_CLUSTER = os.getenv("MONGO_CLUSTER_URL")
 DB_NAME = os.getenv("DB_NAME", "LeGuideNaturel")
 
 COLLECTION_NAME = "Nature"
+SPECIES_SUMMARY_COLLECTION = "species_summary"
 LOG_COMPLETED_SEARCHES_COLLECTION = "completed_searches"
 LOG_QUESTION_INTERACTIONS_COLLECTION = "question_interactions"
 
@@ -32,8 +57,8 @@ else:
 # *** INITIALISATION MONGODB ***
 mongo_client_instance = None
 collection_instance = None
-completed_searches_log_col = None
-question_interactions_log_col = None
+species_summary_col = None
+bi_log_writer = None
 
 # Tenter la connexion seulement si l'URI a pu être construite
 if MONGO_URI:
@@ -44,8 +69,14 @@ if MONGO_URI:
             db_instance = collection_instance.database
             mongo_client_instance = db_instance.client
 
-            completed_searches_log_col = db_instance[LOG_COMPLETED_SEARCHES_COLLECTION]
-            question_interactions_log_col = db_instance[LOG_QUESTION_INTERACTIONS_COLLECTION]
+            # Logs BI écrits par lots en arrière-plan (LOG_SPILL_PATH : fichier de secours si la file déborde)
+            bi_log_writer = BatchLogWriter(db_instance, spill_path=os.getenv("LOG_SPILL_PATH"))
+
+            # Collection matérialisée (un document par espèce), utilisée seulement si elle a été importée
+            if SPECIES_SUMMARY_COLLECTION in db_instance.list_collection_names():
+                species_summary_col = db_instance[SPECIES_SUMMARY_COLLECTION]
+            else:
+                print(f"Collection '{SPECIES_SUMMARY_COLLECTION}' absente : les recherches utiliseront '{COLLECTION_NAME}'")
 
             print("MongoDB client and collections initialized for Flask app")
         else:
@@ -57,11 +88,130 @@ else:
     print("MongoDB URI n'a pas pu être construite en raison de variables d'environnement manquantes.")
 
 
+# *** VÉRIFICATION DES INDEX ***
+# MONGO_CREATE_INDEXES=1 crée les index manquants au démarrage (nécessite les droits createIndex)
+if collection_instance is not None:
+    try:
+        for indexed_col in [collection_instance, species_summary_col]:
+            if indexed_col is None:
+                continue
+            if os.getenv("MONGO_CREATE_INDEXES") == "1":
+                ensure_indexes(indexed_col)
+            else:
+                verify_indexes(indexed_col)
+    except Exception as e:
+        print(f"Impossible de vérifier les index MongoDB: {e}")
+
+
+# *** MOTEUR DE RECHERCHE ***
+# QUERY_BACKEND=local : recherches et graphiques servis en mémoire depuis Final_data (LOCAL_DATA_PATH, par défaut
+# ../data/Final_data.parquet ou .csv), même sans MongoDB ; les logs et les conversations restent dans MongoDB
+# s'il est configuré
+QUERY_BACKEND = os.getenv("QUERY_BACKEND", "mongo")
+search_collection = collection_instance
+if QUERY_BACKEND == "local":
+    try:
+        search_collection = LocalSearchEngine.from_path(os.getenv("LOCAL_DATA_PATH") or default_data_path())
+        species_summary_col = None
+    except (OSError, ValueError) as e:
+        print(f"Moteur local indisponible ({e}) : les recherches utiliseront MongoDB")
+
+# QUERY_PROFILING=1 : les agrégations plus lentes que QUERY_PROFILING_THRESHOLD_MS sont journalisées avec leur plan
+# d'exécution dans QUERY_PROFILING_LOG (rapport : python -m API_request.profilage)
+if profiling_enabled() and search_collection is not None and not is_local_engine(search_collection):
+    search_collection = ProfiledCollection(search_collection)
+    if species_summary_col is not None:
+        species_summary_col = ProfiledCollection(species_summary_col)
+    print(f"Profilage des requêtes activé (seuil : {search_collection.threshold_ms} ms)")
+
+
+# *** CHAMPS NORMALISÉS ***
+# Les filtres utilisent les champs "ombre" normalisés (indexables) s'ils ont été ajoutés lors de l'import
+use_normalized_fields = False
+if is_local_engine(search_collection):
+    use_normalized_fields = search_collection.has_field("regne_norm")
+elif collection_instance is not None:
+    try:
+        use_normalized_fields = all(
+            c.find_one({"regne_norm": {"$exists": True}}, {"_id": 1}) is not None
+            for c in [collection_instance, species_summary_col] if c is not None
+        )
+    except Exception as e:
+        print(f"Impossible de détecter les champs normalisés: {e}")
+    if not use_normalized_fields:
+        print("Champs normalisés absents : les filtres utiliseront des $regex insensibles à la casse")
+
+
+# *** CORRECTION DES RÉPONSES (FUZZY MATCHING) ***
+# Vocabulaires prétraités une seule fois au démarrage (communes et noms vernaculaires inclus)
+fuzzy_matchers = build_fuzzy_matchers(search_collection)
+
+
 departements_a_analyser = [21, 25, 39, 58, 70, 71, 89, 90]
 
+# *** VERSION DU JEU DE DONNÉES ***
+# Partagée par le cache des graphiques et le cache global des résultats de recherche :
+# un nouvel import invalide les deux
+dataset_version_tracker = None
+if search_collection is not None:
+    dataset_version_tracker = DatasetVersionTracker(search_collection)
+
+
+def current_dataset_version():
+    return dataset_version_tracker.current() if dataset_version_tracker is not None else None
+
 
-# *** STOCKAGE EN MÉMOIRE DES CONVERSATIONS ***
-conversations = {}
+# "species_summary" n'est utilisé que s'il a été chargé avec la même version que "Nature" (voir chargement.py) :
+# un résumé d'un autre jeu de données donnerait d'autres résultats que la collection complète
+summary_version_tracker = None
+if species_summary_col is not None:
+    summary_version_tracker = DatasetVersionTracker(species_summary_col)
+    if summary_version_tracker.current() != current_dataset_version():
+        print(f"Version de '{SPECIES_SUMMARY_COLLECTION}' différente de celle de '{COLLECTION_NAME}' : "
+              f"les recherches utiliseront '{COLLECTION_NAME}'")
+
+
+def current_summary_col():
+    if summary_version_tracker is None or summary_version_tracker.current() != current_dataset_version():
+        return None
+    return species_summary_col
+
+
+# *** CACHE DES STATISTIQUES DES GRAPHIQUES ***
+chart_stats_cache = None
+if search_collection is not None:
+    chart_stats_cache = ChartStatsCache(search_collection, departements_a_analyser,
+                                        version_tracker=dataset_version_tracker)
+
+
+# *** STOCKAGE DES CONVERSATIONS ***
+# CONVERSATION_STORE=mongo : état partagé entre les workers (collection "conversations" avec index TTL)
+# sinon stockage en mémoire du processus, borné et à expiration
+CONVERSATION_STORE_BACKEND = os.getenv("CONVERSATION_STORE", "memory")
+if CONVERSATION_STORE_BACKEND == "mongo" and collection_instance is None:
+    print("Stockage 'mongo' des conversations impossible sans MongoDB : stockage en mémoire utilisé")
+    CONVERSATION_STORE_BACKEND = "memory"
+try:
+    conversations = create_conversation_store(
+        CONVERSATION_STORE_BACKEND, db=collection_instance.database if collection_instance is not None else None
+    )
+except Exception as e:
+    print(f"Impossible d'initialiser le stockage '{CONVERSATION_STORE_BACKEND}' des conversations: {e}")
+    conversations = create_conversation_store("memory")
+
+# Instantanés des résultats (liste ordonnée des espèces) pour paginer sans refaire l'agrégation
+result_snapshots = ResultSnapshotStore()
+
+
+# *** MÉTRIQUES ***
+# Caches et composants dont l'état est lu à chaque collecte de /metrics
+register_cache("search_results", SEARCH_RESULT_CACHE)
+register_cache("total_counts", TOTAL_COUNT_CACHE)
+register_cache("compressed_bodies", COMPRESSED_BODIES)
+if chart_stats_cache is not None:
+    register_cache("chart_stats", chart_stats_cache)
+register_sources(flights=QUERY_FLIGHTS, conversations=conversations, snapshots=result_snapshots,
+                 log_writer=bi_log_writer)
 
 
 # *** ROUTES FLASK ***
@@ -91,31 +241,33 @@ def apropos():
 def get_chart_data():
     info_key = request.args.get('info')
 
-    if info_key == "especesParRegne":
-        data = [species_by_regne(col=collection_instance)]
-    elif info_key == "especesParRegne_dep":
-        data = species_by_regne_dep(col=collection_instance, departements=departements_a_analyser)
-    elif info_key == "especesParStatutConservation":
-        data = [species_by_code_statut(col=collection_instance)]
-    elif info_key == "especesParStatutConservation_dep":
-        data = species_by_code_statut_dep(col=collection_instance, departements=departements_a_analyser)
-    elif info_key == "statutsConservationParRegne":
-        data = species_by_regne_and_statut(col=collection_instance)
-    elif info_key == "statutsConservationParRegne_dep":
-        data = species_by_regne_and_statut_dep(col=collection_instance, dep=departements_a_analyser)
-    else:
-        data = [species_by_regne(col=collection_instance)]
+    if chart_stats_cache is None:
+        return jsonify({"error": "Database connection not available."}), 503
+
+    if info_key not in CHART_KEYS:
+        info_key = DEFAULT_CHART_KEY
+
+    # ETag dérivé de la version du jeu de données : rien n'est calculé si le client a déjà ces données
+    etag = etag_for("chart", current_dataset_version(), info_key)
+    response = not_modified(etag, CACHE_CONTROL_CHARTS)
+    if response is not None:
+        return response
+
+    # Les six graphiques sont calculés une seule fois par version du jeu de données
+    with track_stage("get_chart_data", "graphiques"):
+        data = chart_stats_cache.get(info_key)
 
-    return data
+    with track_stage("get_chart_data", "serialisation"):
+        return conditional_json(data, CACHE_CONTROL_CHARTS, etag=etag, last_modified=chart_stats_cache.computed_at)
 
 @app.route('/header.html')
 def get_header_html_fragment():
-    return render_template('header.html')
+    return conditional_response(make_response(render_template('header.html')), CACHE_CONTROL_FRAGMENTS)
 
 
 @app.route('/footer.html')
 def get_footer_html_fragment():
-    return render_template('footer.html')
+    return conditional_response(make_response(render_template('footer.html')), CACHE_CONTROL_FRAGMENTS)
 
 
 # *** ENDPOINTS API POUR LE CHATBOT ***
@@ -128,11 +280,11 @@ def start_chat_endpoint():
     initial_question_data = QUESTIONS_FLOW.get(initial_question_id)
 
     if initial_question_data:
-        conversations[conversation_id] = {
+        conversations.save(conversation_id, {
             "current_question_id": initial_question_id,
             "answers": {},
             "mode": "questioning"
-        }
+        })
         is_skippable = initial_question_data.get("skippable", False)
         return jsonify({
             "conversation_id": conversation_id,
@@ -153,7 +305,8 @@ def handle_message():
     if not all([user_answer_raw is not None, conversation_id]):
         return jsonify({"error": "Message or conversation_id missing."}), 400
 
-    conv_data = conversations.get(conversation_id)
+    with track_stage("handle_message", "conversation"):
+        conv_data = conversations.get(conversation_id)
     if not conv_data:
         return jsonify({"error": "Conversation not found or expired."}), 404
 
@@ -181,27 +334,28 @@ def handle_message():
         action_taken_for_log = "skipped"
 
     # Log de l'interaction avec la question (skippée ou non) - pour question_interactions
-    if question_interactions_log_col is not None:  # Vérifie si la collection de log est initialisée
-        try:
-            question_interactions_log_col.insert_one({
+    if bi_log_writer is not None:  # Vérifie si l'écriture des logs est initialisée
+        with track_stage("handle_message", "log"):
+            bi_log_writer.log(LOG_QUESTION_INTERACTIONS_COLLECTION, {
                 "timestamp": datetime.now(timezone.utc),
                 "conversation_id": conversation_id,
                 "question_id": current_question_id,
                 "action_taken": action_taken_for_log
             })
-        except Exception as e:
-            print(f"Erreur lors du logging de l'interaction question: {e}")
 
     # Traitement et stockage de la réponse - pour completed_searches
     value_to_store = user_answer_raw.strip()  # Stocker la valeur après strip
     if action_taken_for_log == "answered":  # On traite/stocke seulement si ce n'est pas un skip effectif
-        if param_to_store in KNOWN_VALUES_FOR_FUZZY_MATCHING and value_to_store:  # value_to_store ici est la version strip()
-            choices = KNOWN_VALUES_FOR_FUZZY_MATCHING[param_to_store]
-            best_match, score = process.extractOne(value_to_store, choices,
-                                                   scorer=fuzz.WRatio)  # Match sur la valeur strip()
+        matcher = fuzzy_matchers.get(param_to_store)
+        # Pas de correction si la saisie trouve déjà des résultats telle quelle (préfixe ou partie d'un nom) ;
+        # sans champs normalisés, les accents comptent ("mammiferes" ne trouve pas "Mammifères")
+        if (matcher is not None and value_to_store
+                and not matcher.already_matches(value_to_store, fold_accents=use_normalized_fields)):
+            with track_stage("handle_message", "fuzzy"):
+                best_match, score = matcher.extract_one(value_to_store) or (None, 0)  # Match sur la valeur strip()
             print(
                 f"Fuzzy match for '{param_to_store}': input='{value_to_store}', best_match='{best_match}', score={score}")
-            if score >= FUZZY_MATCH_THRESHOLD:
+            if best_match is not None and score >= FUZZY_MATCH_THRESHOLDS.get(param_to_store, FUZZY_MATCH_THRESHOLD):
                 value_to_store = best_match  # La valeur corrigée est stockée
                 print(f"Correction applied: '{user_answer_raw.strip()}' -> '{value_to_store}'")
             # Si le score est trop bas, value_to_store reste la valeur originale (après strip)
@@ -216,30 +370,39 @@ def handle_message():
         # Préparer les filtres actifs (ceux où une valeur a été effectivement stockée)
         active_filters = {k: v for k, v in conv_data.get("answers", {}).items() if v is not None and v != ""}
 
-        results_payload = get_results_from_db(active_filters, col=collection_instance, page=1)
-        conv_data["mode"] = "results_displayed"
+        with track_stage("handle_message", "recherche"):
+            results_payload, snapshot_ids = search_with_snapshot(active_filters, col=search_collection, page=1,
+                                                                 summary_col=current_summary_col(),
+                                                                 normalized=use_normalized_fields,
+                                                                 dataset_version=current_dataset_version())
+        with track_stage("handle_message", "conversation"):
+            if snapshot_ids is not None:
+                result_snapshots.set(conversation_id, snapshot_ids, results_payload.get("total_items", 0))
+            conv_data["mode"] = "results_displayed"
+            conversations.save(conversation_id, conv_data)
 
         # Log de la recherche complétée - completed_searches
-        if completed_searches_log_col is not None:
-            try:
-                completed_searches_log_col.insert_one({
+        if bi_log_writer is not None:
+            with track_stage("handle_message", "log"):
+                bi_log_writer.log(LOG_COMPLETED_SEARCHES_COLLECTION, {
                     "timestamp": datetime.now(timezone.utc),
                     "conversation_id": conversation_id,
                     "filters_applied": active_filters,  # Logger uniquement les filtres actifs
                     "results_count": results_payload.get("total_items", 0)
                 })
-            except Exception as e:
-                print(f"Erreur lors du logging de la recherche complétée: {e}")
 
-        return jsonify({
-            "results_data": results_payload,
-            "is_final_questions": True,
-            "conversation_id": conversation_id
-        })
+        with track_stage("handle_message", "serialisation"):
+            return jsonify({
+                "results_data": results_payload,
+                "is_final_questions": True,
+                "conversation_id": conversation_id
+            })
 
     elif next_question_id and next_question_id in QUESTIONS_FLOW:
         next_question_config = QUESTIONS_FLOW.get(next_question_id)
         conv_data["current_question_id"] = next_question_id
+        with track_stage("handle_message", "conversation"):
+            conversations.save(conversation_id, conv_data)
         is_next_skippable = next_question_config.get("skippable", False)
         return jsonify({
             "question": {"text": next_question_config["text"], "id": next_question_id,
@@ -252,30 +415,39 @@ def handle_message():
         active_filters_fallback = {k: v for k, v in active_answers.items() if v is not None and v != ""}
 
         if active_filters_fallback:  # S'il y a au moins un filtre actif
-            results_payload = get_results_from_db(active_filters_fallback, col=collection_instance, page=1)
-            conv_data["mode"] = "results_displayed"
+            with track_stage("handle_message", "recherche"):
+                results_payload, snapshot_ids = search_with_snapshot(active_filters_fallback, col=search_collection,
+                                                                     page=1, summary_col=current_summary_col(),
+                                                                     normalized=use_normalized_fields,
+                                                                     dataset_version=current_dataset_version())
+            with track_stage("handle_message", "conversation"):
+                if snapshot_ids is not None:
+                    result_snapshots.set(conversation_id, snapshot_ids, results_payload.get("total_items", 0))
+                conv_data["mode"] = "results_displayed"
+                conversations.save(conversation_id, conv_data)
             # Log aussi cette recherche si elle produit des résultats
-            if completed_searches_log_col:
-                try:
-                    completed_searches_log_col.insert_one({
+            if bi_log_writer is not None:
+                with track_stage("handle_message", "log"):
+                    bi_log_writer.log(LOG_COMPLETED_SEARCHES_COLLECTION, {
                         "timestamp": datetime.now(timezone.utc),
                         "conversation_id": conversation_id,
                         "filters_applied": active_filters_fallback,
                         "results_count": results_payload.get("total_items", 0)
                     })
-                except Exception as e:
-                    print(f"Erreur lors du logging de la recherche (fallback): {e}")
-            return jsonify({"results_data": results_payload, "is_final_questions": True,
-                            "conversation_id": conversation_id,
-                            "warning": "Chatbot flow ended unexpectedly, showing results."})
+            with track_stage("handle_message", "serialisation"):
+                return jsonify({"results_data": results_payload, "is_final_questions": True,
+                                "conversation_id": conversation_id,
+                                "warning": "Chatbot flow ended unexpectedly, showing results."})
 
-        conversations.pop(conversation_id, None)  # Pas de réponses, pas de résultats, fin de la conversation
+        result_snapshots.delete(conversation_id)
+        conversations.delete(conversation_id)  # Pas de réponses, pas de résultats, fin de la conversation
         return jsonify({"error": "Chatbot flow error or no answers to process.", "is_final_questions": True}), 500
 
 
 @app.route('/chat/results/<conversation_id>/page/<int:page_num>', methods=['GET'])
 def get_paginated_results(conversation_id, page_num):
-    conv_data = conversations.get(conversation_id)
+    with track_stage("get_paginated_results", "conversation"):
+        conv_data = conversations.get(conversation_id)
     if not conv_data:
         return jsonify({"error": "Conversation not found or session expired."}), 404
 
@@ -288,21 +460,65 @@ def get_paginated_results(conversation_id, page_num):
     filters = conv_data.get("answers", {})  # Utiliser .get avec une valeur par défaut
     active_filters_for_pagination = {k: v for k, v in filters.items() if v is not None and v != ""}
 
-    # S'assurer que collection_instance est disponible
-    if collection_instance is None:
+    # S'assurer que la collection (ou le moteur local) est disponible
+    if search_collection is None:
         return jsonify({"error": "Database connection not available."}), 503
 
-    results_payload = get_results_from_db(active_filters_for_pagination, col=collection_instance, page=page_num)
+    # Instantané de la première recherche s'il est encore en mémoire, sinon nouvelle agrégation
+    snapshot = result_snapshots.get(conversation_id)
+    with track_stage("get_paginated_results", "recherche"):
+        if snapshot is not None:
+            results_payload = get_results_page_from_snapshot(active_filters_for_pagination, col=search_collection,
+                                                             snapshot=snapshot, page=page_num,
+                                                             summary_col=current_summary_col(),
+                                                             normalized=use_normalized_fields,
+                                                             dataset_version=current_dataset_version())
+        else:
+            results_payload = get_results_from_db(active_filters_for_pagination, col=search_collection,
+                                                  page=page_num, summary_col=current_summary_col(),
+                                                  normalized=use_normalized_fields,
+                                                  dataset_version=current_dataset_version())
+
+    with track_stage("get_paginated_results", "serialisation"):
+        return conditional_json({
+            "results_data": results_payload,
+            "is_final_questions": True,
+            "conversation_id": conversation_id
+        }, CACHE_CONTROL_RESULTS)
+
+
+# Pagination par curseur : ?cursor=<next_cursor ou prev_cursor d'une réponse précédente>
+@app.route('/chat/results/<conversation_id>/cursor', methods=['GET'])
+def get_cursor_results(conversation_id):
+    conv_data = conversations.get(conversation_id)
+    if not conv_data:
+        return jsonify({"error": "Conversation not found or session expired."}), 404
+
+    if "answers" not in conv_data or conv_data.get("mode") != "results_displayed":
+        return jsonify({"error": "No search filters associated with this session or results not yet processed."}), 400
+
+    if search_collection is None:
+        return jsonify({"error": "Database connection not available."}), 503
+
+    filters = conv_data.get("answers", {})
+    active_filters_for_pagination = {k: v for k, v in filters.items() if v is not None and v != ""}
+
+    results_payload = get_results_by_cursor(active_filters_for_pagination, col=search_collection,
+                                            cursor=request.args.get('cursor'), summary_col=current_summary_col(),
+                                            normalized=use_normalized_fields,
+                                            dataset_version=current_dataset_version())
+    if "error" in results_payload:
+        return jsonify(results_payload), 400
 
-    return jsonify({
+    return conditional_json({
         "results_data": results_payload,
         "is_final_questions": True,
         "conversation_id": conversation_id
-    })
+    }, CACHE_CONTROL_RESULTS)
 
 
 if __name__ == '__main__':
-    if collection_instance is not None:
+    if search_collection is not None:
         app.run(debug=True)
     else:
         print("L'application Flask n'a pas pu démarrer en raison d'un problème de connexion à MongoDB.")
@@ -0,0 +1,197 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Générateur d'extractions INPN synthétiques, pour tester le prétraitement et les recherches
+# à 10x ou 100x le volume de l'extraction réelle
+# mêmes colones que les csv INPN lus par agg_all_csvs, et un fichier bdc_statuts associé
+#
+# utilisation :
+#   python generateurINPN.py --lignes 5000000 --graine 1
+#   python preTraitementData.py --inpn-dir ..\data\extractINPN_synthetique --bdc-statuts ..\data\bdc_statuts_synthetique.csv
+
+# dossier et fichier de statuts générés par défaut (l'extraction réelle n'est jamais écrasée)
+SORTIE_DIR = Path(r"..\data\extractINPN_synthetique")
+STATUTS_CSV = Path(r"..\data\bdc_statuts_synthetique.csv")
+
+# règnes et groupes simples, avec la part des espèces de chaque règne
+# les trois derniers règnes sont retirés par le prétraitement
+REGNES = {
+    "Animalia": (0.52, ["Oiseaux", "Mammifères", "Insectes et araignées", "Amphibiens et reptiles", "Poissons",
+                        "Escargots et autres mollusques", "Crabes, crevettes, cloportes et mille-pattes"]),
+    "Plantae": (0.33, ["Plantes, mousses et fougères"]),
+    "Fungi": (0.12, ["Champignons et lichens"]),
+    "Bacteria": (0.01, ["Autres"]),
+    "Chromista": (0.01, ["Autres"]),
+    "Protozoa": (0.01, ["Autres"]),
+}
+DEPARTEMENTS = [21, 25, 39, 58, 70, 71, 89, 90]
+# statuts officiels, statuts hors liste (retirés par le prétraitement) et valeurs des statuts de protection
+CODES_STATUT = ["LC", "NT", "VU", "EN", "CR", "EW", "EX"]
+CODES_HORS_LISTE = ["DD", "NA", "NE"]
+
+# exposants des lois de Zipf : fréquence des espèces (quelques espèces très communes, une longue traîne
+# d'espèces rares) et taille des communes (quelques villes concentrent les observations)
+ZIPF_ESPECES = 1.1
+ZIPF_COMMUNES = 0.9
+# part des lignes à cheval sur plusieurs départements, sans commune ou sans nom scientifique
+PART_MULTI_DEPARTEMENTS = 0.01
+PART_SANS_COMMUNE = 0.005
+PART_SANS_NOM = 0.002
+# nombre de lignes générées à la fois (mémoire bornée quel que soit le volume demandé)
+BLOC = 500_000
+
+SYLLABES = ["ba", "bé", "ca", "ço", "dal", "é", "fa", "gè", "li", "lon", "ma", "mé", "na", "ni", "pa", "ra",
+            "rè", "sa", "ta", "ti", "va", "vi", "ro", "mon", "char", "bel", "fon", "gny", "ville", "court"]
+PREFIXES_COMMUNES = ["Saint-", "Sainte-", "Le ", "La ", "Les ", "Villers-", "", "", "", ""]
+NOMS_VERNACULAIRES = ["Petit", "Grand", "Commun", "des bois", "des prés", "à ailes", "Noir", "Doré", "de Bourgogne",
+                      "du Jura", "rayé", "élégant"]
+
+
+def _mot(rng: np.random.Generator, syllabes: int) -> str:
+    return "".join(rng.choice(SYLLABES, size=syllabes))
+
+
+# poids d'une loi de Zipf sur n rangs, dans un ordre aléatoire
+def _poids_zipf(n: int, exposant: float, rng: np.random.Generator) -> np.ndarray:
+    poids = 1.0 / np.arange(1, n + 1) ** exposant
+    return rng.permutation(poids / poids.sum())
+
+
+# référentiel des espèces : plus une espèce est rare, moins elle a de nom vernaculaire et de départements,
+# et plus elle a de chances d'être menacée
+def generer_especes(nombre: int, rng: np.random.Generator) -> pd.DataFrame:
+    regnes = list(REGNES)
+    parts = np.array([REGNES[regne][0] for regne in regnes])
+    tirage_regnes = rng.choice(regnes, size=nombre, p=parts / parts.sum())
+    frequences = _poids_zipf(nombre, ZIPF_ESPECES, rng)
+    # rang de rareté entre 0 (la plus commune) et 1 (la plus rare)
+    rarete = frequences.argsort()[::-1].argsort() / max(nombre - 1, 1)
+
+    especes = []
+    for cd_nom, (regne, rare) in enumerate(zip(tirage_regnes, rarete), start=1):
+        groupe = rng.choice(REGNES[regne][1])
+        genre = _mot(rng, 3).capitalize()
+        a_nom = rng.random() > 0.15 + 0.5 * rare
+        nombre_departements = len(DEPARTEMENTS) if rare < 0.3 else int(rng.integers(1, 4))
+        especes.append({
+            "cdNom": cd_nom,
+            "nomScientifiqueRef": f"{genre} {_mot(rng, 2)} {cd_nom}",
+            "nomVernaculaire": f"{_mot(rng, 2).capitalize()} {rng.choice(NOMS_VERNACULAIRES)}" if a_nom else None,
+            "regne": regne,
+            "groupeTaxoSimple": groupe,
+            "groupeTaxoAvance": f"{groupe} - {genre}",
+            "departements": rng.choice(DEPARTEMENTS, size=nombre_departements, replace=False).tolist(),
+            "rarete": rare,
+        })
+    df = pd.DataFrame(especes)
+    df["frequence"] = frequences
+    return df
+
+
+# communes et leur département ; le poids d'une commune (Zipf) donne sa part des observations
+def generer_communes(nombre: int, rng: np.random.Generator) -> pd.DataFrame:
+    noms = set()
+    while len(noms) < nombre:
+        noms.add(f"{rng.choice(PREFIXES_COMMUNES)}{_mot(rng, int(rng.integers(2, 4))).capitalize()}")
+    communes = pd.DataFrame({"commune": sorted(noms), "codeInseeDepartement": rng.choice(DEPARTEMENTS, size=nombre)})
+    communes["poids"] = _poids_zipf(nombre, ZIPF_COMMUNES, rng)
+    return communes
+
+
+# tire `n` observations : la commune selon son poids, puis l'espèce parmi celles présentes dans le département
+# de la commune, selon sa fréquence
+def _tirer_observations(n: int, especes: pd.DataFrame, communes: pd.DataFrame,
+                        poids_par_departement: dict, rng: np.random.Generator) -> pd.DataFrame:
+    lieux = communes.iloc[rng.choice(len(communes), size=n, p=communes["poids"].to_numpy())].reset_index(drop=True)
+    indices = np.empty(n, dtype=np.int64)
+    for departement, poids in poids_par_departement.items():
+        masque = (lieux["codeInseeDepartement"] == departement).to_numpy()
+        indices[masque] = rng.choice(len(especes), size=int(masque.sum()), p=poids)
+
+    df = especes.iloc[indices][["cdNom", "nomScientifiqueRef", "nomVernaculaire", "regne", "groupeTaxoSimple",
+                                "groupeTaxoAvance"]].reset_index(drop=True)
+    df["commune"] = lieux["commune"]
+    df["codeInseeDepartement"] = lieux["codeInseeDepartement"].astype(str)
+
+    # lignes imparfaites, comme dans l'extraction réelle
+    multi = rng.random(n) < PART_MULTI_DEPARTEMENTS
+    df.loc[multi, "codeInseeDepartement"] = df.loc[multi, "codeInseeDepartement"] + " " + \
+        rng.choice([str(d) for d in DEPARTEMENTS], size=int(multi.sum()))
+    df.loc[rng.random(n) < PART_SANS_COMMUNE, "commune"] = None
+    df.loc[rng.random(n) < PART_SANS_NOM, "nomScientifiqueRef"] = None
+    return df
+
+
+# écrit `lignes` observations réparties dans `fichiers` csv, et retourne les référentiels utilisés
+def ecrire_extraction(dossier: Path, lignes: int, fichiers: int = 4, especes: int = 5000, communes: int = 2000,
+                      graine: int = 42) -> dict:
+    rng = np.random.default_rng(graine)
+    table_especes = generer_especes(especes, rng)
+    table_communes = generer_communes(communes, rng)
+
+    poids_par_departement = {}
+    for departement in DEPARTEMENTS:
+        presentes = table_especes["departements"].map(lambda deps: departement in deps).to_numpy()
+        poids = np.where(presentes, table_especes["frequence"].to_numpy(), 0.0)
+        poids_par_departement[departement] = poids / poids.sum()
+
+    dossier.mkdir(parents=True, exist_ok=True)
+    numero_ligne = 0
+    for numero, taille in enumerate(np.array_split(np.arange(lignes), fichiers)):
+        chemin = dossier / f"extraction_{numero:03d}.csv"
+        print(f"Writing {chemin} ({len(taille)} lignes)...")
+        for debut in range(0, max(len(taille), 1), BLOC):
+            n = min(BLOC, len(taille) - debut)
+            df = _tirer_observations(n, table_especes, table_communes, poids_par_departement, rng)
+            # colones de l'extraction non retenues par le prétraitement
+            df.insert(0, "idSINPOccTax", [f"synth-{i}" for i in range(numero_ligne, numero_ligne + n)])
+            df["dateObservation"] = (pd.Timestamp("1990-01-01") +
+                                     pd.to_timedelta(rng.integers(0, 12_500, size=n), unit="D")).strftime("%Y-%m-%d")
+            df.to_csv(chemin, mode='w' if debut == 0 else 'a', index=False, header=debut == 0)
+            numero_ligne += n
+
+    return {"especes": table_especes, "communes": table_communes}
+
+
+# fichier bdc_statuts : 60 % des espèces ont un statut de liste rouge (menace plus probable pour les espèces rares),
+# certaines ont plusieurs lignes (statuts de protection "true", codes hors liste)
+def ecrire_statuts(path: Path, especes: pd.DataFrame, graine: int = 42):
+    rng = np.random.default_rng(graine + 1)
+    lignes = []
+    for espece in especes.itertuples():
+        if rng.random() < 0.6:
+            menace = min(int(rng.exponential(0.6 + 2 * espece.rarete)), len(CODES_STATUT) - 1)
+            code = CODES_STATUT[menace] if rng.random() > 0.1 else rng.choice(CODES_HORS_LISTE)
+            lignes.append((espece.cdNom, code, "Liste rouge régionale"))
+        if rng.random() < 0.2:
+            lignes.append((espece.cdNom, "true", "Protection régionale"))
+        if rng.random() < 0.05:
+            lignes.append((espece.cdNom, None, "Réglementation"))
+
+    statuts = pd.DataFrame(lignes, columns=["CD_NOM", "CODE_STATUT", "LB_TYPE_STATUT"])
+    statuts.insert(1, "CD_REF", statuts["CD_NOM"])
+    # lignes dans un ordre quelconque : le premier statut rencontré par espèce est gardé par le prétraitement
+    statuts = statuts.sample(frac=1, random_state=graine).reset_index(drop=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    statuts.to_csv(path, index=False)
+    print(f"Writing {path} ({len(statuts)} lignes)...")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Génération d'extractions INPN synthétiques")
+    parser.add_argument("--lignes", type=int, default=1_000_000, help="nombre total d'observations")
+    parser.add_argument("--graine", type=int, default=42, help="graine du générateur (même graine, mêmes fichiers)")
+    parser.add_argument("--fichiers", type=int, default=4, help="nombre de csv de l'extraction")
+    parser.add_argument("--especes", type=int, default=5000, help="nombre d'espèces du référentiel")
+    parser.add_argument("--communes", type=int, default=2000, help="nombre de communes")
+    parser.add_argument("--sortie", type=Path, default=SORTIE_DIR, help="dossier des csv générés")
+    parser.add_argument("--statuts", type=Path, default=STATUTS_CSV, help="fichier bdc_statuts généré")
+    args = parser.parse_args()
+
+    referentiels = ecrire_extraction(args.sortie, args.lignes, fichiers=args.fichiers, especes=args.especes,
+                                     communes=args.communes, graine=args.graine)
+    ecrire_statuts(args.statuts, referentiels["especes"], graine=args.graine)
+    print("Done")
@@ -1,75 +1,447 @@
 import os
 import glob
+import json
+import hashlib
+import argparse
+import shutil
+import tempfile
+import importlib.util
+import unicodedata
 import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from datetime import datetime, timezone
 
+# dossier des extractions INPN de la région
+INPN_DIR = r"../data/extractINPN_bourgogneFrancheComte_04112024"
+# statuts de conservation (second csv)
+BDC_STATUTS_CSV = r"..\data\bdc_statuts_18.csv"
 
-# aggrège tous les csv du dossier BFC
-def agg_all_csvs(out: Path):
-    base_dir = r"../data/extractINPN_bourgogneFrancheComte_04112024"
+# suivi des étapes : empreintes des entrées et des paramètres de chaque étape déjà calculée
+MANIFEST_PATH = Path(r"..\data\pipeline_manifest.json")
+# résultats partiels par fichier INPN (mode flux), réutilisés tant que le fichier ne change pas
+PARTIELS_DIR = Path(r"..\data\partiels")
+# version du jeu de données produit, à reporter dans la collection "dataset_meta" lors de l'import
+VERSION_PATH = Path(r"..\data\dataset_version.json")
+# à incrémenter quand les règles de filtrage ou d'agrégation changent : toutes les étapes sont recalculées
+PIPELINE_VERSION = 1
 
-    csv_files = glob.glob(os.path.join(base_dir, "*.csv"))
+# colones d'intérêts des extractions INPN
+INPN_COLUMNS = ["cdNom", "nomScientifiqueRef", "nomVernaculaire", "regne",
+                "groupeTaxoSimple", "groupeTaxoAvance", "commune", "codeInseeDepartement"]
 
-    # récupère juste les colones d'intérêts
-    header = ["cdNom", "nomScientifiqueRef", "nomVernaculaire", "regne",
-              "groupeTaxoSimple", "groupeTaxoAvance", "commune", "codeInseeDepartement"]
+# types explicites pour la lecture en flux : catégories pour les colones à peu de valeurs distinctes
+INPN_DTYPES = {"cdNom": "Int64", "nomScientifiqueRef": "object", "nomVernaculaire": "object",
+               "regne": "category", "groupeTaxoSimple": "category", "groupeTaxoAvance": "category",
+               "commune": "object", "codeInseeDepartement": "category"}
+
+# regnes qui n'ont pas d'intérêt pour notre site
+REGNES_EXCLUS = ["Bacteria", "Chromista", "Protozoa"]
+
+# une ligne par espèce et par commune
+CLES_ESPECE_COMMUNE = ["commune", "nomScientifiqueRef"]
+
+# formats des fichiers intermédiaires (all_data, merge_espece, Final_data)
+# parquet : colonnaire, types conservés entre les étapes (nécessite pyarrow)
+FORMATS = ["csv", "parquet"]
+# colones stockées en dictionnaire (catégories pandas) dans les fichiers parquet
+DICTIONARY_COLUMNS = ["regne", "regne_norm", "groupeTaxoSimple", "groupeTaxoSimple_norm", "groupeTaxoAvance",
+                      "codeInseeDepartement", "codeStatut"]
+
+# nombre de lignes lues à la fois en mode flux
+CHUNK_SIZE = 200_000
+# nombre de parts (selon la commune, ou l'espèce pour species_summary) agrégées séparément en mode flux :
+# la mémoire nécessaire est celle d'une part, pas celle de toute l'extraction
+PARTITIONS = 16
+
+
+# chemin d'un fichier de données dans le format choisi
+def _chemin_data(nom: str, format: str = "csv") -> Path:
+    return Path(rf"..\data\{nom}.{format}")
 
-    first_file = True
-    for file_path in csv_files:
-        print("Extracting data from CSV file...")
-        df = pd.read_csv(file_path, low_memory=False)
 
-        # retire tous les code de département unique et valable
-        masque = ~df['codeInseeDepartement'].str.contains(" ", na=False)
-        df = df[masque]
+def _lire_table(path: Path) -> pd.DataFrame:
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_csv(path, low_memory=False)
 
-        df_filtered = df.filter(items=header)
 
-        print("Writing to CSV file...")
-        if first_file:
-            df_filtered.to_csv(out, mode='w', index=False, header=True)
-            first_file = False
+# lit une table par tranches de chunksize lignes (csv par blocs, parquet par lots de lignes)
+def _lire_par_tranches(path: Path, chunksize: int):
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        for lot in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield lot.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+def _preparer_parquet(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    for colonne in df.columns:
+        if df[colonne].dtype == object:
+            # une colone parquet n'a qu'un type : valeurs mixtes (nombres et textes) converties en texte
+            df[colonne] = df[colonne].where(df[colonne].isna(), df[colonne].astype(str))
+        if colonne in DICTIONARY_COLUMNS:
+            df[colonne] = df[colonne].astype("category")
+    return df
+
+
+# écrit une table tranche par tranche : csv par ajouts, parquet avec un groupe de lignes par tranche
+# (le schéma est fixé par la première tranche : dictionnaires de textes à index 32 bits, colones vides en texte,
+# pour que toutes les tranches aient le même schéma quels que soient les types déduits de chacune)
+class _EcrivainTable:
+    def __init__(self, path: Path):
+        self.path = path
+        self.lignes = 0
+        self._premiere = True
+        self._parquet = None
+
+    def ecrire(self, df: pd.DataFrame):
+        if self.path.suffix == ".parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            df = df.copy()
+            for colonne in DICTIONARY_COLUMNS:
+                if colonne in df.columns:
+                    valeurs = df[colonne].astype("object")
+                    df[colonne] = valeurs.where(valeurs.isna(), valeurs.astype(str))
+            table = pa.Table.from_pandas(_preparer_parquet(df), preserve_index=False)
+            if self._parquet is None:
+                champs = []
+                for champ in table.schema:
+                    if pa.types.is_dictionary(champ.type):
+                        champ = champ.with_type(pa.dictionary(pa.int32(), champ.type.value_type))
+                    elif pa.types.is_null(champ.type):
+                        champ = champ.with_type(pa.string())
+                    champs.append(champ)
+                self._parquet = pq.ParquetWriter(self.path, pa.schema(champs, metadata=table.schema.metadata))
+            self._parquet.write_table(table.cast(self._parquet.schema))
         else:
-            df_filtered.to_csv(out, mode='a', index=False, header=False)
+            df.to_csv(self.path, mode='w' if self._premiere else 'a', index=False, header=self._premiere)
+        self._premiere = False
+        self.lignes += len(df)
+
+    def fermer(self):
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+
+# écrit une table en csv (par tranches si chunksize est donné) ou en parquet
+def _ecrire_table(df: pd.DataFrame, path: Path, chunksize: int = None):
+    if path.suffix == ".parquet":
+        _preparer_parquet(df).to_parquet(path, index=False)
+    elif chunksize is None:
+        df.to_csv(path, index=False)
+    else:
+        for debut in range(0, max(len(df), 1), chunksize):
+            df.iloc[debut:debut + chunksize].to_csv(path, mode='w' if debut == 0 else 'a', index=False,
+                                                    header=debut == 0)
+
+
+# copie csv d'une table parquet, lue et écrite par tranches
+def _exporter_csv(path: Path, out: Path, chunksize: int = CHUNK_SIZE):
+    with _EcrivainTable(out) as ecrivain:
+        for tranche in _lire_par_tranches(path, chunksize):
+            ecrivain.ecrire(tranche)
+
+
+# aggrège tous les csv du dossier BFC
+# un fichier à la fois : ajouté au csv, ou écrit comme un groupe de lignes du fichier parquet
+def agg_all_csvs(out: Path, base_dir: str = INPN_DIR):
+    csv_files = _fichiers_inpn(base_dir)
+
+    # récupère juste les colones d'intérêts
+    header = INPN_COLUMNS
+
+    with _EcrivainTable(out) as ecrivain:
+        for file_path in csv_files:
+            print("Extracting data from CSV file...")
+            df = pd.read_csv(file_path, low_memory=False)
+
+            # retire tous les code de département unique et valable
+            masque = ~df['codeInseeDepartement'].str.contains(" ", na=False)
+            df = df[masque]
+
+            df_filtered = df.filter(items=header)
+
+            print(f"Writing to {out.suffix[1:].upper()} file...")
+            ecrivain.ecrire(df_filtered)
 
 
 # Compte les observations de chaque espèce dans chaque commune pour en faire une ligne unique qui contient
 # une nouvelle colone avec le nombre d'observations dans cette commune
-def merge_espece(out: Path):
-    csv = r"..\data\all_data.csv"
-    print("Reading CSV file...")
-    df = pd.read_csv(csv, low_memory=False)
+# sort_keys : sortie triée par (commune, espèce) au lieu de l'ordre de première apparition
+# categorical_keys : clés converties en catégories (regroupement sur des codes entiers, moins de mémoire)
+def merge_espece(out: Path, format: str = "csv", sort_keys: bool = False, categorical_keys: bool = False):
+    print("Reading all_data...")
+    df = _lire_table(_chemin_data("all_data", format))
     print("Done")
     # retire toutes les communes vide et nom scientifiques vide
-    df = df.dropna(subset=["commune", "nomScientifiqueRef"], how="any")
+    df = df.dropna(subset=CLES_ESPECE_COMMUNE, how="any")
     # retire les regnes qui n'ont pas d'intérêt pour notre site
-    df = df[~df['regne'].isin(["Bacteria", "Chromista", "Protozoa"])]
-    # compte le nombre d'observation d'une espèce dans une commune
-    df_grouped = df.groupby(["commune", "nomScientifiqueRef"], as_index=False).size().rename(
-        columns={'size': 'nombreObservations'})
-    df_final = pd.merge(df, df_grouped, on=["commune", "nomScientifiqueRef"], how="left")
-    # supprime les duplicata
-    df_final = df_final.drop_duplicates(subset=["commune", "nomScientifiqueRef"])
-    print("Writing CSV file...")
-    df_final.to_csv(out, index=False)
+    df = df[~df['regne'].isin(REGNES_EXCLUS)]
+    if categorical_keys:
+        for cle in CLES_ESPECE_COMMUNE:
+            df[cle] = df[cle].astype("category")
+    # une ligne par espèce et par commune (la première rencontrée) avec son nombre d'observations,
+    # en un seul regroupement : ni fusion sur la table complète ni suppression des duplicata
+    premieres, comptes = _agreger_bloc(df)
+    df_final = premieres.join(comptes.rename("nombreObservations"), on=CLES_ESPECE_COMMUNE)
+    if sort_keys:
+        df_final = df_final.sort_values(CLES_ESPECE_COMMUNE, kind="stable")
+    print("Writing merge_espece...")
+    _ecrire_table(df_final, out)
     print("Done")
 
 
-# ajout du code statut depuis le second csv
-def add_code_statut(out: Path):
-    main_csv = r"..\data\merge_espece.csv"
-    code_csv = r"..\data\bdc_statuts_18.csv"
-    main_df = pd.read_csv(main_csv, low_memory=False)
-    codes_df = pd.read_csv(code_csv, low_memory=False)
+# liste des csv INPN, triée pour que la sortie ne dépende pas de l'ordre du système de fichiers
+def _fichiers_inpn(base_dir: str):
+    return sorted(glob.glob(os.path.join(base_dir, "*.csv")))
 
-    print("Adding code statut...")
+
+# *** MODE FLUX : mémoire bornée ***
+# Les extractions sont lues par blocs. Les (commune, espèce) de chaque bloc sont agrégées puis réparties sur
+# disque en `partitions` parts selon la commune : toutes les observations d'une même (commune, espèce) sont
+# dans la même part. Chaque part est ensuite agrégée seule et écrite triée, et les parts triées sont fusionnées
+# tranche par tranche dans la sortie. La mémoire utilisée dépend de chunksize et de la taille d'une part,
+# pas de la taille de l'extraction.
+
+# lit un csv INPN par blocs, seulement les colones d'intérêts et avec des types explicites
+def _lire_par_blocs(file_path, chunksize: int):
+    return pd.read_csv(file_path, usecols=lambda colonne: colonne in INPN_COLUMNS, dtype=INPN_DTYPES,
+                       chunksize=chunksize)
+
+
+# mêmes filtres que agg_all_csvs puis merge_espece, appliqués à un bloc
+def _filtrer_bloc(df: pd.DataFrame) -> pd.DataFrame:
+    masque = ~df['codeInseeDepartement'].astype("object").str.contains(" ", na=False)
+    df = df[masque]
+    df = df.dropna(subset=CLES_ESPECE_COMMUNE, how="any")
+    df = df[~df['regne'].isin(REGNES_EXCLUS)]
+    return df[[colonne for colonne in INPN_COLUMNS if colonne in df.columns]]
+
+
+# première ligne de chaque (commune, espèce), dans l'ordre d'apparition, et nombre d'observations
+# (un seul regroupement pour les deux)
+def _agreger_bloc(df: pd.DataFrame):
+    groupes = df.groupby(CLES_ESPECE_COMMUNE, sort=False, observed=True)
+    return groupes.head(1), groupes.size()
+
+
+# numéro de part (0 à partitions - 1) de chaque valeur, identique d'un processus et d'une exécution à l'autre
+def _partition(valeurs: pd.Series, partitions: int):
+    return pd.util.hash_pandas_object(valeurs.astype("object"), index=False).to_numpy() % partitions
+
+
+# fusionne des lignes déjà agrégées, rangées par "_ordre" croissant (position de la première observation) :
+# la première ligne de chaque (commune, espèce) est gardée et les observations sont additionnées
+def _fusionner(df: pd.DataFrame) -> pd.DataFrame:
+    groupes = df.groupby(CLES_ESPECE_COMMUNE, sort=False, observed=True)
+    comptes = groupes["nombreObservations"].sum()
+    return groupes.head(1).drop(columns="nombreObservations").join(comptes, on=CLES_ESPECE_COMMUNE)
+
+
+# agrège un fichier INPN bloc par bloc et répartit le résultat dans dossier/part-XXX.pkl
+# ("_ordre" : numéro de ligne dans le fichier) ; un dossier déjà complet est réutilisé
+# (exécuté par un processus du pool en mode parallèle)
+def _partitionner_fichier(file_path, chunksize: int, partitions: int, dossier: Path) -> Path:
+    termine = dossier / "termine"
+    if termine.is_file():
+        print(f"Résultat partiel réutilisé pour {file_path}")
+        return dossier
+
+    print(f"Streaming {file_path}...")
+    dossier.mkdir(parents=True, exist_ok=True)
+    for numero_bloc, bloc in enumerate(_lire_par_blocs(file_path, chunksize)):
+        df = _filtrer_bloc(bloc)
+        # l'index d'un bloc lu par read_csv continue celui du bloc précédent : c'est le numéro de ligne
+        df = _fusionner(df.assign(_ordre=df.index.to_numpy(), nombreObservations=1))
+        for part, morceau in df.groupby(_partition(df["commune"], partitions), sort=False):
+            morceau.to_pickle(dossier / f"part-{part:03d}-{numero_bloc:06d}.pkl")
+
+    # une seule table par part pour ce fichier
+    for part in range(partitions):
+        morceaux = sorted(dossier.glob(f"part-{part:03d}-*.pkl"))
+        if morceaux:
+            _fusionner(pd.concat([pd.read_pickle(m) for m in morceaux], ignore_index=True)) \
+                .to_pickle(dossier / f"part-{part:03d}.pkl")
+            for morceau in morceaux:
+                morceau.unlink()
+    termine.touch()
+    return dossier
+
+
+# agrège une part de tous les fichiers (dans l'ordre des fichiers) et l'écrit triée selon `cles`,
+# en tranches de chunksize lignes ; retourne les chemins des tranches
+def _agreger_partition(dossiers, part: int, chunksize: int, cles, temp_dir: Path):
+    morceaux = []
+    for numero, dossier in enumerate(dossiers):
+        path = dossier / f"part-{part:03d}.pkl"
+        if path.is_file():
+            morceau = pd.read_pickle(path)
+            # position globale : numéro du fichier, puis numéro de ligne dans le fichier
+            morceau["_ordre"] += numero << 40
+            morceaux.append(morceau)
+    if not morceaux:
+        return []
+
+    df = _fusionner(pd.concat(morceaux, ignore_index=True)).sort_values(cles, kind="stable")
+    tranches = []
+    for debut in range(0, len(df), chunksize):
+        path = temp_dir / f"tri-{part:03d}-{debut // chunksize:06d}.pkl"
+        df.iloc[debut:debut + chunksize].to_pickle(path)
+        tranches.append(path)
+    return tranches
+
+
+def _lire_tranches(paths):
+    for path in paths:
+        yield pd.read_pickle(path)
+
+
+# lignes dont les clés `cles` sont inférieures ou égales à `borne` (ordre lexicographique)
+def _jusqua(df: pd.DataFrame, cles, borne) -> pd.Series:
+    masque = df[cles[-1]] <= borne[-1]
+    for cle, valeur in zip(reversed(cles[:-1]), reversed(borne[:-1])):
+        masque = (df[cle] < valeur) | ((df[cle] == valeur) & masque)
+    return masque
+
+
+# fusion de séquences de tranches déjà triées selon `cles` (clés distinctes d'une séquence à l'autre) :
+# à chaque tour, tout ce qui précède la plus petite dernière clé des tranches en cours peut être écrit,
+# seule une tranche par séquence est en mémoire
+def _fusion_triee(sequences, cles):
+    en_cours = {}
+    for numero, sequence in enumerate(sequences):
+        tranche = next(sequence, None)
+        if tranche is not None:
+            en_cours[numero] = tranche
+
+    while en_cours:
+        borne = min(tuple(tranche[cles].iloc[-1]) for tranche in en_cours.values())
+        morceaux = []
+        for numero in list(en_cours):
+            tranche = en_cours[numero]
+            masque = _jusqua(tranche, cles, borne)
+            morceaux.append(tranche[masque])
+            if masque.all():
+                suivante = next(sequences[numero], None)
+                if suivante is None:
+                    del en_cours[numero]
+                else:
+                    en_cours[numero] = suivante
+            else:
+                en_cours[numero] = tranche[~masque]
+        yield pd.concat(morceaux).sort_values(cles, kind="stable")
+
+
+# exécute fonction(*arguments) dans le pool pour chaque élément de `taches`, avec au plus `fenetre` tâches
+# soumises à la fois (les résultats en attente restent peu nombreux) ; résultats dans l'ordre des tâches
+def _executer_par_fenetre(executor, fonction, taches, fenetre: int):
+    en_cours = deque()
+    for arguments in taches:
+        if len(en_cours) >= fenetre:
+            yield en_cours.popleft().result()
+        en_cours.append(executor.submit(fonction, *arguments))
+    while en_cours:
+        yield en_cours.popleft().result()
+
+
+# équivalent de agg_all_csvs puis merge_espece sans charger les extractions ni all_data.csv en entier,
+# en mémoire bornée (voir plus haut)
+# workers > 1 : les fichiers, puis les parts, sont traités en parallèle (au plus 2 x workers tâches soumises) ;
+# la sortie est identique au mode séquentiel
+# empreintes {fichier: sha256} : les résultats répartis par fichier sont gardés dans partiels_dir et seuls
+# les fichiers nouveaux ou modifiés sont relus
+def merge_espece_streaming(out: Path, chunksize: int = CHUNK_SIZE, base_dir: str = INPN_DIR, workers: int = 1,
+                           partiels_dir: Path = None, empreintes: dict = None, sort_keys: bool = False,
+                           partitions: int = PARTITIONS):
+    csv_files = _fichiers_inpn(base_dir)
+    if not csv_files:
+        print("Aucun fichier CSV trouvé")
+        return
+
+    with tempfile.TemporaryDirectory(dir=out.parent, prefix="merge_espece-") as temp:
+        temp_dir = Path(temp)
+        if partiels_dir is not None and empreintes:
+            partiels_dir.mkdir(parents=True, exist_ok=True)
+            dossiers = [partiels_dir / f"{empreintes[file_path]}-v{PIPELINE_VERSION}-p{partitions}"
+                        for file_path in csv_files]
+            # résultats partiels de fichiers supprimés ou modifiés
+            for ancien in set(partiels_dir.iterdir()) - set(dossiers):
+                if ancien.is_dir():
+                    shutil.rmtree(ancien)
+                else:
+                    ancien.unlink()
+        else:
+            dossiers = [temp_dir / f"fichier-{numero:05d}" for numero in range(len(csv_files))]
+
+        # sortie dans l'ordre de première apparition, ou triée par (commune, espèce)
+        cles = CLES_ESPECE_COMMUNE if sort_keys else ["_ordre"]
+        taches_fichiers = [(file_path, chunksize, partitions, dossier)
+                           for file_path, dossier in zip(csv_files, dossiers)]
+        taches_parts = [(dossiers, part, chunksize, cles, temp_dir) for part in range(partitions)]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                list(_executer_par_fenetre(executor, _partitionner_fichier, taches_fichiers, 2 * workers))
+                parts = list(_executer_par_fenetre(executor, _agreger_partition, taches_parts, 2 * workers))
+        else:
+            for tache in taches_fichiers:
+                _partitionner_fichier(*tache)
+            parts = [_agreger_partition(*tache) for tache in taches_parts]
+
+        print("Writing merge_espece...")
+        with _EcrivainTable(out) as ecrivain:
+            for tranche in _fusion_triee([_lire_tranches(tranches) for tranches in parts if tranches], cles):
+                ecrivain.ecrire(tranche.drop(columns="_ordre"))
+    print("Done")
+
+
+# normalise un texte pour les champs "ombre" (minuscules, sans accents, espaces réduits)
+# doit rester identique à normalize_text dans guide_naturel/API_request/recherche.py
+def normalize_text(value):
+    if value is None or pd.isna(value):
+        return None
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split())
+
+
+# champs texte recherchés par le chatbot, dupliqués en version normalisée (<champ>_norm) pour être indexables
+NORMALIZED_COLUMNS = ["regne", "groupeTaxoSimple", "commune", "nomVernaculaire"]
+
+
+def add_normalized_columns(df: pd.DataFrame) -> pd.DataFrame:
+    for column in NORMALIZED_COLUMNS:
+        # normalisation faite une seule fois par valeur distincte
+        valeurs = df[column].dropna().unique()
+        correspondance = {valeur: normalize_text(valeur) for valeur in valeurs}
+        df[f"{column}_norm"] = df[column].map(correspondance)
+    return df
+
+
+# table cdNom -> codeStatut depuis le second csv
+def _codes_statut(code_csv) -> pd.DataFrame:
+    codes_df = pd.read_csv(code_csv, usecols=['CD_NOM', 'CODE_STATUT'], low_memory=False)
     # supprime les codes statuts vide
     codes_df.dropna(subset=['CODE_STATUT'], inplace=True)
     codes_df = codes_df[codes_df['CODE_STATUT'] != 'true']
     codes_df_unique = codes_df.drop_duplicates(subset='CD_NOM', keep='first')
     codes_df_unique = codes_df_unique[['CD_NOM', 'CODE_STATUT']]
     codes_df_unique.rename(columns={'CD_NOM': 'cdNom', 'CODE_STATUT': 'codeStatut'}, inplace=True)
+    return codes_df_unique
 
+
+def _ajouter_code_statut(main_df: pd.DataFrame, codes_df_unique: pd.DataFrame) -> pd.DataFrame:
     merged_df = pd.merge(main_df, codes_df_unique, on='cdNom', how='left')
 
     # si jamais les code statuts ne sont plus dans la liste
@@ -78,19 +450,265 @@ def add_code_statut(out: Path):
 
     merged_df = merged_df.drop('cdNom', axis=1)
 
-    print("Writing CSV file...")
-    merged_df.to_csv(out, index=False)
+    # ajout des champs "ombre" normalisés
+    return add_normalized_columns(merged_df)
+
+
+# ajout du code statut depuis le second csv
+# chunksize : lecture et écriture par blocs (mode flux) au lieu de charger merge_espece en entier
+# (en parquet, par lots de lignes)
+def add_code_statut(out: Path, chunksize: int = None, format: str = "csv", code_csv=BDC_STATUTS_CSV):
+    main_path = _chemin_data("merge_espece", format)
+    codes_df_unique = _codes_statut(code_csv)
+
+    print("Adding code statut...")
+    if chunksize is None:
+        main_df = _lire_table(main_path)
+        merged_df = _ajouter_code_statut(main_df, codes_df_unique)
+        print("Writing Final_data...")
+        _ecrire_table(merged_df, out)
+    else:
+        with _EcrivainTable(out) as ecrivain:
+            for bloc in _lire_par_tranches(main_path, chunksize):
+                ecrivain.ecrire(_ajouter_code_statut(bloc, codes_df_unique))
     print("Done")
 
 
+def _valeur(value):
+    """
+    Convertit une valeur pandas en valeur JSON (NaN -> None, types numpy -> types Python).
+    """
+    if pd.isna(value):
+        return None
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+# document "species_summary" d'une espèce à partir de ses lignes de Final_data (dans l'ordre du fichier)
+def _document_espece(nom, groupe: pd.DataFrame) -> dict:
+    # première ligne de l'espèce, comme le $first de l'agrégation MongoDB
+    premier = groupe.iloc[0]
+    nom_vernaculaire = _valeur(premier["nomVernaculaire"])
+
+    # détail par département : observations et communes
+    details = []
+    for dep, groupe_dep in groupe.groupby("codeInseeDepartement", sort=True, observed=True):
+        details.append({
+            "departement": int(dep),
+            "nombreObservations": int(groupe_dep["nombreObservations"].sum()),
+            "communes": sorted(groupe_dep["commune"].dropna().unique().tolist())
+        })
+
+    return {
+        "nomScientifiqueRef": nom,
+        "nomVernaculaire": nom_vernaculaire,
+        "nomVernaculaire_norm": normalize_text(nom_vernaculaire),
+        "regne": _valeur(premier["regne"]),
+        "regne_norm": normalize_text(premier["regne"]),
+        "groupeTaxoSimple": _valeur(premier["groupeTaxoSimple"]),
+        "groupeTaxoSimple_norm": normalize_text(premier["groupeTaxoSimple"]),
+        "codeStatut": sorted(groupe["codeStatut"].dropna().unique().tolist()),
+        "totalObservationsEspece": int(groupe["nombreObservations"].sum()),
+        "codeInseeDepartement": [detail["departement"] for detail in details],
+        "departementsDetails": details,
+        "sort_priority_nomVernaculaire": 1 if nom_vernaculaire is None else 0
+    }
+
+
+# construit la collection matérialisée "species_summary" : un document par espèce
+# (fichier JSON lines importable avec mongoimport)
+# chunksize : mode flux, Final_data est lu par tranches et réparti en parts selon l'espèce (mémoire bornée)
+def species_summary(out: Path, format: str = "csv", chunksize: int = None, partitions: int = PARTITIONS):
+    final_path = _chemin_data("Final_data", format)
+    if chunksize is not None:
+        _species_summary_flux(out, final_path, chunksize, partitions)
+        return
+
+    print("Reading Final_data...")
+    df = _lire_table(final_path)
+    print("Building species summary...")
+
+    with open(out, "w", encoding="utf-8") as f:
+        for nom, groupe in df.groupby("nomScientifiqueRef", sort=False):
+            f.write(json.dumps(_document_espece(nom, groupe), ensure_ascii=False) + "\n")
+    print("Done")
+
+
+# species_summary en mode flux : mêmes documents, dans le même ordre (première apparition de l'espèce)
+def _species_summary_flux(out: Path, final_path: Path, chunksize: int, partitions: int):
+    with tempfile.TemporaryDirectory(dir=out.parent, prefix="species_summary-") as temp:
+        temp_dir = Path(temp)
+        print("Splitting Final_data by species...")
+        debut = 0
+        for numero, tranche in enumerate(_lire_par_tranches(final_path, chunksize)):
+            tranche = tranche.assign(_ordre=range(debut, debut + len(tranche)))
+            debut += len(tranche)
+            for part, morceau in tranche.groupby(_partition(tranche["nomScientifiqueRef"], partitions), sort=False):
+                morceau.to_pickle(temp_dir / f"part-{part:03d}-{numero:06d}.pkl")
+
+        print("Building species summary...")
+        parts = []
+        for part in range(partitions):
+            morceaux = sorted(temp_dir.glob(f"part-{part:03d}-*.pkl"))
+            if not morceaux:
+                continue
+            df = pd.concat([pd.read_pickle(m) for m in morceaux], ignore_index=True)
+            for morceau in morceaux:
+                morceau.unlink()
+            # espèces de la part dans l'ordre de leur première ligne
+            documents = pd.DataFrame(
+                [(groupe["_ordre"].iloc[0], json.dumps(_document_espece(nom, groupe), ensure_ascii=False))
+                 for nom, groupe in df.groupby("nomScientifiqueRef", sort=False)],
+                columns=["_ordre", "document"])
+            tranches = []
+            for debut in range(0, len(documents), chunksize):
+                path = temp_dir / f"tri-{part:03d}-{debut // chunksize:06d}.pkl"
+                documents.iloc[debut:debut + chunksize].to_pickle(path)
+                tranches.append(path)
+            parts.append(tranches)
+
+        with open(out, "w", encoding="utf-8") as f:
+            for tranche in _fusion_triee([_lire_tranches(tranches) for tranches in parts], ["_ordre"]):
+                f.writelines(document + "\n" for document in tranche["document"])
+    print("Done")
+
+
+# *** SUIVI INCRÉMENTAL DES ÉTAPES ***
+def _lire_manifeste() -> dict:
+    if MANIFEST_PATH.is_file():
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    return {"fichiers": {}, "etapes": {}}
+
+
+def _ecrire_manifeste(manifeste: dict):
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifeste, f, ensure_ascii=False, indent=2)
+
+
+# sha256 du contenu d'un fichier ; recalculé seulement si sa taille ou sa date de modification a changé
+def _empreinte_fichier(path, manifeste: dict) -> str:
+    path = Path(path)
+    stat = path.stat()
+    connu = manifeste["fichiers"].get(str(path))
+    if connu and connu["taille"] == stat.st_size and connu["modifie"] == stat.st_mtime_ns:
+        return connu["sha256"]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloc in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloc)
+    manifeste["fichiers"][str(path)] = {"taille": stat.st_size, "modifie": stat.st_mtime_ns, "sha256": h.hexdigest()}
+    return h.hexdigest()
+
+
+def _signature(manifeste: dict, entrees, parametres: dict) -> str:
+    contenu = {"entrees": {str(p): _empreinte_fichier(p, manifeste) for p in entrees},
+               "parametres": parametres, "pipeline": PIPELINE_VERSION}
+    return hashlib.sha256(json.dumps(contenu, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+# exécute une étape seulement si sa sortie manque ou si ses entrées ou paramètres ont changé
+def _etape(manifeste: dict, nom: str, sortie: Path, entrees, parametres: dict, calcul, force: bool = False) -> bool:
+    signature = _signature(manifeste, entrees, parametres)
+    etat = manifeste["etapes"].get(nom)
+    if not force and sortie.is_file() and etat and etat["signature"] == signature:
+        print(f"Étape '{nom}' à jour")
+        return False
+
+    print(f"Étape '{nom}'...")
+    calcul()
+    manifeste["etapes"][nom] = {"signature": signature, "sortie": str(sortie),
+                                "date": datetime.now(timezone.utc).isoformat()}
+    _ecrire_manifeste(manifeste)
+    return True
+
+
+# version du jeu de données : empreinte des fichiers importés dans MongoDB
+def _ecrire_version(manifeste: dict, sorties) -> str:
+    version = _signature(manifeste, sorties, {})[:16]
+    if VERSION_PATH.is_file():
+        with open(VERSION_PATH, encoding="utf-8") as f:
+            if json.load(f).get("version") == version:
+                return version
+    with open(VERSION_PATH, "w", encoding="utf-8") as f:
+        json.dump({"collection": "Nature", "version": version,
+                   "date": datetime.now(timezone.utc).isoformat()}, f, indent=2)
+    _ecrire_manifeste(manifeste)
+    return version
+
+
 if __name__ == '__main__':
-    allDataPath: Path = Path(r"..\data\all_data.csv")
-    if not allDataPath.is_file():
-        agg_all_csvs(allDataPath)
-    mergeEspecePath: Path = Path(r"..\data\merge_espece.csv")
-    if not mergeEspecePath.is_file():
-        merge_espece(mergeEspecePath)
-    FinalPath: Path = Path(r"..\data\Final_data.csv")
-    if not FinalPath.is_file():
-        add_code_statut(FinalPath)
+    parser = argparse.ArgumentParser(description="Prétraitement des extractions INPN")
+    parser.add_argument("--streaming", action="store_true",
+                        help="lecture par blocs en mémoire bornée (all_data.csv n'est pas écrit)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE, help="lignes lues par bloc en mode flux")
+    parser.add_argument("--partitions", type=int, default=PARTITIONS,
+                        help="parts agrégées séparément en mode flux (plus de parts : moins de mémoire)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processus traitant les fichiers en parallèle, seulement en mode flux (0 : un par coeur)")
+    parser.add_argument("--format", choices=FORMATS, default="csv",
+                        help="format des fichiers intermédiaires (parquet : nécessite pyarrow)")
+    parser.add_argument("--export-csv", action="store_true",
+                        help="en parquet, exporte aussi Final_data.csv (import MongoDB)")
+    parser.add_argument("--sort-keys", action="store_true",
+                        help="merge_espece trié par (commune, espèce) au lieu de l'ordre de lecture")
+    parser.add_argument("--categorical-keys", action="store_true",
+                        help="regroupement sur des clés catégorielles (moins de mémoire, même résultat)")
+    parser.add_argument("--force", action="store_true",
+                        help="recalcule toutes les étapes, même si leurs entrées n'ont pas changé")
+    parser.add_argument("--inpn-dir", default=INPN_DIR,
+                        help="dossier des extractions INPN (extraction synthétique de generateurINPN.py par exemple)")
+    parser.add_argument("--bdc-statuts", default=BDC_STATUTS_CSV, help="csv des statuts de conservation")
+    args = parser.parse_args()
+    if args.workers != 1 and not args.streaming:
+        parser.error("--workers ne s'applique qu'au mode flux (--streaming)")
+    if args.format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        parser.error("le format parquet nécessite le module pyarrow (pip install pyarrow)")
+
+    manifeste = _lire_manifeste()
+    fichiers_inpn = _fichiers_inpn(args.inpn_dir)
+    # paramètres qui influencent le contenu des sorties (chunksize et workers n'en font pas partie)
+    parametres = {"colonnes": INPN_COLUMNS, "regnes_exclus": REGNES_EXCLUS, "format": args.format,
+                  "tri": args.sort_keys}
+
+    mergeEspecePath: Path = _chemin_data("merge_espece", args.format)
+    if args.streaming:
+        empreintes = {file_path: _empreinte_fichier(file_path, manifeste) for file_path in fichiers_inpn}
+        _etape(manifeste, "merge_espece", mergeEspecePath, fichiers_inpn, dict(parametres, mode="flux"),
+               lambda: merge_espece_streaming(mergeEspecePath, chunksize=args.chunksize, base_dir=args.inpn_dir,
+                                              workers=args.workers or os.cpu_count(),
+                                              partiels_dir=PARTIELS_DIR, empreintes=empreintes,
+                                              sort_keys=args.sort_keys, partitions=args.partitions),
+               force=args.force)
+    else:
+        allDataPath: Path = _chemin_data("all_data", args.format)
+        _etape(manifeste, "all_data", allDataPath, fichiers_inpn, parametres,
+               lambda: agg_all_csvs(allDataPath, base_dir=args.inpn_dir), force=args.force)
+        _etape(manifeste, "merge_espece", mergeEspecePath, [allDataPath], parametres,
+               lambda: merge_espece(mergeEspecePath, format=args.format, sort_keys=args.sort_keys,
+                                    categorical_keys=args.categorical_keys),
+               force=args.force)
+
+    FinalPath: Path = _chemin_data("Final_data", args.format)
+    _etape(manifeste, "Final_data", FinalPath, [mergeEspecePath, args.bdc_statuts], parametres,
+           lambda: add_code_statut(FinalPath, chunksize=args.chunksize if args.streaming else None,
+                                   format=args.format, code_csv=args.bdc_statuts),
+           force=args.force)
+
+    FinalCsvPath: Path = _chemin_data("Final_data", "csv")
+    if args.export_csv and args.format != "csv":
+        _etape(manifeste, "export_csv", FinalCsvPath, [FinalPath], {},
+               lambda: _exporter_csv(FinalPath, FinalCsvPath, chunksize=args.chunksize),
+               force=args.force)
+
+    SummaryPath: Path = Path(r"..\data\species_summary.json")
+    _etape(manifeste, "species_summary", SummaryPath, [FinalPath], {},
+           lambda: species_summary(SummaryPath, format=args.format,
+                                   chunksize=args.chunksize if args.streaming else None,
+                                   partitions=args.partitions),
+           force=args.force)
+
+    print(f"Version du jeu de données : {_ecrire_version(manifeste, [FinalPath, SummaryPath])}")
     exit(0)